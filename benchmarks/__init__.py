@@ -0,0 +1,7 @@
+"""
+Benchmarks for the built-in views, run against the local testbed stubs.
+
+    python -m benchmarks.run --sizes 100,1000,10000 --output results.json
+
+See :mod:`benchmarks.run` for the available options.
+"""
@@ -0,0 +1,94 @@
+"""
+Synthetic datasets.
+
+Each generator takes the number of entities to create and returns the keys
+of the entities the benchmarks should operate on.
+"""
+import random
+
+from google.appengine.ext import ndb
+
+from .models import (BenchFlat, BenchNode, BenchAnimal, BenchDog, BenchCat,
+                     BenchCategory, BenchRef)
+
+BATCH_SIZE = 500
+
+
+def _put(entities):
+    keys = []
+    for i in xrange(0, len(entities), BATCH_SIZE):
+        keys.extend(ndb.put_multi(entities[i:i + BATCH_SIZE]))
+    return keys
+
+
+def flat(size, seed=0):
+    rnd = random.Random(seed)
+    return _put([
+        BenchFlat(name='flat-%06d' % i,
+                  number=rnd.randint(0, 1000),
+                  flag=rnd.random() < 0.5)
+        for i in xrange(size)])
+
+
+def nested(size, depth=3, seed=0):
+    """
+    Trees of ``depth`` levels. Returns the keys of the roots.
+    """
+    rnd = random.Random(seed)
+
+    # Roughly size ** (1 / depth) children per node.
+    fanout = max(2, int(round(size ** (1.0 / depth))))
+
+    roots = _put([BenchNode(name='node-0-%d' % i, depth=0)
+                  for i in xrange(fanout)])
+    level = roots
+    created = len(roots)
+
+    for d in xrange(1, depth):
+        children = []
+        for parent in level:
+            for i in xrange(fanout):
+                if created + len(children) >= size:
+                    break
+                children.append(BenchNode(
+                    name='node-%d-%d' % (d, rnd.randint(0, size)),
+                    depth=d, parent=parent))
+        level = _put(children)
+        created += len(level)
+
+    return roots
+
+
+def polymodel(size, seed=0):
+    rnd = random.Random(seed)
+    entities = []
+    for i in xrange(size):
+        cls = rnd.choice((BenchAnimal, BenchDog, BenchCat))
+        entities.append(cls(name='animal-%06d' % i))
+    return _put(entities)
+
+
+def keyref(size, categories=20, related=5, seed=0):
+    """
+    :py:class:`BenchRef` entities, each referencing a category, an owner and
+    ``related`` other entities.
+    """
+    rnd = random.Random(seed)
+    cats = _put([BenchCategory(name='category-%d' % i)
+                 for i in xrange(categories)])
+    owners = flat(max(size // 10, related), seed)
+
+    return _put([
+        BenchRef(name='ref-%06d' % i,
+                 category=rnd.choice(cats),
+                 owner=rnd.choice(owners),
+                 related=rnd.sample(owners, related))
+        for i in xrange(size)])
+
+
+DATASETS = {
+    'flat': flat,
+    'nested': nested,
+    'polymodel': polymodel,
+    'keyref': keyref,
+}
@@ -0,0 +1,59 @@
+from google.appengine.ext import ndb
+from google.appengine.ext.ndb import polymodel
+
+
+class BenchFlat(ndb.Model):
+    name = ndb.StringProperty(required=True)
+    number = ndb.IntegerProperty()
+    flag = ndb.BooleanProperty(default=False)
+    created = ndb.DateTimeProperty(auto_now_add=True)
+
+    def __unicode__(self):
+        return self.name
+
+
+class BenchNode(ndb.Model):
+    """
+    Nested with ancestors, e.g. ``BenchNode > BenchNode > BenchNode``.
+    """
+    name = ndb.StringProperty(required=True)
+    depth = ndb.IntegerProperty()
+
+    def __unicode__(self):
+        return self.name
+
+
+class BenchAnimal(polymodel.PolyModel):
+    name = ndb.StringProperty(required=True)
+    legs = ndb.IntegerProperty(default=4)
+
+    def __unicode__(self):
+        return self.name
+
+
+class BenchDog(BenchAnimal):
+    breed = ndb.StringProperty()
+
+
+class BenchCat(BenchAnimal):
+    lives = ndb.IntegerProperty(default=9)
+
+
+class BenchCategory(ndb.Model):
+    name = ndb.StringProperty(required=True)
+
+    def __unicode__(self):
+        return self.name
+
+
+class BenchRef(ndb.Model):
+    """
+    References a lot of other entities.
+    """
+    name = ndb.StringProperty(required=True)
+    category = ndb.KeyProperty(kind=BenchCategory)
+    owner = ndb.KeyProperty(kind=BenchFlat)
+    related = ndb.KeyProperty(kind=BenchFlat, repeated=True)
+
+    def __unicode__(self):
+        return self.name
@@ -0,0 +1,312 @@
+"""
+Benchmark runner.
+
+Every scenario runs against a freshly populated testbed datastore and
+records:
+
+* ``latency``: min, median and max wall time in milliseconds.
+* ``rpcs``, ``reads`` and ``writes``: datastore calls and entities touched
+  by a single run, as counted by :mod:`flask_kibble.profiler`.
+* ``max_rss_kb``: the process' peak resident set size after the scenario.
+  Python 2 has no allocation tracing, so this only ever grows; compare
+  scenarios of the same size across runs rather than against each other.
+
+Results are written as JSON so runs can be compared over time::
+
+    python -m benchmarks.run --sizes 100,1000 --output before.json
+    python -m benchmarks.run --sizes 100,1000 --output after.json
+"""
+import sys
+import gc
+import json
+import time
+import resource
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+
+import flask
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb, testbed
+
+import flask_kibble as kibble
+from flask_kibble import profiler
+from flask_kibble.util.url_converter import NDBKeyConverter
+
+from . import datasets, views
+
+
+DEFAULT_SIZES = (100, 1000, 10000)
+DEFAULT_PAGE_SIZES = (20, 100)
+
+
+class Authenticator(kibble.Authenticator):
+    def is_logged_in(self):
+        return True
+
+
+def create_app():
+    app = flask.Flask(__name__)
+    app.config['SECRET_KEY'] = 'benchmark'
+    app.config['CSRF_ENABLED'] = False
+
+    admin = kibble.Kibble('kibble', __name__, Authenticator())
+    for view in views.VIEWS:
+        admin.register_view(view)
+    app.register_blueprint(admin)
+    return app
+
+
+class Environment(object):
+    """
+    A testbed with the datastore and memcache stubs.
+    """
+    def __enter__(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub(
+            consistency_policy=datastore_stub_util
+            .PseudoRandomHRConsistencyPolicy(probability=1))
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.testbed.deactivate()
+
+
+def measure(fn, repeat):
+    """
+    Call ``fn`` ``repeat`` times.
+
+    :returns: A result dictionary.
+    """
+    timings = []
+    profile = None
+    for i in xrange(repeat):
+        ndb.get_context().clear_cache()
+        gc.collect()
+
+        current = profiler.start('benchmark')
+        start = time.time()
+        try:
+            fn()
+        finally:
+            timings.append((time.time() - start) * 1000)
+            profiler.stop(current)
+
+        if profile is None:
+            profile = current
+
+    timings.sort()
+    return {
+        'latency': {
+            'min': timings[0],
+            'median': timings[len(timings) // 2],
+            'max': timings[-1],
+        },
+        'rpcs': profile.count(),
+        'reads': profile.reads(),
+        'writes': profile.writes(),
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def _get(client, url, status=200):
+    def _fn():
+        resp = client.get(url)
+        if resp.status_code != status:
+            raise AssertionError("%s returned %s" % (url, resp.status))
+    return _fn
+
+
+def _post(client, url, data=None, status=302):
+    def _fn():
+        resp = client.post(url, data=data or {})
+        if resp.status_code != status:
+            raise AssertionError("%s returned %s" % (url, resp.status))
+    return _fn
+
+
+def _url(app, view, **kwargs):
+    with app.test_request_context():
+        return view.url_for(blueprint='kibble', **kwargs)
+
+
+def bench_list(app, size, page_sizes, repeat):
+    client = app.test_client()
+    datasets.flat(size)
+    base = _url(app, views.FlatList)
+
+    for page_size in page_sizes:
+        for label, args in [
+                ('plain', ''),
+                ('sorted', '&sort=-number'),
+                ('filtered', '&flag=t'),
+                ('last-page', '&page=%d' % max(1, size // page_size))]:
+            url = '%s?page-size=%d%s' % (base, page_size, args)
+            yield ('list', {'dataset': 'flat', 'page_size': page_size,
+                            'query': label},
+                   measure(_get(client, url), repeat))
+
+
+def bench_list_datasets(app, size, page_sizes, repeat):
+    client = app.test_client()
+
+    datasets.polymodel(size)
+    datasets.keyref(size)
+    roots = datasets.nested(size)
+
+    for page_size in page_sizes:
+        for dataset, url in [
+                ('polymodel', _url(app, views.AnimalList)),
+                ('keyref', _url(app, views.RefList)),
+                ('nested', _url(app, views.NodeList,
+                                ancestor_key=roots[0]))]:
+            url = '%s?page-size=%d' % (url, page_size)
+            yield ('list', {'dataset': dataset, 'page_size': page_size},
+                   measure(_get(client, url), repeat))
+
+
+def bench_edit(app, size, repeat):
+    client = app.test_client()
+    keys = datasets.flat(size)
+    url = _url(app, views.FlatEdit, key=keys[len(keys) // 2])
+
+    yield ('edit', {'dataset': 'flat', 'method': 'GET'},
+           measure(_get(client, url), repeat))
+    yield ('edit', {'dataset': 'flat', 'method': 'POST'},
+           measure(_post(client, url, {'name': 'edited', 'number': '1'}),
+                   repeat))
+
+
+def bench_delete(app, size, repeat):
+    client = app.test_client()
+    roots = datasets.nested(size)
+    urls = iter([_url(app, views.NodeDelete, key=k) for k in roots])
+
+    # Each run deletes a different tree.
+    repeat = min(repeat, len(roots))
+    yield ('delete', {'dataset': 'nested', 'recursive': True,
+                      'tree_size': size // len(roots)},
+           measure(lambda: _post(client, next(urls))(), repeat))
+
+
+def bench_url_conversion(app, size, repeat):
+    roots = datasets.nested(size)
+    keys = [k for k in ndb.Query(ancestor=roots[0]).iter(keys_only=True)
+            if len(k.pairs()) == 3]
+    converter = NDBKeyConverter(app.url_map, 'BenchNode', 'BenchNode',
+                                'BenchNode')
+
+    # Only the first run converts cold, later runs hit the codec's cache
+    # for datasets that fit in it.
+
+    def _to_url():
+        for k in keys:
+            converter.to_url(k)
+
+    def _round_trip():
+        for k in keys:
+            converter.to_python(converter.to_url(k))
+
+    with app.test_request_context():
+        yield ('url_conversion', {'direction': 'to_url', 'keys': len(keys)},
+               measure(_to_url, repeat))
+        yield ('url_conversion', {'direction': 'round_trip',
+                                  'keys': len(keys)},
+               measure(_round_trip, repeat))
+
+
+def bench_url_building(app, size, repeat):
+    keys = datasets.flat(size)
+    name = views.FlatEdit.view_name()
+    endpoint = 'kibble.' + name
+    builder = app.blueprints['kibble'].url_builders[name]
+
+    def _url_for():
+        for k in keys:
+            flask.url_for(endpoint, key=k)
+
+    def _build():
+        for k in keys:
+            builder.build(key=k)
+
+    with app.test_request_context():
+        if builder.build(key=keys[0]) != flask.url_for(endpoint, key=keys[0]):
+            raise AssertionError("UrlBuilder doesn't match url_for")
+
+        yield ('url_building', {'builder': 'url_for', 'keys': len(keys)},
+               measure(_url_for, repeat))
+        yield ('url_building', {'builder': 'UrlBuilder', 'keys': len(keys)},
+               measure(_build, repeat))
+
+
+def run(sizes, page_sizes, repeat):
+    results = []
+    for size in sizes:
+        scenarios = [
+            lambda app: bench_list(app, size, page_sizes, repeat),
+            lambda app: bench_list_datasets(app, size, page_sizes, repeat),
+            lambda app: bench_edit(app, size, repeat),
+            lambda app: bench_delete(app, size, repeat),
+            lambda app: bench_url_conversion(app, size, repeat),
+            lambda app: bench_url_building(app, size, repeat),
+        ]
+        for scenario in scenarios:
+            with Environment():
+                for name, params, result in scenario(create_app()):
+                    params['size'] = size
+                    result.update(name=name, params=params)
+                    results.append(result)
+                    sys.stderr.write('%s %s: %.1fms, %d rpcs\n' % (
+                        name, json.dumps(params, sort_keys=True),
+                        result['latency']['median'], result['rpcs']))
+    return results
+
+
+def _revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD']).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+        help="Comma separated dataset sizes. (default: %(default)s)")
+    parser.add_argument(
+        '--page-sizes', default=','.join(map(str, DEFAULT_PAGE_SIZES)),
+        help="Comma separated list page sizes. (default: %(default)s)")
+    parser.add_argument(
+        '--repeat', type=int, default=5,
+        help="Runs per scenario. (default: %(default)s)")
+    parser.add_argument(
+        '--output', default='-',
+        help="File to write the JSON results to. (default: stdout)")
+    args = parser.parse_args(argv)
+
+    report = {
+        'timestamp': datetime.utcnow().isoformat(),
+        'revision': _revision(),
+        'python': platform.python_version(),
+        'repeat': args.repeat,
+        'results': run(
+            [int(s) for s in args.sizes.split(',')],
+            [int(s) for s in args.page_sizes.split(',')],
+            args.repeat),
+    }
+
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+import flask_kibble as kibble
+from flask_kibble import query_filters
+
+from .models import BenchFlat, BenchNode, BenchAnimal, BenchDog, BenchRef
+
+
+class FlatList(kibble.List):
+    model = BenchFlat
+    list_display = (unicode, 'number', 'flag', 'created')
+
+    sort_columns = (
+        kibble.SortColumn('number'),
+        kibble.SortColumn('name'),
+    )
+    filter_filters = (
+        query_filters.BoolFilter('flag'),
+    )
+
+
+class FlatEdit(kibble.Edit):
+    model = BenchFlat
+
+
+class NodeList(kibble.List):
+    model = BenchNode
+    ancestors = [BenchNode]
+    list_display = (unicode, 'depth')
+
+
+class NodeDelete(kibble.Delete):
+    model = BenchNode
+    recursive = True
+
+
+class AnimalList(kibble.List):
+    model = BenchAnimal
+    list_display = (unicode, 'legs')
+    subclass_list_display = {
+        BenchDog: (unicode, 'legs', 'breed'),
+    }
+
+
+class RefList(kibble.List):
+    model = BenchRef
+    list_display = (unicode, 'category', 'owner', 'related')
+
+
+VIEWS = [FlatList, FlatEdit, NodeList, NodeDelete, AnimalList, RefList]
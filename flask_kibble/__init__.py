@@ -4,6 +4,8 @@ from .auth import Authenticator, GAEAuthenticator
 
 from .list import List
 from .edit import Edit, Create
+from .bulk import BulkEdit
+from .importer import Import
 from .operation import Operation
 from .delete import Delete
 
@@ -43,6 +43,16 @@ class Authenticator(object):
         """
         return '/'
 
+    def permission_fingerprint(self):
+        """
+        Should return a string that is the same for all users with the same
+        permissions, and changes whenever the current user's permissions
+        change. Used to cache per-user fragments such as the menu.
+
+        If ``None`` is returned, fragments will not be cached.
+        """
+        return None
+
 
 class GAEAuthenticator(Authenticator):
     """
@@ -68,3 +78,8 @@ class GAEAuthenticator(Authenticator):
     def get_login_url(self):
         return users.create_login_url(flask.url_for('.index'))
 
+    def permission_fingerprint(self):
+        # Permissions are the same for every view, so the answer for any
+        # view will do.
+        return str(self.has_permission_for(None, None))
+
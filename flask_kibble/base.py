@@ -63,6 +63,25 @@ class KibbleView(View):
     #: Does the view require an ancestor key if `ancestors` are present?
     _requires_ancestor = False
 
+    #: Does the view act on the rows selected in a list?
+    _acts_on_selection = False
+
+    #: Does :meth:`dispatch_request` take the already fetched ``instance``
+    #: as a keyword argument? Used by
+    #: :class:`~flask_kibble.polymodel.PolyDispatcher`.
+    accepts_instance = False
+
+    #: Answer repeated GET requests with ``304 Not Modified`` when the
+    #: :meth:`etag` is unchanged. Only writes made through Kibble change the
+    #: ETags, so leave this off for kinds that are written elsewhere.
+    #:
+    #: ETags are per user permissions, so they need an authenticator whose
+    #: :meth:`~flask_kibble.Authenticator.permission_fingerprint` doesn't
+    #: return ``None``. Only writes to the view's own kind or entity change
+    #: them, not writes to entities it shows from other kinds, such as its
+    #: ancestors.
+    conditional_get = False
+
     @classmethod
     def kind(cls):
         """
@@ -116,6 +135,13 @@ class KibbleView(View):
     def url_patterns(cls):
         return cls._url_patterns
 
+    @classmethod
+    def http_methods(cls):
+        """
+        The HTTP methods the view's urls accept.
+        """
+        return cls._methods
+
     @property
     def templates(self):
         """
@@ -149,6 +175,39 @@ class KibbleView(View):
             'is_embed': self._is_embed(),
         }
 
+    @classmethod
+    def prefetch(cls, **view_args):
+        """
+        Start any asynchronous reads the view will need to handle a request
+        with ``view_args``.
+
+        Called by the blueprint before the permission checks, so the reads
+        are in flight while they run. The view can then pick the futures up
+        with :meth:`prefetched`.
+
+        :returns: Dictionary of names to :py:class:`ndb.Future` objects.
+        """
+        return {}
+
+    @classmethod
+    def etag(cls, **view_args):
+        """
+        A validator for the page returned for ``view_args``, computed without
+        running the view. Used when :attr:`conditional_get` is set.
+
+        :returns: A string, or ``None`` if the page can't be validated.
+        """
+        return None
+
+    def prefetched(self, name):
+        """
+        Get a future started by :meth:`prefetch` for the current request.
+
+        :param name: The name the future was returned under.
+        :returns: The :py:class:`ndb.Future` or ``None``.
+        """
+        return getattr(flask.g, '_kibble_prefetch', {}).get(name)
+
     @classmethod
     def has_permission_for(cls, key=None):
         """
@@ -195,10 +254,20 @@ class KibbleView(View):
             # No ancestors, so this value isn't necessary
             ancestor_key = None
 
+        kwargs['key'] = key
+        kwargs['ancestor_key'] = ancestor_key
+
+        # Use the blueprint's pre-compiled builder where possible, it's
+        # considerably faster than werkzeug's rule matching.
+        bp = flask.current_app.blueprints.get(blueprint)
+        builder = getattr(bp, 'url_builders', {}).get(cls.view_name())
+        if builder is not None:
+            url = builder.build(**kwargs)
+            if url is not None:
+                return url
+
         return flask.url_for(
             '%s.%s' % (blueprint, cls.view_name()),
-            key=key,
-            ancestor_key=ancestor_key,
             **kwargs)
 
     @cached_property
@@ -228,6 +297,10 @@ class KibbleView(View):
     def _instance_actions(self):
         return [x for x in self._linked_actions if x._requires_instance]
 
+    @property
+    def _selection_actions(self):
+        return [x for x in self._linked_actions if x._acts_on_selection]
+
     @classmethod
     def _is_popup(self):
         """
@@ -1,14 +1,24 @@
 import re
 import os
 import logging
+from hashlib import sha1
 from collections import defaultdict
 
 from google.appengine.ext import ndb, blobstore
 from google.appengine.ext.ndb import polymodel
 
 from werkzeug import parse_options_header
+from werkzeug.utils import cached_property
+from markupsafe import Markup
+from . import profiler
 from .base import KibbleView
 from .util.forms import KibbleModelConverter
+from .util.cache import TieredCache
+from .util.singleflight import SingleFlight
+from .util.url_builder import UrlBuilder
+from .util.query_stats import QueryStats
+from .indexes import MissingIndexLog
+from .importer import import_run
 
 import flask
 
@@ -45,10 +55,28 @@ def upload(gcs_bucket=None):
     return flask.jsonify(payload)
 
 
+def query_stats():
+    """
+    Report of the list query shapes executed by this instance.
+    """
+    return flask.render_template(
+        'kibble/query_stats.html',
+        stats=flask.g.kibble.query_stats.report(),
+        missing_indexes=flask.g.kibble.missing_indexes)
+
+
 class KibbleRegistry(defaultdict):
     def __init__(self):
         super(KibbleRegistry, self).__init__(dict)
 
+        #: Incremented each time a view is registered. Used to invalidate
+        #: :class:`RegistrySnapshot` instances.
+        self.version = 0
+
+    def add(self, path, action, view_class):
+        self[path][action] = view_class
+        self.version += 1
+
     def grouped(self):
         groups = defaultdict(lambda: defaultdict(dict))
 
@@ -61,6 +89,125 @@ class KibbleRegistry(defaultdict):
         return groups
 
 
+def _kind_name(kind):
+    """
+    The name to label ``kind`` by: a kind name, or a model class or instance.
+    """
+    if isinstance(kind, (str, unicode)):
+        return kind
+
+    if isinstance(kind, ndb.Model):
+        kind = kind.__class__
+
+    # Polymodels behave differently. Use their _class_name().
+    if issubclass(kind, polymodel.PolyModel):
+        return kind._class_name()
+
+    # Otherwise, use _get_kind()
+    return kind._get_kind()
+
+
+def _dictsort_key(item):
+    # Mirrors jinja's case-insensitive ``dictsort``.
+    key = item[0]
+    if isinstance(key, basestring):
+        key = key.lower()
+    return key
+
+
+class MenuEntry(object):
+    """
+    A single kind/path in a :class:`RegistrySnapshot`.
+
+    :param snapshot: The :class:`RegistrySnapshot`.
+    :param path: The registry path.
+    :param actions: A dictionary of action name to view class.
+    """
+    def __init__(self, snapshot, path, actions):
+        self.path = path
+        self.actions = tuple(sorted(actions.items(), key=_dictsort_key))
+        self.primary = actions.get('list') or self.actions[0][1]
+
+        self.kind = self.primary.kind()
+        self.label = snapshot.label_for_kind(self.primary.model)
+        self.ancestor_labels = tuple(
+            snapshot.label_for_kind(a) for a in self.primary.ancestors)
+
+        #: Actions that don't require an instance or a selection, e.g. list
+        #: and create.
+        self.model_actions = tuple(
+            (name, view_cls) for name, view_cls in self.actions
+            if not view_cls._requires_instance
+            and not view_cls._acts_on_selection)
+
+
+class RegistrySnapshot(object):
+    """
+    An immutable, pre-computed view of a :class:`KibbleRegistry` for
+    rendering the index page and menus.
+
+    Only the per-user permission checks are left to the templates.
+
+    :param kibble: The :class:`Kibble` blueprint.
+    """
+    def __init__(self, kibble):
+        registry = kibble.registry
+        self.version = registry.version
+        self.app = flask.current_app._get_current_object()
+        self._kibble = kibble
+        self._kind_labels = {}
+
+        #: Values derived from the registry and configuration, such as
+        #: filter choices, kept for the life of the snapshot.
+        self.cache = {}
+
+        #: Tuple of ``(group header, (MenuEntry, ...))`` sorted by header
+        #: then path.
+        self.groups = tuple(
+            (header, tuple(
+                MenuEntry(self, path, actions)
+                for path, actions in sorted(group.items(),
+                                            key=_dictsort_key)))
+            for header, group in sorted(registry.grouped().items(),
+                                        key=_dictsort_key))
+
+    def is_current(self):
+        return (self.version == self._kibble.registry.version
+                and self.app is flask.current_app._get_current_object())
+
+    def label_for_kind(self, kind):
+        """
+        The label of ``kind``, remembered for the life of the snapshot.
+
+        :param kind: A kind name, or a model class or instance.
+        """
+        kind = _kind_name(kind)
+        try:
+            return self._kind_labels[kind]
+        except KeyError:
+            pass
+
+        label = self.app.config.get('KIBBLE_KIND_LABELS', {}).get(kind)
+        if not label:
+            label = self._kibble.KIND_LABEL_RE.sub(r'\1 \2', kind)
+
+        self._kind_labels[kind] = label
+        return label
+
+    @cached_property
+    def permissions(self):
+        """
+        Tuple of all the ``(model, action)`` permissions of the blueprint.
+        """
+        perms = [(None, self._kibble.name + '.' + ep)
+                 for ep in ('index', 'static')]
+
+        for path, actions in sorted(self._kibble.registry.items()):
+            for action, view_cls in sorted(actions.items()):
+                perms.append((view_cls.model, action))
+        return tuple(perms)
+
+
 class Kibble(flask.Blueprint):
     def __init__(self, name, import_name, auth, label=None,
                  default_gcs_bucket=None, 
@@ -95,17 +242,50 @@ class Kibble(flask.Blueprint):
         self.model_converter = default_model_converter or KibbleModelConverter
 
         self.registry = KibbleRegistry()
+        self._snapshot = None
+
+        #: Cache for per-user template fragments. See
+        #: :meth:`cached_fragment`.
+        self.fragment_cache = TieredCache('kibble-fragments')
+        #: Cache for list results. See :attr:`List.cache_results
+        #: <flask_kibble.List.cache_results>`.
+        self.result_cache = TieredCache('kibble-results', time=3600)
+        #: Coalesces identical list queries. See :attr:`List.coalesce_queries
+        #: <flask_kibble.List.coalesce_queries>`.
+        self.query_flights = SingleFlight('kibble-flights')
+        self._fingerprint_warned = False
+
+        #: Per-shape list query timings. See
+        #: :mod:`~flask_kibble.util.query_stats`.
+        self.query_stats = QueryStats()
+
+        #: Indexes list queries were missing at runtime. See
+        #: :mod:`~flask_kibble.indexes`.
+        self.missing_indexes = MissingIndexLog()
+
+        #: Pre-compiled :class:`~flask_kibble.util.url_builder.UrlBuilder`
+        #: instances, keyed by the views endpoint name.
+        self.url_builders = {}
 
         self.add_url_rule('/', view_func=index, endpoint='index')
         self.add_url_rule('/_upload/',
                           view_func=upload,
                           endpoint='upload',
                           methods=['POST'])
+        self.add_url_rule('/_stats/queries/',
+                          view_func=query_stats,
+                          endpoint='query_stats')
+        self.add_url_rule('/_import/run/',
+                          view_func=import_run,
+                          endpoint='import_run',
+                          methods=['POST'])
 
         self.record_once(self._register_urlconverter)
         self.record_once(self._register_jinja_globals)
 
         self.before_request(self._before_request)
+        self.after_request(self._after_request)
+        self.teardown_request(self._teardown_request)
         self.context_processor(self._context_processor)
 
         self.errorhandler(403)(self.handle_403)
@@ -120,6 +300,12 @@ class Kibble(flask.Blueprint):
         :raises ValueError: When the same (Class,Action) pair is already
             registered.
         """
+        self._register_view(
+            view_class,
+            view_class.as_view(view_class.view_name()),
+            [x._get_kind() for x in view_class.ancestors])
+
+    def _register_view(self, view_class, view_func, ancest_kinds):
         action = view_class.action
         kind = view_class.kind()
         path = view_class.path()
@@ -129,12 +315,9 @@ class Kibble(flask.Blueprint):
             raise ValueError("%s already has view for %s:%s" % (
                 self, path, action))
 
-        view_func = view_class.as_view(view_class.view_name())
-        ancest_kinds = [x._get_kind() for x in view_class.ancestors]
-
         key = "<ndbkey({0}):key>".format(",".join([
             "'%s'" % x
-            for x in ancest_kinds + [view_class.model._get_kind()]]))
+            for x in ancest_kinds + [kind]]))
         ancestor_key = "<ndbkey({0}):ancestor_key>".format(
             ",".join(["'%s'" % x for x in ancest_kinds]))
 
@@ -146,13 +329,16 @@ class Kibble(flask.Blueprint):
                     kind=kind,
                     kind_lower=kind.lower(),
                     action=action),
-                methods=view_class._methods,
+                methods=view_class.http_methods(),
                 defaults=defaults,
                 view_func=view_func)
 
-        self.registry[path][action] = view_class
+        self.url_builders[view_class.view_name()] = UrlBuilder(
+            '%s.%s' % (self.name, view_class.view_name()))
+        self.registry.add(path, action, view_class)
 
-    def autodiscover(self, paths, models=None, module_names=None):
+    def autodiscover(self, paths, models=None, module_names=None,
+                     manifest=None):
         """
         Automatically register all Kibble views under ``path``.
 
@@ -161,30 +347,36 @@ class Kibble(flask.Blueprint):
             will only attempt to autodiscover `kibble.py` files.
         :param models: A list of model kinds (either a ``ndb.Model`` subclass
             or a string) (Optional)
+        :param manifest: The filename of a manifest generated with
+            :func:`flask_kibble.manifest.write_manifest`. If provided, views
+            are registered from the manifest and only imported when first
+            used. (Optional)
         """
-        from werkzeug.utils import find_modules, import_string
-        from .base import KibbleMeta
+        from . import manifest as kibble_manifest
 
         all_models = models is None
         models = [
             (x._kind() if isinstance(x, ndb.Model) else x)
             for x in models or []]
 
-        for p in paths:
-            for mod in find_modules(p, True, True):
-                # logger.debug("Autodiscover: %s", mod)
-                if module_names is None \
-                        or mod.rsplit('.', 1)[-1] in module_names:
-                    import_string(mod)
+        if manifest is not None:
+            for entry in kibble_manifest.load_manifest(manifest):
+                if all_models or entry['kind'] in models:
+                    view = kibble_manifest.LazyView(entry)
+                    self._register_view(view, view, entry['ancestors'])
+            return
 
-        for view in KibbleMeta._autodiscover:
-            if view.model and (all_models or view.kind() in models):
+        for view in kibble_manifest.discover_views(paths, module_names):
+            if all_models or view.kind() in models:
                 self.register_view(view)
             # else:
             #    logger.debug("Autodiscover skipping: %r", view)
 
     def _context_processor(self):
-        return {'kibble': self}
+        return {
+            'kibble': self,
+            'kibble_profile': getattr(flask.g, '_kibble_profile', None),
+        }
 
     @classmethod
     def _register_urlconverter(self, setup_state):
@@ -206,6 +398,14 @@ class Kibble(flask.Blueprint):
 
         flask.g.kibble = self         # Set global var
 
+        if flask.current_app.config.get('KIBBLE_PROFILE_RPCS', False):
+            flask.g._kibble_profile = profiler.start(flask.request.endpoint)
+
+        if flask.request.endpoint == self.name + '.import_run':
+            # Task queue requests have no user. The view checks they really
+            # are from the task queue.
+            return
+
         if not self.auth.is_logged_in():
             # User not logged in, redirect to the login url.
             logger.debug("User is not logged in.")
@@ -214,10 +414,25 @@ class Kibble(flask.Blueprint):
         view_func = flask.current_app.view_functions[flask.request.endpoint]
         view_class = getattr(view_func, 'view_class', None)
 
+        etag = None
+        not_modified = False
+
         if view_class and issubclass(view_class, KibbleView):
             # for CBVs, use the model and action parameters.
             model = view_class.model
             action = view_class.action
+
+            if view_class.conditional_get \
+                    and flask.request.method == 'GET' \
+                    and '_flashes' not in flask.session:
+                etag = view_class.etag(**flask.request.view_args)
+                not_modified = etag is not None \
+                    and etag in flask.request.if_none_match
+
+            # Get the view's reads going while permissions are checked.
+            if not not_modified:
+                flask.g._kibble_prefetch = view_class.prefetch(
+                    **flask.request.view_args)
         else:
             # For non-CBVs, use the endpoint name
             model = None
@@ -231,14 +446,102 @@ class Kibble(flask.Blueprint):
                          flask.request.endpoint)
             flask.abort(403)
 
+        if etag is not None:
+            flask.g._kibble_etag = etag
+            if not_modified:
+                return flask.current_app.response_class(status=304)
+
+    def _after_request(self, response):
+        etag = getattr(flask.g, '_kibble_etag', None)
+        if etag is not None and response.status_code in (200, 304):
+            response.set_etag(etag)
+            # Make browsers revalidate every time.
+            response.headers['Cache-Control'] = 'private, no-cache'
+
+        profile = getattr(flask.g, '_kibble_profile', None)
+        if profile is not None:
+            profiler.stop(profile)
+            response.headers['Server-Timing'] = profile.server_timing()
+        return response
+
+    def _teardown_request(self, exc):
+        # Make sure a failed request doesn't leave the profiler running.
+        profile = getattr(flask.g, '_kibble_profile', None)
+        if profile is not None:
+            profiler.stop(profile)
+
+    @property
+    def snapshot(self):
+        """
+        The current :class:`RegistrySnapshot`. Built on first use and
+        rebuilt when a view is registered.
+        """
+        if self._snapshot is None or not self._snapshot.is_current():
+            self._snapshot = RegistrySnapshot(self)
+        return self._snapshot
+
     def all_permissions(self):
-        endpoints = ['index', 'static']
-        for ep in endpoints:
-            yield None, self.name + '.' + ep
+        return iter(self.snapshot.permissions)
+
+    def fragment_key(self, name, *parts):
+        """
+        The cache key for the template fragment ``name`` for the current
+        user, or ``None`` if the fragment can't be cached.
+
+        :param name: The fragment name.
+        :param parts: Any extra values the fragment depends on.
+        """
+        try:
+            fingerprint = flask.g._kibble_permission_fingerprint
+        except AttributeError:
+            fingerprint = flask.g._kibble_permission_fingerprint = \
+                self.auth.permission_fingerprint()
+
+        if fingerprint is None:
+            if not self._fingerprint_warned:
+                self._fingerprint_warned = True
+                logger.info(
+                    "%s.permission_fingerprint() returned None, fragment "
+                    "caching, result caching and ETags are disabled.",
+                    self.auth.__class__.__name__)
+            return None
+
+        key = u':'.join([
+            self.name, name,
+            os.environ.get('CURRENT_VERSION_ID', ''),
+            unicode(self.registry.version),
+            flask.request.script_root,
+            fingerprint,
+        ] + [unicode(p) for p in parts])
+        return sha1(key.encode('utf-8')).hexdigest()
+
+    def cached_fragment(self, name, *parts, **kwargs):
+        """
+        Cache a template fragment per user permissions. Intended to be used
+        from a ``{% call %}`` block ::
+
+            {% call kibble.cached_fragment('menu', view.kind()) %}
+                ...
+            {% endcall %}
+
+        Fragments are keyed on the blueprint, the registry version and
+        :meth:`~flask_kibble.Authenticator.permission_fingerprint`, so a
+        change in the user's permissions results in a new fragment.
 
-        for actions in self.registry.itervalues():
-            for action, view_cls in actions.iteritems():
-                yield view_cls.model, action
+        :param name: The fragment name.
+        :param parts: Any extra values the fragment depends on.
+        """
+        caller = kwargs.pop('caller')
+
+        key = self.fragment_key(name, *parts)
+        if key is None:
+            return caller()
+
+        html = self.fragment_cache.get(key)
+        if html is None:
+            html = unicode(caller())
+            self.fragment_cache.set(key, html)
+        return Markup(html)
 
     def url_for(self, model, action, instance=None, ancestor=None, **kwargs):
         """
@@ -274,25 +577,7 @@ class Kibble(flask.Blueprint):
     KIND_LABEL_RE = re.compile(r'([a-z])([A-Z0-9])')
 
     def label_for_kind(self, kind):
-        if not isinstance(kind, (str, unicode)):
-            if isinstance(kind, ndb.Model):
-                kind = kind.__class__
-
-            # Polymodels behave differently. Use their _class_name().
-            if issubclass(kind, polymodel.PolyModel):
-                kind = kind._class_name()
-
-            # Otherwise, use _get_kind()
-            elif issubclass(kind, ndb.Model):
-                kind = kind._get_kind()
-
-        label = flask.current_app.config.get('KIBBLE_KIND_LABELS', {}).get(
-            kind)
-
-        if label:
-            return label
-
-        return self.KIND_LABEL_RE.sub(r'\1 \2', kind)
+        return self.snapshot.label_for_kind(kind)
 
     def handle_403(self, error):
         return flask.render_template('kibble/403.html'), 403
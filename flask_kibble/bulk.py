@@ -0,0 +1,306 @@
+"""
+Bulk editing.
+=============
+
+:class:`BulkEdit` applies one form to many entities at once. Link it from a
+list view and the list grows a checkbox per row ::
+
+    class PostBulkEdit(kibble.BulkEdit):
+        model = Post
+
+    class PostList(kibble.List):
+        model = Post
+        linked_actions = ['bulk_edit']
+
+Each field on the form has an "apply" toggle, and only the toggled fields
+are validated and written to the selected entities.
+"""
+
+import logging
+import functools
+from collections import OrderedDict
+
+import flask
+from google.appengine.ext import ndb
+
+from . import signals
+from .edit import FormView, FieldsetIterator
+from .util.ndb import (instance_and_ancestors_async, snapshot_properties,
+                       changed_properties, is_descendant)
+from .util.forms import validate_fields
+from .util.changes import entity_changed
+
+logger = logging.getLogger(__name__)
+
+
+def _chunks(seq, size):
+    for i in xrange(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+class BulkEdit(FormView):
+    #: View name
+    action = 'bulk_edit'
+
+    button_icon = 'th-list'
+
+    _url_patterns = [
+        ('/{kind_lower}/bulk-edit/', {'ancestor_key': None}),
+        ('/{ancestor_key}/{kind_lower}/bulk-edit/', {}),
+    ]
+    _requires_instance = False
+    _acts_on_selection = True
+
+    #: The most entities that can be edited at once.
+    max_keys = 1000
+
+    #: Number of entities fetched and written per batch.
+    batch_size = 100
+
+    #: Write each entity group in its own transaction. By default this is
+    #: only done when the model has ancestors.
+    transactional = None
+
+    #: Send ``pre_action`` and ``post_action`` once per batch, with
+    #: ``keys`` and ``instances``, rather than once per entity.
+    batch_signals = False
+
+    @classmethod
+    def prefetch(cls, ancestor_key=None, **view_args):
+        if ancestor_key is None:
+            return {}
+        return {'ancestors': instance_and_ancestors_async(ancestor_key)}
+
+    def get_keys(self, ancestor_key=None):
+        """
+        The keys of the selected entities, from the ``key`` request values.
+        Each must be under ``ancestor_key``, and the user needs the ``edit``
+        permission for it.
+        """
+        keys = []
+        for urlsafe in OrderedDict.fromkeys(
+                flask.request.values.getlist('key')):
+            try:
+                key = ndb.Key(urlsafe=urlsafe)
+            except Exception:
+                flask.abort(400)
+            if key.kind() != self.model._get_kind():
+                flask.abort(400)
+            if ancestor_key is not None \
+                    and not is_descendant(key, ancestor_key):
+                flask.abort(400)
+            keys.append(key)
+
+        if len(keys) > self.max_keys:
+            flask.abort(400)
+
+        auth = flask.g.kibble.auth
+        for key in keys:
+            if not auth.has_permission_for(self.model, 'edit', key=key):
+                flask.abort(403)
+        return keys
+
+    def get_form_instance(self, instance=None):
+        formcls = self.get_form_class(instance)
+        if self._is_submit():
+            return formcls(flask.request.form)
+        # Selection posted from a list, start with the defaults.
+        return formcls(None)
+
+    def get_apply_fields(self, form):
+        """
+        The names of the fields the user chose to apply.
+        """
+        return [
+            name for name in flask.request.form.getlist('__apply')
+            if name in form._fields and name != 'csrf_token'
+        ]
+
+    def validate(self, form, fields):
+        """
+        Validate only the chosen fields, and the CSRF token.
+        """
+        return validate_fields(form, fields)
+
+    def apply(self, form, fields, instance):
+        """
+        Copy the chosen fields from ``form`` on to ``instance``.
+
+        :returns: List of the changed :py:class:`ndb.Property` instances.
+        """
+        before = snapshot_properties(instance)
+        for name in fields:
+            form[name].populate_obj(instance, name)
+        return changed_properties(instance, before)
+
+    def save_models(self, form, fields, keys):
+        """
+        Apply the chosen fields to the entities with ``keys``. Entities are
+        only written if they changed.
+
+        :returns: List of the changed instances.
+        """
+        transactional = self.transactional
+        if transactional is None:
+            transactional = bool(self.ancestors)
+
+        if transactional:
+            return self._save_groups(form, fields, keys)
+        return self._save_batches(form, fields, keys)
+
+    def _save_batches(self, form, fields, keys):
+        # Get every batch going, then write each as it arrives.
+        reads = [ndb.get_multi_async(batch)
+                 for batch in _chunks(keys, self.batch_size)]
+
+        writes = []
+        for futures in reads:
+            changed = self._apply_batch(
+                form, fields, [f.get_result() for f in futures])
+            if changed:
+                writes.append((changed, ndb.put_multi_async(
+                    [inst for inst, _ in changed])))
+
+        updated = []
+        for changed, futures in writes:
+            for f in futures:
+                f.check_success()
+            self._saved(changed)
+            updated.extend(inst for inst, _ in changed)
+        return updated
+
+    def _save_groups(self, form, fields, keys):
+        groups = OrderedDict()
+        for key in keys:
+            groups.setdefault(key.root(), []).append(key)
+
+        # Signals may be sent again if a transaction is retried.
+        @ndb.tasklet
+        def _tx(group):
+            instances = yield ndb.get_multi_async(group)
+            changed = self._apply_batch(form, fields, instances)
+            if changed:
+                yield ndb.put_multi_async([inst for inst, _ in changed])
+            raise ndb.Return(changed)
+
+        updated = []
+        for batch in _chunks(groups.values(), self.batch_size):
+            futures = [
+                ndb.transaction_async(functools.partial(_tx, group),
+                                      retries=self._transaction_retries)
+                for group in batch
+            ]
+            for future in futures:
+                changed = future.get_result()
+                self._saved(changed)
+                updated.extend(inst for inst, _ in changed)
+        return updated
+
+    def _apply_batch(self, form, fields, instances):
+        """
+        :returns: List of ``(instance, changed properties)`` for the
+            instances that changed.
+        """
+        instances = [inst for inst in instances if inst is not None]
+
+        if self.batch_signals:
+            signals.pre_action.send(
+                self.action,
+                view_class=self.__class__,
+                keys=[inst.key for inst in instances],
+                instances=instances)
+
+        changed = []
+        for inst in instances:
+            if not self.batch_signals:
+                signals.pre_action.send(
+                    self.action,
+                    view_class=self.__class__,
+                    instance=inst,
+                    key=inst.key)
+
+            props = self.apply(form, fields, inst)
+            if props:
+                changed.append((inst, props))
+        return changed
+
+    def _saved(self, changed):
+        for inst, props in changed:
+            entity_changed(inst.key)
+
+        if self.batch_signals:
+            if changed:
+                signals.post_action.send(
+                    self.action,
+                    view_class=self.__class__,
+                    keys=[inst.key for inst, _ in changed],
+                    instances=[inst for inst, _ in changed])
+            return
+
+        for inst, props in changed:
+            signals.post_action.send(
+                self.action,
+                view_class=self.__class__,
+                instance=inst,
+                key=inst.key,
+                changed_properties=len(props),
+                indexed_changes=any(p._indexed for p in props))
+
+    def get_success_message(self, updated, keys):
+        """
+        Returns the message to flash once the entities are saved.
+
+        :param updated: The changed instances.
+        :param keys: The keys of all the selected entities.
+        """
+        return u"Updated {updated} of {selected} {kind}.".format(
+            updated=len(updated),
+            selected=len(keys),
+            kind=self.kind_label())
+
+    def get_success_response(self, ancestor_key=None):
+        url = flask.g.kibble.url_for(self.path(), 'list',
+                                     ancestor=ancestor_key,
+                                     _embed=self._is_embed())
+        return flask.redirect(url or flask.url_for('.index'))
+
+    def _is_submit(self):
+        return (flask.request.method == 'POST'
+                and '__bulk_edit' in flask.request.form)
+
+    def dispatch_request(self, ancestor_key=None):
+        ancestors = self.prefetched('ancestors')
+        if ancestors is None and ancestor_key:
+            ancestors = instance_and_ancestors_async(ancestor_key)
+
+        keys = self.get_keys(ancestor_key)
+        if not keys:
+            flask.flash(u"No {kind} selected.".format(
+                kind=self.kind_label()), 'warning')
+            return self.get_success_response(ancestor_key)
+
+        form = self.get_form_instance()
+        fields = self.get_apply_fields(form)
+
+        if self._is_submit() and fields and self.validate(form, fields):
+            updated = self.save_models(form, fields, keys)
+            logger.info("Bulk edit of %s: %d of %d changed.",
+                        self.kind(), len(updated), len(keys))
+
+            flask.flash(self.get_success_message(updated, keys), 'success')
+            return self.get_success_response(ancestor_key)
+
+        ctx = self.base_context()
+        ctx['form'] = form
+        ctx['fieldsets'] = FieldsetIterator(
+            form,
+            self.get_form_fieldsets())
+        ctx['keys'] = keys
+        ctx['apply'] = fields
+        ctx['no_fields'] = self._is_submit() and not fields
+        ctx['ancestors'] = (ancestors.get_result()
+                            if ancestors is not None
+                            else [])
+        ctx['help_text'] = self.field_help_text
+
+        return flask.render_template(self.templates, **ctx)
@@ -1,16 +1,22 @@
+import time
+import random
 import logging
 
-
 import flask
 import wtforms
 from werkzeug import cached_property
 
 from google.appengine.ext import ndb
+from google.appengine.ext.ndb import polymodel
+from google.appengine.api import datastore_errors
 
 from . import signals
 from .base import KibbleView
+from .util.cache import LRUCache
 from .util.forms import BaseCSRFForm
-from .util.ndb import instance_and_ancestors_async
+from .util.ndb import (instance_and_ancestors_async, snapshot_properties,
+                       changed_properties, entity_version)
+from .util.changes import entity_changed, entity_stamps
 
 logger = logging.getLogger(__name__)
 
@@ -33,13 +39,9 @@ class Fieldset(object):
                 self.name, attr))
 
     def __iter__(self):
-        for field in self.fields:
-            try:
-                field = self.form[field]
-            except KeyError:
-                pass  # Field is missing, ignore it.
-            else:
-                yield field
+        # Missing fields are ignored.
+        for field in self._present_fields:
+            yield self.form[field]
 
     def __len__(self):
         return len(self._present_fields)
@@ -49,6 +51,60 @@ class Fieldset(object):
         return [f for f in self.fields if f in self.form._fields]
 
 
+class FieldsetLayout(object):
+    """
+    Which of a form's fields each fieldset shows. Layouts only depend on the
+    names and types of the form's fields, so they're worked out once and
+    shared by every form with the same fields.
+
+    :param form: A form instance.
+    :param fieldsets: The fieldset definitions.
+    """
+    _cache = LRUCache(500)
+
+    def __init__(self, form, fieldsets):
+        listed = set()
+
+        #: List of ``(index, present field names)`` for the non-empty
+        #: fieldsets.
+        self.fieldsets = []
+        for i, fieldset in enumerate(fieldsets):
+            fields = fieldset.get('fields', [])
+            listed.update(fields)
+
+            present = [f for f in fields if f in form._fields]
+            if present:
+                self.fieldsets.append((i, present))
+
+        remaining = [name for name in form._fields if name not in listed]
+
+        #: Fields not in any fieldset, in form order.
+        self.remainder = [
+            name for name in remaining
+            if not isinstance(form[name], wtforms.HiddenField)
+        ]
+        self.hidden = [
+            name for name in remaining
+            if isinstance(form[name], wtforms.HiddenField)
+        ]
+
+    @classmethod
+    def for_form(cls, form, fieldsets):
+        """
+        The cached layout of ``form`` for ``fieldsets``.
+        """
+        key = (
+            tuple((name, type(field))
+                  for name, field in form._fields.iteritems()),
+            tuple(tuple(fs.get('fields', [])) for fs in fieldsets),
+        )
+        layout = cls._cache.get(key)
+        if layout is None:
+            layout = cls(form, fieldsets)
+            cls._cache.set(key, layout)
+        return layout
+
+
 class FieldsetIterator(object):
     """
     Iterator to facilitate ordering and grouping fields.
@@ -63,31 +119,22 @@ class FieldsetIterator(object):
         self.fieldsets = fieldsets
         self.form = form
 
-        self._fields = set(self.form._fields.keys())
-
-    def _visible_fields(self):
-        return [
-            x for x in self._fields
-            if not isinstance(self.form[x], wtforms.HiddenField)
-        ]
+        self._layout = FieldsetLayout.for_form(form, fieldsets)
 
     @property
     def hidden_fields(self):
-        return [
-            self.form[x] for x in self._fields
-            if isinstance(self.form[x], wtforms.HiddenField)
-        ]
+        return [self.form[x] for x in self._layout.hidden]
 
     def __iter__(self):
-        for fieldset in self.fieldsets:
-            self._fields.difference_update(fieldset.get('fields', []))
+        for i, present in self._layout.fieldsets:
+            fs = Fieldset(self.form, **self.fieldsets[i])
+            fs._present_fields = present
+            yield fs
 
-            fs = Fieldset(self.form, **fieldset)
-            if len(fs):
-                yield fs
-
-        if self._visible_fields():
-            yield Fieldset(self.form, None, self._visible_fields())
+        if self._layout.remainder:
+            fs = Fieldset(self.form, None, self._layout.remainder)
+            fs._present_fields = self._layout.remainder
+            yield fs
 
 
 class FormView(KibbleView):
@@ -137,6 +184,40 @@ class FormView(KibbleView):
 
     _transaction_retries = 3
 
+    #: Save edits optimistically. The form carries the version of the
+    #: instance it was rendered from, and on POST the instance is only read
+    #: inside the save transaction. If it changed in the meantime the
+    #: differences are shown rather than overwritten.
+    #:
+    #: As the instance isn't read before saving, ``pre_action`` is sent from
+    #: inside the save transaction, once the instance has been read. It is
+    #: sent again if the transaction is retried. Instances of PolyModels
+    #: are always read first, as the key doesn't say which form to use.
+    optimistic = False
+
+    #: Seconds to wait before retrying a contended save. Doubles with each
+    #: retry, and a random part of it is used to spread retries out.
+    transaction_backoff = 0.1
+
+    #: Names of the properties changed by the last :meth:`save_model`, or
+    #: ``None`` if unknown.
+    changes = None
+
+    #: Whether any of :attr:`changes` are indexed properties.
+    indexed_changes = None
+
+    class Conflict(Exception):
+        """
+        Raised by :meth:`save_model` when the instance was changed after the
+        form was rendered.
+
+        :param differences: List of ``(property, stored value, submitted
+            value)`` for the properties the save would overwrite.
+        """
+        def __init__(self, differences):
+            super(FormView.Conflict, self).__init__(differences)
+            self.differences = differences
+
     def __init__(self, *args, **kwargs):
         super(FormView, self).__init__(*args, **kwargs)
 
@@ -144,19 +225,30 @@ class FormView(KibbleView):
     def _model_converter(self):
         return self.model_converter or flask.g.kibble.model_converter
 
-    def save_model(self, form, instance=None, ancestor_key=None):
+    def save_model(self, form, instance=None, ancestor_key=None, key=None,
+                   version=None):
         """
         Called when a form is saved with no errors.
 
         If no instance is present, it it up to this view to create
-        a new instance.
+        a new instance. Existing instances are only written if the form
+        changed them; the changed properties are recorded in
+        :attr:`changes`.
 
         :param form: The form instance
         :param instance: The instance (if any) to save to.
+        :param key: The key to save to, if the instance hasn't been read.
+        :param version: The :func:`~flask_kibble.util.ndb.entity_version`
+            the form was rendered from.
 
+        :raises FormView.Conflict: When ``version`` is given and the instance
+            has changed since.
         :returns: The saved instance
         :rtype: :py:class:`ndb.Model`
         """
+        if instance is not None:
+            key = instance.key
+        optimistic = instance is None and version is not None
 
         # We've got to perform some hokum here. As dispatch_request
         # is likely to end up as a xg transaction due to having other
@@ -164,18 +256,97 @@ class FormView(KibbleView):
         # here.
         # As a result, we have to re-query the instance, and write the
         # changes to the DB. in this closure. See GAE issue 10200.
-        @ndb.transactional(retries=self._transaction_retries)
-        def _tx(key):
+        def _tx():
             if key is None:
                 inst = self.model(parent=ancestor_key)
             else:
                 inst = key.get()
+                if inst is None:
+                    flask.abort(404)
+
+            stale = version is not None and entity_version(inst) != version
 
+            if optimistic:
+                # The form was built without the instance. Process it
+                # again against the stored one, so fields missing from the
+                # POST keep their values as they would for a normal save.
+                form.process(flask.request.form, obj=inst)
+                self._send_pre_action(inst, ancestor_key, key)
+
+            before = snapshot_properties(inst)
             form.populate_obj(inst)
-            inst.put()
-            return inst
+            changed = changed_properties(inst, before)
+
+            if stale and changed:
+                raise self.Conflict([
+                    (prop, before.get(prop._name), prop._get_value(inst))
+                    for prop in changed])
+
+            # Don't rewrite the entity, and all its index rows, when
+            # nothing changed.
+            if key is None or changed:
+                inst.put()
+            return inst, changed
+
+        try:
+            inst, changed = self._run_transaction(_tx, key, optimistic)
+        except self.Conflict:
+            self._report_contention(key, conflict=True)
+            raise
+
+        self.changes = [p._code_name for p in changed]
+        self.indexed_changes = any(p._indexed for p in changed)
 
-        return _tx(instance.key if instance else None)
+        if instance is None or changed:
+            entity_changed(inst.key)
+        else:
+            logger.debug("%r unchanged, not saved.", inst.key)
+        return inst
+
+    def _run_transaction(self, callback, key=None, optimistic=False):
+        """
+        Run ``callback`` in a transaction. Contended optimistic saves are
+        retried up to ``_transaction_retries`` times, backing off
+        exponentially; other saves use ndb's own retries.
+        """
+        if ndb.in_transaction():
+            return callback()
+
+        if not optimistic:
+            try:
+                return ndb.transaction(callback)
+            except datastore_errors.TransactionFailedError:
+                self._report_contention(key, failed=True)
+                raise
+
+        for retry in xrange(self._transaction_retries + 1):
+            if retry:
+                ndb.sleep(random.uniform(
+                    0, self.transaction_backoff * 2 ** (retry - 1))
+                ).get_result()
+            try:
+                result = ndb.transaction(callback, retries=0)
+            except datastore_errors.TransactionFailedError:
+                if retry == self._transaction_retries:
+                    self._report_contention(key, retries=retry, failed=True)
+                    raise
+            else:
+                if retry:
+                    self._report_contention(key, retries=retry)
+                return result
+
+    def _report_contention(self, key, retries=0, failed=False,
+                           conflict=False):
+        logger.warning(
+            "Contention saving %r: %d retries, %s.", key, retries,
+            'conflict' if conflict else 'failed' if failed else 'saved')
+        signals.contention.send(
+            self.action,
+            view_class=self.__class__,
+            key=key,
+            retries=retries,
+            failed=failed,
+            conflict=conflict)
 
     def get_success_response(self, instance):
         """
@@ -228,6 +399,12 @@ class FormView(KibbleView):
         """
         tmpl = u"{kind} '{instance}' saved."
 
+        if self._requires_instance and self.changes is not None:
+            if not self.changes:
+                tmpl = u"No changes to {kind} '{instance}'."
+            elif not self.indexed_changes:
+                tmpl += u" Only unindexed fields changed."
+
         return tmpl.format(
             instance=instance,
             kind=self.kind_label())
@@ -261,37 +438,80 @@ class FormView(KibbleView):
         """
         return self.fieldsets
 
-    def _form_logic(self, instance=None, ancestor_key=None):
-        if instance:
-            ancestors = instance_and_ancestors_async(instance.key.parent())
-        elif ancestor_key:
-            ancestors = instance_and_ancestors_async(ancestor_key)
-        else:
-            ancestors = None
+    def _send_pre_action(self, instance, ancestor_key, key):
+        signals.pre_action.send(
+            self.action,
+            view_class=self.__class__,
+            instance=instance,
+            ancestor_key=ancestor_key,
+            key=key)
 
-        form = self.get_form_instance(instance)
+    @classmethod
+    def _optimistic_save(cls):
+        """
+        Is the current request an optimistic save, which doesn't need the
+        instance read up front?
+        """
+        return (cls.optimistic
+                and not issubclass(cls.model, polymodel.PolyModel)
+                and flask.request.method == 'POST'
+                and bool(flask.request.form.get('__version')))
 
-        if flask.request.method == 'POST' and form.validate():
+    def _form_logic(self, instance=None, ancestor_key=None, key=None):
+        """
+        :param key: The key of the instance being edited, if it hasn't been
+            read yet. (Optimistic saves only.)
+        """
+        if instance is not None:
+            key = instance.key
 
-            signals.pre_action.send(
-                self.action,
-                view_class=self.__class__,
-                instance=instance,
-                ancestor_key=ancestor_key,
-                key=instance.key if instance else None)
+        ancestors = self.prefetched('ancestors')
+        if ancestors is None:
+            if key:
+                ancestors = instance_and_ancestors_async(key.parent())
+            elif ancestor_key:
+                ancestors = instance_and_ancestors_async(ancestor_key)
 
-            instance = self.save_model(form, instance, ancestor_key)
+        form = self.get_form_instance(instance)
+        version = None
+        if key and self._optimistic_save():
+            version = flask.request.form['__version']
+        conflict = None
 
-            signals.post_action.send(
-                self.action,
-                view_class=self.__class__,
-                instance=instance,
-                ancestor_key=ancestor_key,
-                key=instance.key if instance else None)
+        if flask.request.method == 'POST' and form.validate():
 
-            flask.flash(self.get_success_message(instance), 'success')
+            if instance is not None or version is None:
+                # Optimistic saves send it once the instance is read.
+                self._send_pre_action(instance, ancestor_key, key)
 
-            return self.get_success_response(instance)
+            try:
+                if version is None:
+                    instance = self.save_model(form, instance, ancestor_key)
+                else:
+                    instance = self.save_model(form, instance, ancestor_key,
+                                               key=key, version=version)
+            except self.Conflict as conflict:
+                pass
+            else:
+                signals.post_action.send(
+                    self.action,
+                    view_class=self.__class__,
+                    instance=instance,
+                    ancestor_key=ancestor_key,
+                    key=instance.key if instance else None,
+                    changed_properties=(
+                        len(self.changes)
+                        if self.changes is not None else None),
+                    indexed_changes=self.indexed_changes)
+
+                flask.flash(self.get_success_message(instance), 'success')
+
+                return self.get_success_response(instance)
+
+        if instance is None and key is not None:
+            instance = key.get()
+            if instance is None:
+                flask.abort(404)
 
         ctx = self.base_context()
         ctx['form'] = form
@@ -299,6 +519,11 @@ class FormView(KibbleView):
             form,
             self.get_form_fieldsets(instance))
         ctx['instance'] = instance
+        ctx['conflict'] = conflict
+        if self.optimistic and key:
+            # After a conflict, saving again overwrites the current version.
+            ctx['version'] = (version if version and not conflict
+                              else entity_version(instance))
         ctx['ancestors'] = (ancestors.get_result()
                             if ancestors is not None
                             else [])
@@ -317,9 +542,41 @@ class Edit(FormView):
         ("/{key}/", {})
     ]
     _requires_instance = True
+    accepts_instance = True
+
+    #: Seconds an ETag stays valid for, so cached forms don't outlive their
+    #: CSRF tokens.
+    etag_lifetime = 600
+
+    @classmethod
+    def prefetch(cls, key, **view_args):
+        futures = {
+            'ancestors': instance_and_ancestors_async(key.parent()),
+        }
+        if not cls._optimistic_save():
+            futures['instance'] = key.get_async()
+        return futures
+
+    @classmethod
+    def etag(cls, key, **view_args):
+        urlsafe = key.urlsafe()
+        stamp = entity_stamps.get(urlsafe)[urlsafe]
+        if stamp is None:
+            return None
+
+        return flask.g.kibble.fragment_key(
+            'edit-etag', urlsafe, stamp,
+            sorted(flask.request.args.iteritems(multi=True)),
+            flask.session.get('csrf', ''),
+            int(time.time() // cls.etag_lifetime))
+
+    def dispatch_request(self, key, instance=None):
+        if instance is None and self._optimistic_save():
+            return self._form_logic(None, key=key)
 
-    def dispatch_request(self, key):
-        instance = key.get()
+        if instance is None:
+            instance = (self.prefetched('instance')
+                        or key.get_async()).get_result()
         if instance is None:
             logger.debug("Unable to find instance with key %r", key)
             flask.abort(404)
@@ -339,6 +596,12 @@ class Create(FormView):
     ]
     _requires_instance = False
 
+    @classmethod
+    def prefetch(cls, ancestor_key=None, **view_args):
+        if ancestor_key is None:
+            return {}
+        return {'ancestors': instance_and_ancestors_async(ancestor_key)}
+
     def dispatch_request(self, ancestor_key=None):
         return self._form_logic(None, ancestor_key)
 
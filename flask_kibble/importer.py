@@ -0,0 +1,444 @@
+"""
+Bulk import.
+============
+
+:class:`Import` loads a CSV or JSON lines file into a kind ::
+
+    class PostImport(kibble.Import):
+        model = Post
+
+The file is uploaded to the blobstore, and imported in the background by
+task queue requests to the blueprint's ``import_run`` endpoint. Each row is
+validated with the view's form (see :meth:`FormView.get_form_class
+<flask_kibble.edit.FormView.get_form_class>`) and valid rows are written in
+batches. Progress, including the errors for each row, is recorded on an
+:class:`ImportJob` after every batch, so a failed import can be resumed from
+the last row written.
+
+CSV files need a header row naming the form fields. JSON lines files have
+one object per line; nested objects and lists of objects are flattened to
+match ``FormField`` and ``FieldList`` names. Rows with an ``id`` column
+replace the entity with that id rather than creating a new one.
+"""
+
+import csv
+import json
+import time
+import logging
+
+import flask
+import wtforms
+from werkzeug import parse_options_header
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb, blobstore
+
+from . import signals
+from .edit import FormView
+from .util.forms import BaseCSRFForm, formdata, plain_errors, text
+from .util.ndb import instance_and_ancestors_async
+from .util.changes import kind_generations, entity_stamps
+
+logger = logging.getLogger(__name__)
+
+
+FORMATS = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.json': 'jsonl',
+    '.ndjson': 'jsonl',
+}
+
+
+class ImportJob(ndb.Model):
+    """
+    The progress of an import.
+    """
+    path = ndb.StringProperty()
+    action = ndb.StringProperty()
+    ancestor = ndb.KeyProperty(indexed=False)
+
+    blob_key = ndb.BlobKeyProperty(indexed=False)
+    filename = ndb.StringProperty(indexed=False)
+    format = ndb.StringProperty(indexed=False)
+    size = ndb.IntegerProperty(indexed=False)
+
+    #: CSV column names, read from the header row.
+    fieldnames = ndb.StringProperty(repeated=True, indexed=False)
+
+    #: Rows before this one (counting from 1) are skipped.
+    start_row = ndb.IntegerProperty(default=1, indexed=False)
+
+    status = ndb.StringProperty(default='pending')
+
+    #: Bumped each time the import is resumed, so its tasks get new names.
+    attempt = ndb.IntegerProperty(default=0, indexed=False)
+
+    #: Rows read, and the byte offset of the next one.
+    row = ndb.IntegerProperty(default=0, indexed=False)
+    position = ndb.IntegerProperty(default=0, indexed=False)
+
+    imported = ndb.IntegerProperty(default=0, indexed=False)
+    error_count = ndb.IntegerProperty(default=0, indexed=False)
+
+    #: ``[row, errors]`` pairs, for the first ``max_errors`` invalid rows.
+    errors = ndb.JsonProperty(default=[], compressed=True)
+
+    created = ndb.DateTimeProperty(auto_now_add=True)
+    updated = ndb.DateTimeProperty(auto_now=True, indexed=False)
+
+    @classmethod
+    def _get_kind(cls):
+        return 'KibbleImportJob'
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    @property
+    def progress(self):
+        """
+        Percentage of the file read.
+        """
+        if self.status == 'done':
+            return 100
+        if not self.size:
+            return 0
+        return min(100, 100 * self.position // self.size)
+
+    def add_error(self, row, errors, max_errors=1000):
+        self.error_count += 1
+        if len(self.errors) < max_errors:
+            # Don't append, the default list is shared.
+            self.errors = self.errors + [[row, plain_errors(errors)]]
+
+
+def read_csv_header(stream):
+    return [text(name).strip()
+            for name in next(csv.reader([stream.readline()]), [])]
+
+
+def read_rows(stream, format, fieldnames=None):
+    """
+    Read rows from ``stream``, from its current position.
+
+    :returns: Iterator of ``(row, error, position)``, where ``row`` is a
+        dictionary or ``None`` if the row couldn't be read, and
+        ``position`` is the offset of the following row.
+    """
+    lines = iter(stream.readline, '')
+
+    if format == 'csv':
+        for values in csv.reader(lines):
+            position = stream.tell()
+            if not values:
+                continue
+            if len(values) != len(fieldnames):
+                yield None, "Expected %d columns, found %d." % (
+                    len(fieldnames), len(values)), position
+            else:
+                yield dict(zip(fieldnames, map(text, values))), None, \
+                    position
+        return
+
+    for line in lines:
+        position = stream.tell()
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield None, "Invalid JSON: %s" % e, position
+            continue
+        if not isinstance(row, dict):
+            yield None, "Expected a JSON object.", position
+        else:
+            yield row, None, position
+
+
+class ImportUploadForm(BaseCSRFForm):
+    file = wtforms.FileField('File')
+    format = wtforms.SelectField('Format', choices=[
+        ('', 'From the file name'),
+        ('csv', 'CSV'),
+        ('jsonl', 'JSON lines'),
+    ], default='')
+    start_row = wtforms.IntegerField(
+        'Start at row', default=1,
+        validators=[wtforms.validators.NumberRange(min=1)])
+
+
+def import_run():
+    """
+    Task queue endpoint that continues an import.
+    """
+    # App Engine strips this header from requests that don't come from the
+    # task queue.
+    if 'X-AppEngine-QueueName' not in flask.request.headers:
+        flask.abort(403)
+
+    job = ImportJob.get_by_id(int(flask.request.form['job']))
+    if job is None or job.finished:
+        return ''
+
+    try:
+        view = flask.g.kibble.registry[job.path][job.action]
+    except KeyError:
+        logger.error("No import view for %s:%s", job.path, job.action)
+        job.status = 'failed'
+        job.put()
+        return ''
+
+    getattr(view, 'view_class', view)().run_task(job)
+    return ''
+
+
+class Import(FormView):
+    #: View name
+    action = 'import'
+
+    button_icon = 'import'
+
+    _url_patterns = [
+        ('/{kind_lower}/import/', {'ancestor_key': None}),
+        ('/{ancestor_key}/{kind_lower}/import/', {}),
+    ]
+    _requires_instance = False
+
+    #: Number of valid rows written per ``put_multi``.
+    batch_size = 200
+
+    #: Seconds each task imports for before handing over to the next.
+    task_time = 480
+
+    #: The task queue to import on.
+    queue_name = 'default'
+
+    #: Invalid rows beyond this number are counted, but their errors aren't
+    #: kept.
+    max_errors = 1000
+
+    @classmethod
+    def prefetch(cls, ancestor_key=None, **view_args):
+        if ancestor_key is None:
+            return {}
+        return {'ancestors': instance_and_ancestors_async(ancestor_key)}
+
+    def get_import_form_class(self):
+        """
+        The form class rows are validated with. The view's form, without
+        CSRF protection.
+        """
+        formcls = self.get_form_class()
+
+        class Meta:
+            csrf = False
+
+        return type('Import' + formcls.__name__, (formcls,), {'Meta': Meta})
+
+    def open_file(self, job):
+        """
+        Open the uploaded file. Must return a seekable file-like object.
+        """
+        return blobstore.BlobReader(job.blob_key, buffer_size=1024 * 1024)
+
+    def build_instance(self, form, row, job):
+        """
+        Create the instance for a valid row.
+        """
+        id = row.get('id')
+        if isinstance(id, basestring):
+            id = int(id) if id.isdigit() else (id or None)
+
+        inst = self.model(id=id, parent=job.ancestor)
+        form.populate_obj(inst)
+        return inst
+
+    def run_job(self, job, deadline=None):
+        """
+        Import rows from where ``job`` left off, until the file ends or
+        ``deadline`` passes. ``job`` is saved after every batch.
+
+        :param deadline: A :py:func:`time.time` value.
+        :returns: ``True`` if the file was finished.
+        """
+        formcls = self.get_import_form_class()
+        stream = self.open_file(job)
+        stream.seek(job.position)
+
+        if job.format == 'csv' and not job.fieldnames:
+            job.fieldnames = read_csv_header(stream)
+            job.position = stream.tell()
+
+        batch = []
+        pending = 0
+
+        for row, error, position in read_rows(
+                stream, job.format, job.fieldnames):
+            job.row += 1
+            pending += 1
+
+            if job.row >= job.start_row:
+                if row is not None:
+                    form = formcls(formdata(row))
+                    if form.validate():
+                        batch.append(self.build_instance(form, row, job))
+                    else:
+                        error = form.errors
+                if error is not None:
+                    job.add_error(job.row, error, self.max_errors)
+
+            if len(batch) >= self.batch_size or pending >= self.batch_size:
+                self._write_batch(job, batch, position)
+                batch = []
+                pending = 0
+
+                if deadline is not None and time.time() > deadline:
+                    return False
+
+        self._write_batch(job, batch, stream.tell())
+        return True
+
+    def _write_batch(self, job, instances, position):
+        if instances:
+            signals.pre_action.send(
+                self.action,
+                view_class=self.__class__,
+                instances=instances)
+
+            # Rows with ids replace existing entities.
+            replaced = [inst for inst in instances
+                        if inst._has_complete_key()]
+
+            keys = ndb.put_multi(instances)
+
+            kind_generations.bump(self.kind())
+            if replaced:
+                entity_stamps.bump_multi(
+                    [inst.key.urlsafe() for inst in replaced])
+
+            signals.post_action.send(
+                self.action,
+                view_class=self.__class__,
+                keys=keys,
+                instances=instances)
+
+        job.imported += len(instances)
+        job.position = position
+        job.put()
+
+    def run_task(self, job):
+        """
+        Import for up to :attr:`task_time` seconds, then queue the rest.
+        """
+        job.status = 'running'
+        try:
+            finished = self.run_job(job, time.time() + self.task_time)
+        except Exception:
+            logger.exception("Import %s failed at row %d.",
+                             job.key.id(), job.row)
+            # Go back to the last batch written, so a resume starts from
+            # the right row.
+            job = job.key.get(use_cache=False, use_memcache=False) or job
+            job.status = 'failed'
+            job.put()
+            return
+
+        if finished:
+            job.status = 'done'
+            job.put()
+        else:
+            self.queue_job(job)
+
+    def queue_job(self, job):
+        """
+        Queue a task to continue ``job``.
+        """
+        try:
+            taskqueue.add(
+                url=flask.url_for('.import_run'),
+                params={'job': job.key.id()},
+                queue_name=self.queue_name,
+                name='kibble-import-%d-%d-%d' % (
+                    job.key.id(), job.attempt, job.row))
+        except (taskqueue.TaskAlreadyExistsError,
+                taskqueue.TombstonedTaskError):
+            pass
+
+    def _job_url(self, job, ancestor_key=None):
+        return self.url_for(None, ancestor_key, blueprint=flask.g.kibble.name,
+                            job=job.key.id())
+
+    def _create_job(self, form, ancestor_key=None):
+        upload = flask.request.files.get('file')
+        if upload is None:
+            return None, "Choose a file to import."
+
+        options = parse_options_header(upload.content_type)[1]
+        if 'blob-key' not in options:
+            return None, "The file wasn't uploaded."
+
+        blob_key = blobstore.BlobKey(options['blob-key'])
+        blob_info = blobstore.BlobInfo.get(blob_key)
+
+        extension = '.' + upload.filename.rsplit('.', 1)[-1].lower()
+        format = form.format.data or FORMATS.get(extension)
+        if format is None:
+            return None, "Unknown file type, choose a format."
+
+        job = ImportJob(
+            path=self.path(),
+            action=self.action,
+            ancestor=ancestor_key,
+            blob_key=blob_key,
+            filename=upload.filename,
+            format=format,
+            size=blob_info.size if blob_info else None,
+            start_row=form.start_row.data)
+        job.put()
+        return job, None
+
+    def dispatch_request(self, ancestor_key=None):
+        ancestors = self.prefetched('ancestors')
+        if ancestors is None and ancestor_key:
+            ancestors = instance_and_ancestors_async(ancestor_key)
+
+        form = ImportUploadForm(flask.request.form)
+        error = None
+
+        if flask.request.method == 'POST' and form.validate():
+            if 'resume' in flask.request.form:
+                job = ImportJob.get_by_id(int(flask.request.form['resume']))
+                if job is None or job.path != self.path() \
+                        or job.ancestor != ancestor_key:
+                    flask.abort(404)
+                if job.status != 'failed':
+                    flask.abort(400)
+                job.status = 'pending'
+                job.attempt += 1
+                job.put()
+            else:
+                job, error = self._create_job(form, ancestor_key)
+
+            if job is not None:
+                self.queue_job(job)
+                return flask.redirect(self._job_url(job, ancestor_key))
+
+        ctx = self.base_context()
+        ctx['form'] = form
+        ctx['error'] = error
+        ctx['upload_url'] = blobstore.create_upload_url(
+            flask.request.path,
+            gs_bucket_name=flask.g.kibble.gcs_bucket)
+        ctx['ancestors'] = (ancestors.get_result()
+                            if ancestors is not None
+                            else [])
+
+        job_id = flask.request.args.get('job', type=int)
+        if job_id:
+            ctx['job'] = ImportJob.get_by_id(job_id)
+        else:
+            ctx['jobs'] = ImportJob.query(ImportJob.path == self.path())\
+                .order(-ImportJob.created).fetch(50)
+
+        return flask.render_template(self.templates, **ctx)
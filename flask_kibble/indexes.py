@@ -0,0 +1,260 @@
+"""
+Composite index advisor.
+========================
+
+Works out the composite indexes the registered :class:`~flask_kibble.List`
+views need, from their declared filters, sort columns and ancestors, so
+they can be added to ``index.yaml`` before anyone hits a missing index ::
+
+    from flask_kibble import indexes
+    indexes.write_index_yaml('index.yaml', admin)
+
+Queries that still fail with a ``NeedIndexError`` at runtime are recorded in
+:attr:`Kibble.missing_indexes <flask_kibble.Kibble.missing_indexes>`, along
+with the index definition they need.
+"""
+import logging
+import itertools
+from collections import namedtuple
+
+from .list import List
+from .importer import Import, ImportJob
+from .query_composers import (UnboundComposer, Sort, Filter, SORT_ASC,
+                              SORT_DESC)
+from .util.cache import LRUCache
+from .util.query_stats import query_shape
+
+
+logger = logging.getLogger(__name__)
+
+
+class Index(namedtuple('Index', ['kind', 'ancestor', 'properties'])):
+    """
+    A composite index definition.
+
+    :param kind: The kind indexed.
+    :param ancestor: ``True`` if the index includes the ancestor.
+    :param properties: Tuple of ``(property, '+'|'-')`` pairs.
+    """
+
+    def to_yaml(self):
+        """
+        The ``index.yaml`` entry for this index.
+        """
+        lines = ['- kind: %s' % self.kind]
+        if self.ancestor:
+            lines.append('  ancestor: yes')
+        lines.append('  properties:')
+        for name, direction in self.properties:
+            lines.append('  - name: %s' % name)
+            if direction == '-':
+                lines.append('    direction: desc')
+        return '\n'.join(lines)
+
+
+def index_for_shape(shape):
+    """
+    The composite index needed to run a query.
+
+    :param shape: A :class:`~flask_kibble.util.query_stats.QueryShape`.
+    :returns: An :class:`Index`, or ``None`` if the built-in indexes are
+        enough.
+    """
+    equality = list(shape.equality)
+
+    # Ordering on a property that's filtered for equality does nothing.
+    orders = [(p, d) for p, d in shape.orders if p not in equality]
+
+    # The inequality property has to be the first sort order.
+    inequality = [p for p, _ in shape.inequality]
+    if inequality and (not orders or orders[0][0] != inequality[0]):
+        orders = [(inequality[0], '+')] + [
+            o for o in orders if o[0] != inequality[0]]
+
+    if not orders:
+        # Kind, ancestor and equality only queries use the built-in
+        # indexes.
+        return None
+
+    if not equality and not shape.ancestor and len(orders) == 1:
+        # Single property indexes.
+        return None
+
+    return Index(
+        shape.kind, shape.ancestor,
+        tuple([(p, '+') for p in equality] + orders))
+
+
+def _base_shape(view_class):
+    try:
+        query = view_class().get_query()
+    except Exception:
+        query = view_class.model.query()
+    return query_shape(query)
+
+
+def _composer_args(view_class, composer):
+    """
+    The constructor arguments of each ``composer`` the view uses.
+    """
+    for c in view_class.query_composers:
+        if isinstance(c, UnboundComposer):
+            cls, args = c._cls, c._args
+        else:
+            cls, args = c, ()
+        if isinstance(cls, type) and issubclass(cls, composer):
+            yield args
+
+
+def _sort_options(view_class):
+    columns = []
+    if list(_composer_args(view_class, Sort)):
+        columns = list(getattr(view_class, 'sort_columns', ()))
+
+    options = [((c.field, d),) for c in columns
+               for d in (SORT_ASC, SORT_DESC)]
+    if not any(c.default for c in columns):
+        options.append(())
+    return options
+
+
+def _filter_options(view_class):
+    filters = []
+    for args in _composer_args(view_class, Filter):
+        filters.extend(args or getattr(view_class, 'filter_filters', ()))
+
+    # Each filter is either unused, or one of the ways it can filter.
+    return itertools.product(*[
+        [()] + f.index_filters(view_class.model) for f in filters])
+
+
+def view_indexes(view_class):
+    """
+    Every composite index a :class:`~flask_kibble.List` view can need.
+
+    :param view_class: The :class:`~flask_kibble.List` subclass.
+    :returns: A set of :class:`Index` instances.
+    """
+    base = _base_shape(view_class)
+    ancestors = [False, True] if view_class.ancestors else [base.ancestor]
+
+    indexes = set()
+    for ancestor, orders, filters in itertools.product(
+            ancestors,
+            _sort_options(view_class),
+            list(_filter_options(view_class))):
+
+        equality = set(base.equality)
+        inequality = set(base.inequality)
+        for field, op in itertools.chain(*filters):
+            if op == '=':
+                equality.add(field)
+            else:
+                inequality.add((field, op))
+
+        index = index_for_shape(base._replace(
+            ancestor=ancestor,
+            equality=tuple(sorted(equality)),
+            inequality=tuple(sorted(inequality)),
+            orders=base.orders + orders))
+        if index is not None:
+            indexes.add(index)
+    return indexes
+
+
+#: Lists the jobs of an :class:`~flask_kibble.Import` view.
+IMPORT_JOB_INDEX = Index(
+    kind=ImportJob._get_kind(),
+    ancestor=False,
+    properties=(('path', '+'), ('created', '-')))
+
+
+def kibble_indexes(kibble):
+    """
+    Every composite index the :class:`~flask_kibble.List` and
+    :class:`~flask_kibble.Import` views registered with ``kibble`` can need.
+
+    :returns: A sorted list of :class:`Index` instances.
+    """
+    indexes = set()
+    for actions in kibble.registry.values():
+        for view in actions.values():
+            view_class = getattr(view, 'view_class', view)
+            if issubclass(view_class, List):
+                indexes.update(view_indexes(view_class))
+            elif issubclass(view_class, Import):
+                indexes.add(IMPORT_JOB_INDEX)
+    return sorted(indexes)
+
+
+def index_yaml(indexes):
+    """
+    Render ``indexes`` as an ``index.yaml`` document.
+    """
+    return 'indexes:\n\n' + '\n\n'.join(i.to_yaml() for i in indexes) + '\n'
+
+
+def write_index_yaml(filename, kibble):
+    """
+    Write the indexes needed by ``kibble``'s views to ``filename``.
+    """
+    with open(filename, 'w') as f:
+        f.write(index_yaml(kibble_indexes(kibble)))
+
+
+class MissingIndex(object):
+    """
+    A query that failed at runtime with a ``NeedIndexError``.
+    """
+    def __init__(self, shape, index, error):
+        self.shape = shape
+        self.index = index
+        self.error = error
+        self.count = 0
+
+
+class MissingIndexLog(object):
+    """
+    Bounded record of the indexes queries were missing at runtime.
+
+    :param max_size: The maximum number of query shapes to remember.
+    """
+    def __init__(self, max_size=100):
+        self._missing = LRUCache(max_size)
+
+    def __len__(self):
+        return len(self._missing)
+
+    def __iter__(self):
+        return iter(sorted((m for _, m in self._missing.items()),
+                           key=lambda m: m.count, reverse=True))
+
+    def record(self, shape, error=None):
+        """
+        Record ``shape`` failing with ``error``.
+
+        :returns: The :class:`Index` the query needs, if it can be worked
+            out.
+        """
+        # Pages of the same query need the same index.
+        shape = shape._replace(limit=None, offset=None)
+
+        missing = self._missing.get(shape)
+        if missing is None:
+            missing = MissingIndex(shape, index_for_shape(shape),
+                                   unicode(error) if error else None)
+            self._missing.set(shape, missing)
+
+            logger.warning(
+                "Missing index for query %s:\n%s", shape,
+                missing.index.to_yaml() if missing.index else missing.error)
+
+        missing.count += 1
+        return missing.index
+
+    def yaml(self):
+        """
+        The ``index.yaml`` entries for all recorded indexes.
+        """
+        return index_yaml(sorted(set(
+            m.index for m in self if m.index is not None)))
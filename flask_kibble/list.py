@@ -1,3 +1,8 @@
+import time
+import logging
+import functools
+from collections import OrderedDict
+from hashlib import sha1
 from datetime import date, datetime
 
 import flask
@@ -6,27 +11,153 @@ from markupsafe import Markup
 
 from google.appengine.ext import ndb
 from google.appengine.api.datastore_errors import NeedIndexError
+from google.net.proto.ProtocolBuffer import ProtocolBufferDecodeError
 
 from .base import KibbleView
-from . import query_composers
+from . import query_composers, signals
+from .util.forms import BaseCSRFForm, formdata, plain_errors, validate_fields
 from .util.futures import wait_futures
-from .util.ndb import instance_and_ancestors_async
+from .util.ndb import (instance_and_ancestors_async, snapshot_properties,
+                       changed_properties, is_descendant)
+from .util.query_stats import query_shape
+from .util.in_memory import fetch_in_memory_async
+from .util.changes import kind_generations, entity_changed, ALL_KINDS
+
+
+logger = logging.getLogger(__name__)
+
+
+def _resolved(value):
+    future = ndb.Future()
+    future.set_result(value)
+    return future
 
 
 class Table(object):
-    def __init__(self, kibble_view, query, query_params):
+    """
+    :param kibble_view: The :class:`List` view.
+    :param query: The query to list.
+    :param query_params: Keyword arguments for running the query.
+    :param in_memory_limit: If set, run the query without a composite index
+        by filtering and sorting up to this many entities in memory.
+    :param keys: If set, list the entities with these keys rather than
+        running the query. Used for cached results.
+    """
+
+    #: The :class:`~flask_kibble.util.query_stats.QueryShape` of the query.
+    shape = None
+
+    #: The :data:`~flask_kibble.util.in_memory.InMemoryResult` future when
+    #: the query is run in memory.
+    _in_memory = None
+
+    def __init__(self, kibble_view, query, query_params,
+                 in_memory_limit=None, keys=None):
         self.kibble_view = kibble_view
 
-        self._rows = query.map_async(self._map, **query_params)
+        self._rows = self._fetch(query, query_params, in_memory_limit, keys)
+
+    def _fetch(self, query, query_params, in_memory_limit=None, keys=None):
+        """
+        Run the query, recording its shape and how long it took to fetch, not
+        including mapping the rows, in the Kibble instance's
+        :attr:`~flask_kibble.Kibble.query_stats`.
+        """
+        self.query = query
+        self.query_params = query_params
+        self.in_memory_limit = in_memory_limit
+        self.cached = keys is not None
+
+        if self.cached:
+            return self._map_keys(keys)
+
+        start = time.time()
+        if in_memory_limit:
+            fetched = self._in_memory = fetch_in_memory_async(
+                query,
+                limit=query_params.get('limit'),
+                offset=query_params.get('offset'),
+                max_entities=in_memory_limit)
+            rows = self._map_in_memory()
+        else:
+            fetched = query.fetch_async(**query_params)
+            rows = self._map_entities(fetched)
+
+        shape = self.shape = query_shape(
+            query,
+            limit=query_params.get('limit'),
+            offset=query_params.get('offset'))
+
+        kibble = getattr(flask.g, 'kibble', None)
+        if kibble is None:
+            return rows
+
+        slow = flask.current_app.config.get('KIBBLE_SLOW_QUERY_MS', 1000)
+
+        def _done():
+            if fetched.get_exception() is not None:
+                return
+            duration = time.time() - start
+            result = fetched.get_result()
+            kibble.query_stats.record(
+                shape, duration,
+                len(result.entities if in_memory_limit else result))
+            if slow is not None and duration * 1000 >= slow:
+                logger.warning("Slow query (%.0fms): %s",
+                               duration * 1000, shape)
+
+        fetched.add_immediate_callback(_done)
+        return rows
+
+    @ndb.tasklet
+    def _map_entities(self, entities):
+        entities = yield entities
+        rows = yield [self._map(e) for e in entities if e is not None]
+        raise ndb.Return(rows)
+
+    def _map_keys(self, keys):
+        return self._map_entities(ndb.get_multi_async(keys))
+
+    @ndb.tasklet
+    def _map_in_memory(self):
+        result = yield self._in_memory
+        rows = yield [self._map(e) for e in result.entities]
+        raise ndb.Return(rows)
+
+    @property
+    def in_memory(self):
+        """
+        Was the query run in memory?
+        """
+        return self._in_memory is not None
+
+    @property
+    def truncated(self):
+        """
+        Were there more entities than could be considered in memory?
+        """
+        return self.in_memory and self._in_memory.get_result().truncated
+
+    @ndb.tasklet
+    def total_async(self):
+        """
+        Number of entities matching an in memory query.
+        """
+        result = yield self._in_memory
+        raise ndb.Return(result.total)
 
     @property
     def row_count(self):
         return len(self._rows.get_result())
 
+    @cached_property
+    def columns(self):
+        return list(self.kibble_view.list_display)
+
     @cached_property
     def headers(self):
         headers = []
-        for attr_name in self.kibble_view.list_display:
+        for attr_name in self.columns:
             if callable(attr_name):
                 attr_name = attr_name.__name__
             headers.append((
@@ -74,7 +205,72 @@ class Table(object):
             yield row
 
 
+class PolyTable(Table):
+    """
+    Table for lists of :py:class:`~google.appengine.ext.ndb.polymodel.PolyModel`
+    instances, where the columns can differ per subclass. See
+    :py:attr:`List.subclass_list_display`.
+
+    Columns are resolved once per subclass rather than once per row.
+    """
+    @cached_property
+    def columns(self):
+        columns = list(self.kibble_view.list_display)
+        for display in self.kibble_view.subclass_list_display.values():
+            for attr_name in display:
+                if attr_name not in columns:
+                    columns.append(attr_name)
+        return columns
+
+    @cached_property
+    def _getters(self):
+        return {}
+
+    def _getter(self, model, attr_name):
+        if callable(attr_name):
+            return lambda instance: attr_name(instance)
+
+        elif hasattr(model, attr_name):
+            def _get(instance):
+                attr = getattr(instance, attr_name)
+                return attr() if callable(attr) else attr
+            return _get
+
+        elif hasattr(self.kibble_view, attr_name):
+            attr = getattr(self.kibble_view, attr_name)
+            if callable(attr):
+                return attr
+            return lambda instance: attr
+
+        return lambda instance: attr_name
+
+    def _getters_for(self, model):
+        try:
+            return self._getters[model]
+        except KeyError:
+            pass
+
+        display = self.kibble_view._list_display_for(model)
+        getters = []
+        for attr_name in self.columns:
+            if attr_name in display:
+                getters.append(self._getter(model, attr_name))
+            else:
+                getters.append(lambda instance: None)
+
+        self._getters[model] = getters
+        return getters
+
+    @ndb.tasklet
+    def _map(self, instance):
+        getters = self._getters_for(instance.__class__)
+        retval = yield wait_futures([g(instance) for g in getters])
+        raise ndb.Return((instance, retval))
+
+
 class MissingIndexTable(Table):
+    shape = None
+
     def __init__(self, kibble_view, query, query_params):
         self.kibble_view = kibble_view
 
@@ -97,6 +293,13 @@ class List(KibbleView):
     #:    argument.
     list_display = (unicode,)
 
+    #: For lists of :py:class:`~google.appengine.ext.ndb.polymodel.PolyModel`
+    #: instances, columns to display per subclass. A dictionary of subclass
+    #: (or class name) to columns in the same format as ``list_display``.
+    #: Subclasses without an entry use ``list_display``, and the table
+    #: shows the union of all the columns.
+    subclass_list_display = {}
+
     #: Link to the object in the first column.
     link_first = True
 
@@ -109,6 +312,49 @@ class List(KibbleView):
         query_composers.Paginator,
     ]
 
+    #: When a sort/filter combination is missing its composite index, filter
+    #: and sort up to this many entities in memory instead. ``None`` uses
+    #: the ``KIBBLE_IN_MEMORY_LIMIT`` application setting, and ``0`` (the
+    #: default for both) shows the missing index page.
+    in_memory_limit = None
+
+    #: Cache the keys and total count of each page, per user permissions.
+    #: Creating, editing or running an operation on this kind through Kibble
+    #: invalidates the cached pages.
+    #:
+    #: Needs an authenticator whose
+    #: :meth:`~flask_kibble.Authenticator.permission_fingerprint` doesn't
+    #: return ``None``, otherwise nothing is cached. The generations the
+    #: cache key is built from cost a memcache call, made for each of the
+    #: ETag, the cached page and :attr:`coalesce_queries` that are in use.
+    #: Only writes to this kind change the key, so columns showing other
+    #: entities (e.g. through a ``KeyProperty``) and the ancestors in the
+    #: breadcrumbs can be stale for up to :attr:`cache_time`.
+    cache_results = False
+
+    #: Maximum age of cached results in seconds. Limits how stale a page can
+    #: get from writes made outside of Kibble.
+    cache_time = 60
+
+    #: Share the results of identical list queries running at the same time,
+    #: within and across instances, so auto-refreshing dashboards don't
+    #: repeat the same query and count. Coalesced queries are run for keys,
+    #: and the entities fetched by key.
+    coalesce_queries = False
+
+    #: Columns that can be edited in place. Each must be a model property
+    #: in ``list_display`` with a field on the kind's edit form. Edited cells
+    #: are saved together with a ``PATCH`` to the list's URL, which is only
+    #: routed when this is set.
+    inline_edit = ()
+
+    #: The most cells that can be saved in one request.
+    max_inline_edits = 100
+
+    #: Seconds an ETag stays valid for when cells can be edited inline, so
+    #: cached pages don't outlive their CSRF tokens.
+    etag_lifetime = 600
+
     button_icon = 'list'
 
     _url_patterns = [
@@ -119,6 +365,12 @@ class List(KibbleView):
     ]
     _requires_instance = False
 
+    @classmethod
+    def http_methods(cls):
+        if cls.inline_edit:
+            return cls._methods + ['PATCH']
+        return cls._methods
+
     def get_query(self, ancestor_key=None):
         """
         :returns: Base query for list.
@@ -153,13 +405,151 @@ class List(KibbleView):
 
         return value
 
+    def _list_display_for(self, model):
+        """
+        The columns shown for instances of ``model``: those of the most
+        specific subclass in :attr:`subclass_list_display`, or
+        :attr:`list_display`.
+        """
+        if self.subclass_list_display:
+            by_class_name = dict(
+                (cls if isinstance(cls, basestring) else cls._class_name(),
+                 display)
+                for cls, display in self.subclass_list_display.iteritems())
+            for class_name in reversed(model._class_key()):
+                if class_name in by_class_name:
+                    return by_class_name[class_name]
+        return self.list_display
+
+    def _inline_value(self, instance, name):
+        """
+        The value of the ``name`` property of ``instance`` as form data, for
+        starting an inline edit.
+        """
+        value = getattr(instance, name, None)
+        if value is None or value is False:
+            return u''
+        if value is True:
+            return u'y'
+        return unicode(value)
+
+    def _inline_input_type(self, name):
+        """
+        The type of input to edit the ``name`` property with.
+        """
+        if isinstance(getattr(self.model, name, None), ndb.BooleanProperty):
+            return 'checkbox'
+        return 'text'
+
+    @classmethod
+    def prefetch(cls, ancestor_key=None, **view_args):
+        if ancestor_key is None:
+            return {}
+        return {'ancestors': instance_and_ancestors_async(ancestor_key)}
+
+    @classmethod
+    def _get_result_key(cls, name, page, ancestor_key, *parts):
+        """
+        A key for the current page's results, which changes when the kind is
+        written to through Kibble. ``None`` if one can't be made.
+
+        :param parts: Any extra values the key depends on.
+        """
+        kind = cls.kind()
+        generations = kind_generations.get(kind, ALL_KINDS)
+        if None in generations.values():
+            return None
+
+        return flask.g.kibble.fragment_key(
+            name,
+            cls.path(),
+            ancestor_key.urlsafe() if ancestor_key else '',
+            page,
+            sorted(flask.request.args.iteritems(multi=True)),
+            generations[kind],
+            generations[ALL_KINDS],
+            *parts)
+
+    @classmethod
+    def etag(cls, page=1, ancestor_key=None, **view_args):
+        if not cls.inline_edit:
+            return cls._get_result_key('list-etag', page, ancestor_key)
+        return cls._get_result_key(
+            'list-etag', page, ancestor_key,
+            flask.session.get('csrf', ''),
+            int(time.time() // cls.etag_lifetime))
+
+    def _get_cached_keys(self, page, ancestor_key):
+        """
+        Look the current page up in the result cache.
+
+        :returns: A tuple of the cached keys and total, or ``(None,
+            None)``.
+        """
+        self._result_cache_key = None
+        if not self.cache_results:
+            return None, None
+
+        key = self._result_cache_key = \
+            self._get_result_key('list-results', page, ancestor_key)
+        cached = flask.g.kibble.result_cache.get(key) if key else None
+        if cached is None:
+            return None, None
+
+        keys, total, stored = cached
+        if time.time() - stored > self.cache_time:
+            return None, None
+        return keys, total
+
+    def _get_coalesced_keys(self, query, query_params, count):
+        """
+        Run the query for keys, sharing the result with identical queries
+        running concurrently. See :attr:`coalesce_queries`.
+
+        :returns: A tuple of the keys and total, or ``(None, None)``.
+        """
+        params = dict(query_params, keys_only=True)
+        # Shared results are kept briefly, so a write through Kibble must
+        # change the key.
+        kind = self.kind()
+        generations = kind_generations.get(kind, ALL_KINDS)
+        key = sha1(repr((
+            query.app, query.namespace, query,
+            sorted(params.items()), count,
+            generations[kind], generations[ALL_KINDS]))).hexdigest()
+
+        def _run():
+            keys = query.fetch_async(**params)
+            total = query.count_async() if count else None
+            return keys.get_result(), total.get_result() if total else None
+
+        try:
+            return flask.g.kibble.query_flights.do(key, _run)
+        except NeedIndexError:
+            # Leave it to dispatch_request.
+            return None, None
+
+    def _cache_results(self, context):
+        """
+        Store the page just rendered in the result cache.
+        """
+        table = context['table']
+        if not self._result_cache_key or table.cached or table.in_memory:
+            return
+
+        paginator = context.get('paginator')
+        flask.g.kibble.result_cache.set(self._result_cache_key, (
+            [instance.key for instance, _ in table],
+            paginator.total_objects if paginator else None,
+            time.time()))
+
     def _get_context(self, page, ancestor_key):
         context = self.base_context()
-        if ancestor_key:
+        ancestors = self.prefetched('ancestors')
+        if ancestors is None and ancestor_key:
             ancestors = instance_and_ancestors_async(ancestor_key)
-        else:
-            ancestors = None
-            # ancestor = None
+
+        keys, total = self._get_cached_keys(page, ancestor_key)
 
         query = self.get_query(ancestor_key)
         query_params = {}
@@ -173,26 +563,237 @@ class List(KibbleView):
             query = composer.get_query()
             query_params.update(composer.get_query_params())
 
-        context['table'] = Table(self, query, query_params)
+        paginator = context.get('paginator')
+        if keys is None and self.coalesce_queries:
+            keys, total = self._get_coalesced_keys(
+                query, query_params, paginator is not None)
+
+        if paginator is not None:
+            if total is not None:
+                paginator.use_total(_resolved(total))
+            else:
+                paginator.count_async()
+
+        table_cls = PolyTable if self.subclass_list_display else Table
+        if keys is None:
+            context['table'] = table_cls(self, query, query_params)
+        else:
+            context['table'] = table_cls(self, query, query_params, keys=keys)
         context['ancestor_key'] = ancestor_key
         context['ancestors'] = ancestors.get_result() if ancestors else None
         context['display_val'] = self._display_value
+        context['inline_csrf_token'] = self._inline_csrf_token()
+        return context
+
+    def get_inline_form_class(self):
+        """
+        The form inline edits are validated with. By default the form of the
+        kind's ``edit`` view, or one generated from the model if there isn't
+        one.
+        """
+        edit = flask.g.kibble.registry.get(self.path(), {}).get('edit')
+        if edit is not None:
+            return getattr(edit, 'view_class', edit)().get_form_class()
+        return flask.g.kibble.model_converter.model_form(
+            self.model,
+            base_class=BaseCSRFForm,
+            only=list(self.inline_edit))
+
+    def _inline_csrf_token(self):
+        if not self.inline_edit:
+            return None
+        form = self.get_inline_form_class()()
+        if 'csrf_token' not in form._fields:
+            return None
+        return form.csrf_token.current_token
+
+    def _get_inline_edits(self, ancestor_key=None):
+        """
+        The edits in the request body, grouped by entity.
+
+        :param ancestor_key: If set, only its descendants can be edited.
+
+        :returns: Ordered dictionary of key to a dictionary of field name to
+            value.
+        """
+        payload = flask.request.get_json(silent=True)
+        if not isinstance(payload, dict) \
+                or not isinstance(payload.get('edits'), list) \
+                or len(payload['edits']) > self.max_inline_edits:
+            flask.abort(400)
+
+        edits = OrderedDict()
+        for edit in payload['edits']:
+            try:
+                key = ndb.Key(urlsafe=edit['key'])
+                field = edit['field']
+            except (KeyError, TypeError, ProtocolBufferDecodeError):
+                flask.abort(400)
+            if key.kind() != self.model._get_kind() \
+                    or field not in self.inline_edit:
+                flask.abort(400)
+            if ancestor_key is not None \
+                    and not is_descendant(key, ancestor_key):
+                flask.abort(400)
+            edits.setdefault(key, {})[field] = edit.get('value')
+        return edits, payload.get('csrf_token')
+
+    @ndb.tasklet
+    def _inline_save(self, key, form, fields):
+        instance = yield key.get_async()
+        if instance is None:
+            raise ndb.Return((None, []))
+
+        before = snapshot_properties(instance)
+        for name in fields:
+            form[name].populate_obj(instance, name)
+
+        changed = changed_properties(instance, before)
+        if changed:
+            yield instance.put_async()
+        raise ndb.Return((instance, changed))
+
+    def _inline_cell(self, instance, field):
+        """
+        The new HTML for the cell showing ``field`` of ``instance``, or
+        ``None`` if the list doesn't show it.
+        """
+        if field not in self._list_display_for(type(instance)):
+            return None
+
+        # Inline edited columns are model properties.
+        value = self._display_value(getattr(instance, field))
+        return unicode(Markup.escape(value))
+
+    def inline_edit_request(self, ancestor_key=None):
+        """
+        Save the cells edited in place. The request body is JSON ::
+
+            {"csrf_token": "...",
+             "edits": [{"key": "<urlsafe key>", "field": "name",
+                        "value": "New name"}, ...]}
+
+        Only the edited fields are validated, and each entity is written in
+        its own transaction, and only if it changed.
+        """
+        edits, csrf_token = self._get_inline_edits(ancestor_key)
+        auth = flask.g.kibble.auth
+        for key in edits:
+            if not auth.has_permission_for(self.model, 'edit', key=key):
+                flask.abort(403)
+
+        formcls = self.get_inline_form_class()
+        cells = []
+        errors = []
+        saves = []
+        for key, values in edits.iteritems():
+            data = dict(values, csrf_token=csrf_token)
+            form = formcls(formdata(data))
+            fields = [name for name in values if name in form._fields]
+            if len(fields) != len(values):
+                flask.abort(400)
+
+            if not validate_fields(form, fields):
+                for name, field_errors in plain_errors(form.errors).items():
+                    errors.append({
+                        'key': key.urlsafe(),
+                        'field': name,
+                        'errors': field_errors,
+                    })
+                continue
+
+            signals.pre_action.send(
+                'edit',
+                view_class=self.__class__,
+                key=key)
+            saves.append((key, fields, ndb.transaction_async(
+                functools.partial(self._inline_save, key, form, fields))))
+
+        for key, fields, future in saves:
+            instance, changed = future.get_result()
+            if instance is None:
+                errors.append({
+                    'key': key.urlsafe(),
+                    'field': None,
+                    'errors': [u"Not found."],
+                })
+                continue
+
+            if changed:
+                entity_changed(key)
+            signals.post_action.send(
+                'edit',
+                view_class=self.__class__,
+                instance=instance,
+                key=key,
+                changed_properties=len(changed),
+                indexed_changes=any(p._indexed for p in changed))
+
+            for name in fields:
+                cells.append({
+                    'key': key.urlsafe(),
+                    'field': name,
+                    'html': self._inline_cell(instance, name),
+                })
+
+        logger.info("Inline edit of %s: %d cells saved, %d errors.",
+                    self.kind(), len(cells), len(errors))
+        return flask.jsonify(cells=cells, errors=errors)
+
+    def _get_in_memory_limit(self):
+        if self.in_memory_limit is not None:
+            return self.in_memory_limit
+        return flask.current_app.config.get('KIBBLE_IN_MEMORY_LIMIT', 0)
+
+    def _in_memory_context(self, context, limit):
+        """
+        Swap the table in ``context`` for one that runs in memory.
+        """
+        table = context['table']
+        context['table'] = type(table)(
+            self, table.query, table.query_params, in_memory_limit=limit)
+
+        paginator = context.get('paginator')
+        if paginator is not None:
+            paginator.use_total(context['table'].total_async())
         return context
 
     def dispatch_request(self, page, ancestor_key):
+        if flask.request.method == 'PATCH':
+            return self.inline_edit_request(ancestor_key)
+
         context = self._get_context(page, ancestor_key)
         try:
-            return flask.render_template(self.templates, **context)
+            response = flask.render_template(self.templates, **context)
 
-        except NeedIndexError:
-            # We've tried to generate a query that isn't handled by the
-            # application. Render the page with no filters and such, allowing
-            # the user to adjust their queries.
-            context['_extends'] = "kibble/list.html"
-            context['table'] = MissingIndexTable(self, None, None)
-            context['paginator'] = None
-
-            return flask.render_template(
-                'kibble/list.need_index.html',
-                **context)
+        except NeedIndexError as e:
+            shape = context['table'].shape
+            if shape is not None:
+                context['missing_index'] = \
+                    flask.g.kibble.missing_indexes.record(shape, e)
+
+        else:
+            self._cache_results(context)
+            return response
+
+        # Try again without needing the index.
+        limit = self._get_in_memory_limit()
+        if limit and getattr(context['table'], 'query', None) is not None:
+            try:
+                return flask.render_template(
+                    self.templates,
+                    **self._in_memory_context(context, limit))
+            except NeedIndexError:
+                pass
+
+        # We've tried to generate a query that isn't handled by the
+        # application. Render the page with no filters and such, allowing
+        # the user to adjust their queries.
+        context['_extends'] = "kibble/list.html"
+        context['table'] = MissingIndexTable(self, None, None)
+        context['paginator'] = None
+
+        return flask.render_template(
+            'kibble/list.need_index.html',
+            **context)
 
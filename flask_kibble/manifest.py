@@ -0,0 +1,255 @@
+"""
+Autodiscover manifests.
+=======================
+
+Importing every view module at instance startup is slow. A manifest records
+everything :meth:`~flask_kibble.Kibble.register_view` needs to know about
+each view, so the URL rules can be registered without importing anything.
+The view's module is only imported once one of its endpoints is hit, or
+something not recorded in the manifest is looked up on it. The index and
+menu only need the model classes, which are imported by name.
+
+Generate the manifest at build time with :func:`write_manifest` ::
+
+    from flask_kibble import manifest
+    manifest.write_manifest('kibble_manifest.json', ['myapp'])
+
+and pass it to :meth:`~flask_kibble.Kibble.autodiscover` ::
+
+    admin.autodiscover(['myapp'], manifest='kibble_manifest.json')
+"""
+
+import json
+
+import flask
+from werkzeug.utils import cached_property, find_modules, import_string
+
+from .base import KibbleMeta, KibbleView
+
+
+def discover_views(paths, module_names=None):
+    """
+    Import all modules under ``paths`` and return the discovered views.
+
+    :param paths: The module paths to search under.
+    :param module_names: A list of module names to match on.
+    """
+    for p in paths:
+        for mod in find_modules(p, True, True):
+            if module_names is None \
+                    or mod.rsplit('.', 1)[-1] in module_names:
+                import_string(mod)
+
+    return sorted(
+        [view for view in KibbleMeta._autodiscover if view.model],
+        key=lambda v: (v.__module__, v.__name__))
+
+
+def _import_path(cls):
+    return '%s.%s' % (cls.__module__, cls.__name__)
+
+
+def _overrides(view_class, name):
+    return getattr(view_class, name).__func__ \
+        is not getattr(KibbleView, name).__func__
+
+
+def view_entry(view_class):
+    """
+    Build the manifest entry for ``view_class``.
+    """
+    return {
+        'model': _import_path(view_class.model),
+        'ancestor_models': [_import_path(a) for a in view_class.ancestors],
+        'button_icon': view_class.button_icon,
+        'button_class': view_class.button_class,
+        # Views with their own permission or url logic have to be imported
+        # to answer those.
+        'custom_links': any(_overrides(view_class, name) for name in (
+            'has_permission_for', 'url_for', '_ancestor_required',
+            '_is_popup')),
+        'module': view_class.__module__,
+        'name': view_class.__name__,
+        'kind': view_class.kind(),
+        'path': view_class.path(),
+        'action': view_class.action,
+        'view_name': view_class.view_name(),
+        'ancestors': [a._get_kind() for a in view_class.ancestors],
+        'methods': list(view_class.http_methods()),
+        'url_patterns': [[pattern, defaults]
+                         for pattern, defaults in view_class.url_patterns()],
+        'hidden': view_class.hidden,
+        'requires_instance': view_class._requires_instance,
+        'requires_ancestor': view_class._requires_ancestor,
+        'acts_on_selection': view_class._acts_on_selection,
+    }
+
+
+def build_manifest(paths, module_names=None):
+    """
+    Discover all views under ``paths`` and return their manifest entries.
+    """
+    return [view_entry(v) for v in discover_views(paths, module_names)]
+
+
+def write_manifest(filename, paths, module_names=None):
+    """
+    Discover all views under ``paths`` and write the manifest to
+    ``filename``.
+    """
+    with open(filename, 'w') as f:
+        json.dump(build_manifest(paths, module_names), f, indent=2,
+                  sort_keys=True)
+
+
+def load_manifest(filename):
+    """
+    Load the manifest entries from ``filename``.
+    """
+    with open(filename) as f:
+        return json.load(f)
+
+
+class LazyView(object):
+    """
+    Stand-in for a view class that hasn't been imported yet.
+
+    Acts as both the flask view function and the entry in the
+    :class:`~flask_kibble.blueprint.KibbleRegistry`. Attributes that are
+    recorded in the manifest are answered directly, everything else imports
+    the view class and is looked up on that.
+
+    :meth:`has_permission_for` and :meth:`url_for` only import the model
+    classes, unless the view overrides them.
+    """
+
+    # Read by flask when the url rules are registered.
+    methods = None
+    required_methods = ()
+    provide_automatic_options = None
+
+    def __init__(self, entry):
+        self._entry = entry
+        self.__name__ = str(entry['view_name'])
+        self.__module__ = str(entry['module'])
+
+    def __repr__(self):
+        return "<LazyView %s.%s>" % (self._entry['module'],
+                                     self._entry['name'])
+
+    @cached_property
+    def view_class(self):
+        view_class = import_string('%s.%s' % (self._entry['module'],
+                                              self._entry['name']))
+        if not (isinstance(view_class, type)
+                and issubclass(view_class, KibbleView)):
+            raise TypeError("%r is not a KibbleView" % view_class)
+        return view_class
+
+    @cached_property
+    def _view_func(self):
+        return self.view_class.as_view(self.__name__)
+
+    def __call__(self, *args, **kwargs):
+        return self._view_func(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        return getattr(self.view_class, attr)
+
+    @property
+    def _lazy(self):
+        # Manifests written before models were recorded can't answer
+        # anything without the view.
+        return 'model' in self._entry \
+            and not self._entry.get('custom_links', True)
+
+    @cached_property
+    def model(self):
+        if not self._lazy:
+            return self.view_class.model
+        return import_string(self._entry['model'])
+
+    @cached_property
+    def ancestors(self):
+        if not self._lazy:
+            return self.view_class.ancestors
+        return [import_string(a) for a in self._entry['ancestor_models']]
+
+    @property
+    def button_icon(self):
+        if 'button_icon' not in self._entry:
+            return self.view_class.button_icon
+        return self._entry['button_icon']
+
+    @property
+    def button_class(self):
+        if 'button_class' not in self._entry:
+            return self.view_class.button_class
+        return self._entry['button_class']
+
+    def has_permission_for(self, key=None):
+        if not self._lazy:
+            return self.view_class.has_permission_for(key)
+        return _view_method('has_permission_for')(self, key)
+
+    def url_for(self, key=None, ancestor_key=None, blueprint='', **kwargs):
+        if not self._lazy:
+            return self.view_class.url_for(key, ancestor_key, blueprint,
+                                           **kwargs)
+        return _view_method('url_for')(self, key, ancestor_key, blueprint,
+                                       **kwargs)
+
+    def _ancestor_required(self):
+        return _view_method('_ancestor_required')(self)
+
+    def _is_popup(self):
+        return _view_method('_is_popup')(self)
+
+    @property
+    def action(self):
+        return self._entry['action']
+
+    @property
+    def hidden(self):
+        return self._entry['hidden']
+
+    @property
+    def _requires_instance(self):
+        return self._entry['requires_instance']
+
+    @property
+    def _requires_ancestor(self):
+        return self._entry['requires_ancestor']
+
+    @property
+    def _acts_on_selection(self):
+        return self._entry.get('acts_on_selection', False)
+
+    def http_methods(self):
+        return self._entry['methods']
+
+    def kind(self):
+        return self._entry['kind']
+
+    def path(self):
+        return self._entry['path']
+
+    def view_name(self):
+        return self._entry['view_name']
+
+    def url_patterns(self):
+        return [(p, d) for p, d in self._entry['url_patterns']]
+
+    def group(self):
+        return flask.current_app.config.get('KIBBLE_KIND_GROUPS', {}).get(
+            self.kind(), None)
+
+
+def _view_method(name):
+    """
+    The function behind the :class:`~flask_kibble.base.KibbleView`
+    classmethod ``name``, to call with a :class:`LazyView`.
+    """
+    return getattr(KibbleView, name).__func__
@@ -153,6 +153,19 @@ class ModelAuthenticatior(kibble.Authenticator):
     def get_login_url(self):
         return users.create_login_url(flask.url_for('.index'))
 
+    def permission_fingerprint(self):
+        if users.is_current_user_admin():
+            return 'admin'
+
+        u = KibbleUser.get_by_id(users.get_current_user().email())
+        if u is None or not u.enabled:
+            return 'disabled'
+
+        if u.superuser:
+            return 'superuser'
+
+        return ','.join(sorted(u.all_permissions))
+
     @classmethod
     def register_views(cls, kibble_blueprint):
         for klass in [KibbleUserList, KibbleUserCreate, KibbleUserDelete,
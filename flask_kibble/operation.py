@@ -36,6 +36,7 @@ class Operation(KibbleView):
         ("/{key}/{action}/", {}),
     ]
     _requires_instance = True
+    accepts_instance = True
     _methods = ['GET', 'POST']
 
     class Failure(Exception):
@@ -122,10 +123,20 @@ class Operation(KibbleView):
             result=result,
             instance=instance)
 
-    def dispatch_request(self, key):
-        ancestors = instance_and_ancestors_async(key.parent())
+    @classmethod
+    def prefetch(cls, key, **view_args):
+        return {
+            'instance': key.get_async(),
+            'ancestors': instance_and_ancestors_async(key.parent()),
+        }
 
-        instance = key.get()
+    def dispatch_request(self, key, instance=None):
+        ancestors = (self.prefetched('ancestors')
+                     or instance_and_ancestors_async(key.parent()))
+
+        if instance is None:
+            instance = (self.prefetched('instance')
+                        or key.get_async()).get_result()
         if instance is None:
             flask.abort(404)
 
@@ -148,6 +159,8 @@ class Operation(KibbleView):
                 if isinstance(result, ndb.Future):
                     result = result.get_result()
 
+                # The post_action receiver in util.changes records the
+                # write.
                 signals.post_action.send(
                     self.action,
                     view_class=self.__class__,
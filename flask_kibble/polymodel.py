@@ -26,6 +26,7 @@ class PolyMeta(base_base.KibbleMeta):
 
         if PolyClassPicker in bases or PolyDispatcher in bases:
             attrs['_sub_views'] = {}
+            attrs['_sub_views_by_name'] = {}
             cls = _super(PolyMeta)
             return cls
 
@@ -34,6 +35,7 @@ class PolyMeta(base_base.KibbleMeta):
             if issubclass(base, (PolyClassPicker, PolyDispatcher)):
                 model = tuple(cls.model._class_key())
                 base._sub_views[model] = cls
+                base._sub_views_by_name[model[-1]] = cls
                 break
         return cls
 
@@ -65,10 +67,10 @@ class PolyClassPicker(object):
 
     def dispatch_request(self, *args, **kwargs):
         cls_name = flask.request.args.get('class', None)
-        for cls_key, view_cls in self._sub_views.items():
-            if cls_key[-1] == cls_name:
-                v = view_cls()
-                return v.dispatch_request(*args, **kwargs)
+        view_cls = self._sub_views_by_name.get(cls_name)
+        if view_cls is not None:
+            # Views keep per-request state, so sub-views aren't shared.
+            return view_cls().dispatch_request(*args, **kwargs)
 
         ctx = self.base_context()
         ctx['sub_views'] = self._sub_views
@@ -83,14 +85,26 @@ class PolyDispatcher(object):
     Polymodel mixin that selects the correct kibble view based on the
     instance type that is passed in.
     Assumes the instance is passed through the ``key`` parameter.
+
+    The fetched instance is passed on to the sub-view's
+    ``dispatch_request`` as ``instance`` if the sub-view sets
+    :attr:`~flask_kibble.base.KibbleView.accepts_instance`, so it isn't
+    fetched twice.
     """
     __metaclass__ = PolyMeta
 
     def dispatch_request(self, **kwargs):
+        inst = (self.prefetched('instance')
+                or kwargs['key'].get_async()).get_result()
+        if inst is None:
+            flask.abort(404)
+
         try:
-            inst = kwargs['key'].get()
             view_cls = self._sub_views[tuple(inst._class_key())]
-            return view_cls().dispatch_request(**kwargs)
         except KeyError:
             flask.abort(404)
 
+        if view_cls.accepts_instance:
+            kwargs['instance'] = inst
+        # Views keep per-request state, so sub-views aren't shared.
+        return view_cls().dispatch_request(**kwargs)
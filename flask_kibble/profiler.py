@@ -0,0 +1,254 @@
+"""
+Datastore RPC profiler.
+=======================
+
+Records every API call (datastore, memcache, etc.) made while handling a
+Kibble request. Enable it with the ``KIBBLE_PROFILE_RPCS`` application
+setting. Each response then carries a ``Server-Timing`` header, and pages
+show a collapsible panel listing the calls, their batch sizes, timings and
+where they were made from.
+"""
+
+import os
+import time
+import threading
+import traceback
+from collections import OrderedDict
+
+from google.appengine.api import apiproxy_stub_map
+
+
+HOOK_NAME = 'kibble-profiler'
+
+_local = threading.local()
+
+# Frames from these paths are skipped when looking for where a call
+# originated from.
+_IGNORED_PATHS = (
+    os.path.join('google', 'appengine'),
+    os.path.join('google', 'net'),
+    os.path.join('jinja2', ''),
+    os.path.join('werkzeug', ''),
+    os.path.join('flask', ''),
+    __file__.rstrip('c'),
+)
+
+
+class RpcRecord(object):
+    """
+    A single API call.
+    """
+    def __init__(self, service, call, kind=None, batch_size=None,
+                 origin=None):
+        self.service = service
+        self.call = call
+        self.kind = kind
+        self.batch_size = batch_size
+        self.origin = origin
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+        self.results = None
+
+    def __repr__(self):
+        return "<RpcRecord %s.%s %s x%s>" % (
+            self.service, self.call, self.kind, self.batch_size)
+
+    def finish(self, response=None, error=None):
+        self.duration = time.time() - self.start
+        self.error = error
+
+        # Number of results returned by queries.
+        if hasattr(response, 'result_list'):
+            self.results = len(response.result_list())
+
+
+class RpcProfile(object):
+    """
+    The API calls made during a single request.
+
+    :param name: A name for the profile, e.g. the endpoint.
+    :param parent: The enclosing profile, which also records the calls.
+    """
+    def __init__(self, name=None, parent=None):
+        self.name = name
+        self.parent = parent
+        self.records = []
+        self._pending = {}
+        self.start = time.time()
+        self.duration = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def stop(self):
+        if self.duration is None:
+            self.duration = time.time() - self.start
+
+    def reads(self, service='datastore_v3'):
+        """
+        Number of entities read by gets and queries.
+        """
+        return sum(
+            (r.batch_size or 0) + (r.results or 0)
+            for r in self.records
+            if r.service == service and r.call in _READ_CALLS)
+
+    def writes(self, service='datastore_v3'):
+        """
+        Number of entities written or deleted.
+        """
+        return sum(
+            r.batch_size or 0
+            for r in self.records
+            if r.service == service and r.call in _WRITE_CALLS)
+
+    def count(self, service='datastore_v3'):
+        """
+        Number of calls made to ``service``.
+        """
+        return sum(1 for r in self.records if r.service == service)
+
+    def by_service(self):
+        """
+        Returns an ordered dict of ``service: (call count, total seconds)``.
+        """
+        totals = OrderedDict()
+        for r in self.records:
+            count, duration = totals.get(r.service, (0, 0.0))
+            totals[r.service] = (count + 1, duration + (r.duration or 0.0))
+        return totals
+
+    def server_timing(self):
+        """
+        The value for a ``Server-Timing`` header.
+        """
+        return ', '.join(
+            '%s;dur=%.1f;desc="%d calls"' % (
+                service, duration * 1000, count)
+            for service, (count, duration) in self.by_service().items())
+
+    def _pre_call(self, service, call, request, rpc_id):
+        record = RpcRecord(
+            service, call,
+            kind=_request_kind(call, request),
+            batch_size=_batch_size(call, request),
+            origin=_origin())
+        self.records.append(record)
+        self._pending[rpc_id] = record
+
+    def _post_call(self, rpc_id, response, error=None):
+        record = self._pending.pop(rpc_id, None)
+        if record is not None:
+            record.finish(response, error)
+
+
+_READ_CALLS = frozenset(['Get', 'RunQuery', 'Next'])
+_WRITE_CALLS = frozenset(['Put', 'Delete'])
+
+
+def _batch_size(call, request):
+    for attr in ('key_list', 'entity_list', 'item_list'):
+        if hasattr(request, attr):
+            return len(getattr(request, attr)())
+    return None
+
+
+def _key_kind(key):
+    return key.path().element_list()[-1].type()
+
+
+def _request_kind(call, request):
+    try:
+        if hasattr(request, 'kind') and request.has_kind():
+            return request.kind()
+        if hasattr(request, 'key_list') and request.key_size():
+            return _key_kind(request.key(0))
+        if hasattr(request, 'entity_list') and request.entity_size():
+            return _key_kind(request.entity(0).key())
+    except Exception:
+        pass
+    return None
+
+
+def _origin():
+    """
+    The innermost stack frame outside of the SDK.
+    """
+    for filename, lineno, func, _ in reversed(traceback.extract_stack()):
+        if any(p in filename for p in _IGNORED_PATHS):
+            continue
+        return '%s:%s %s' % (os.path.basename(filename), lineno, func)
+    return None
+
+
+def _rpc_id(rpc, response):
+    return id(rpc if rpc is not None else response)
+
+
+def _active_profiles():
+    profile = current_profile()
+    while profile is not None:
+        yield profile
+        profile = profile.parent
+
+
+def _pre_call_hook(service, call, request, response, rpc=None):
+    for profile in _active_profiles():
+        profile._pre_call(service, call, request, _rpc_id(rpc, response))
+
+
+def _post_call_hook(service, call, request, response, rpc=None, error=None):
+    for profile in _active_profiles():
+        profile._post_call(_rpc_id(rpc, response), response, error)
+
+
+def install():
+    """
+    Install the profiling hooks on the current API proxy. Safe to call
+    multiple times.
+    """
+    apiproxy = apiproxy_stub_map.apiproxy
+    apiproxy.GetPreCallHooks().Append(HOOK_NAME, _pre_call_hook)
+    apiproxy.GetPostCallHooks().Append(HOOK_NAME, _post_call_hook)
+
+
+def start(name=None):
+    """
+    Start profiling API calls made by the current thread. Profiles nest;
+    calls are recorded by every profile that is running.
+
+    :returns: The new :class:`RpcProfile`.
+    """
+    install()
+    profile = _local.profile = RpcProfile(name, current_profile())
+    return profile
+
+
+def stop(profile=None):
+    """
+    Stop the innermost profile for the current thread.
+
+    :param profile: Stop this profile (and any started inside it) instead.
+        Nothing happens if it isn't running.
+    :returns: The :class:`RpcProfile` or ``None`` if not profiling.
+    """
+    if profile is None:
+        profile = current_profile()
+    elif profile not in _active_profiles():
+        return None
+
+    if profile is not None:
+        _local.profile = profile.parent
+        profile.stop()
+    return profile
+
+
+def current_profile():
+    """
+    The :class:`RpcProfile` for the current thread, or ``None``.
+    """
+    return getattr(_local, 'profile', None)
@@ -58,7 +58,7 @@ class Paginator(QueryComposer):
     def __init__(self, *args, **kwargs):
         super(Paginator, self).__init__(*args, **kwargs)
 
-        self._total_objects = self.query.count_async()
+        self._total_objects = None
 
     def get_query_params(self):
         return {
@@ -80,9 +80,25 @@ class Paginator(QueryComposer):
             page_size,
             getattr(self, "max_page_size", sys.maxint))
 
+    def count_async(self):
+        """
+        Start counting the query, if the total isn't known already.
+        """
+        if self._total_objects is None:
+            self._total_objects = self.query.count_async()
+        return self._total_objects
+
     @property
     def total_objects(self):
-        return self._total_objects.get_result()
+        return self.count_async().get_result()
+
+    def use_total(self, future):
+        """
+        Take the total number of objects from ``future`` rather than
+        counting the query, e.g. when the query is run in memory or the
+        count is cached.
+        """
+        self._total_objects = future
 
     @property
     def page_number(self):
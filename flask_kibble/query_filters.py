@@ -106,6 +106,21 @@ class BaseFilter(object):
         """
         return ''
 
+    def index_filters(self, model):
+        """
+        The ways this filter can constrain a query, for working out the
+        indexes needed. See :mod:`flask_kibble.indexes`.
+
+        :param model: The model class being filtered.
+        :returns: A list of alternatives, each a list of ``(property,
+            operator)`` pairs.
+        """
+        try:
+            name = self.model_property(model)._name
+        except AttributeError:
+            name = self.field
+        return [[(name, '=')]]
+
 
 class ChoicesFilter(BaseFilter):
     """
@@ -279,6 +294,15 @@ class DateTimeFilter(ChoicesFilter):
             prop < end
         )
 
+    def index_filters(self, model):
+        name = super(DateTimeFilter, self).index_filters(model)[0][0][0]
+        options = []
+        if self.none:
+            options.append([(name, '=')])
+        if self.past or self.present or self.future:
+            options.append([(name, '>'), (name, '<')])
+        return options
+
     def filter(self, model, query):
         val = self.get(None)
         if not val:
@@ -297,23 +321,32 @@ class PolymodelFilter(ChoicesFilter):
         self.title = 'Class'
         self.field = 'class'
 
-    @property
-    def choices(self):
+    def _subclass_names(self):
         base_key = tuple(self.base_class._class_key())
         base_len = len(base_key)
 
-        class_map = self.base_class._class_map.keys()
-
-        output = []
-
-        for cls_key in sorted(class_map):
-            if cls_key[:base_len] == base_key \
-                    and cls_key != base_key:
-                val = cls_key[-1]
-                label = flask.g.kibble.label_for_kind(val)
-                output.append((val, label))
+        return [
+            cls_key[-1] for cls_key in self.base_class._class_map.keys()
+            if cls_key[:base_len] == base_key and cls_key != base_key]
 
-        return sorted(output, key=lambda x: x[1])
+    @property
+    def choices(self):
+        # Labelled choices are kept with the registry snapshot. The subclass
+        # names are part of the key, as subclasses may be imported later.
+        names = tuple(self._subclass_names())
+        cache = flask.g.kibble.snapshot.cache
+        cache_key = ('polymodel-choices', self.base_class, names)
+        try:
+            return cache[cache_key]
+        except KeyError:
+            pass
+
+        output = sorted(
+            [(val, flask.g.kibble.label_for_kind(val)) for val in names],
+            key=lambda x: (x[1], x[0]))
+
+        cache[cache_key] = output
+        return output
 
     def filter(self, model, query):
         val = self.get(None)
@@ -321,6 +354,9 @@ class PolymodelFilter(ChoicesFilter):
             return query
         return query.filter(ndb.GenericProperty('class') == val)
 
+    def index_filters(self, model):
+        return [[('class', '=')]]
+
 
 #class ProjectionFilter(ChoicesFilter):
 #    """
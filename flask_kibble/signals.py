@@ -5,3 +5,6 @@ namespace = Namespace()
 pre_action = namespace.signal('pre-action')
 post_action = namespace.signal('post-action')
 
+# Sent when a save is retried after datastore contention, or hits a version
+# conflict.
+contention = namespace.signal('contention')
@@ -1,6 +1,7 @@
 function RepeatedFormField(node){
     var $node = $(node);
-    var tmpl = window.atob($node.data('template'))
+    // The template is base64 encoded UTF-8.
+    var tmpl = decodeURIComponent(escape(window.atob($node.data('template'))));
     var delete_btn = $node.find('.delete-row');
     var add_btn = $node.find('.add-row');
 
@@ -96,3 +97,85 @@ function dismissAddAnotherPopup(win, repr, id){
     win.close();
 }
 
+
+function InlineEditTable(node){
+    var $table = $(node);
+    var $actions = $table.nextAll('.inline-edit-actions:first');
+
+    var edit = function($cell){
+        if ($cell.hasClass('editing')) return;
+
+        var input;
+        if ($cell.data('input') == 'checkbox') {
+            input = $('<input type="checkbox">');
+            input.prop('checked', $cell.data('value') == 'y');
+        } else {
+            input = $('<input type="text" class="form-control input-sm">');
+            input.val($cell.data('value'));
+        }
+
+        $cell.data('html', $cell.html());
+        $cell.addClass('editing').empty().append(input);
+        $actions.removeClass('hidden');
+        input.focus();
+    }
+
+    var value = function($cell){
+        var input = $cell.find('input');
+        if (input.attr('type') == 'checkbox') return input.prop('checked');
+        return input.val();
+    }
+
+    var cell = function(key, field){
+        return $table.find('td.inline-edit').filter(function(){
+            return $(this).data('key') == key && $(this).data('field') == field;
+        });
+    }
+
+    $table.on('click', 'td.inline-edit', function(){
+        edit($(this));
+    });
+
+    $actions.find('.inline-edit-cancel').click(function(){
+        $table.find('td.editing').each(function(i, elem){
+            var $cell = $(elem);
+            $cell.removeClass('editing has-error').html($cell.data('html'));
+        });
+        $actions.addClass('hidden');
+    });
+
+    $actions.find('.inline-edit-save').click(function(){
+        var edits = $table.find('td.editing').map(function(i, elem){
+            var $cell = $(elem);
+            return {key: $cell.data('key'), field: $cell.data('field'),
+                    value: value($cell)};
+        }).get();
+        if (!edits.length) return;
+
+        $.ajax({
+            url: $table.data('inline-url'),
+            type: 'PATCH',
+            contentType: 'application/json',
+            data: JSON.stringify({csrf_token: $table.data('csrf-token'),
+                                  edits: edits}),
+            dataType: 'json'
+        }).done(function(resp){
+            $.each(resp.cells, function(i, c){
+                var $cell = cell(c.key, c.field);
+                $cell.removeClass('editing has-error');
+                var v = value($cell);
+                $cell.data('value', v === true ? 'y' : (v === false ? '' : v));
+                if (c.html !== null) $cell.html(c.html);
+            });
+            $.each(resp.errors, function(i, e){
+                var $cell = e.field ? cell(e.key, e.field) : $();
+                $cell.addClass('has-error').attr('title', [].concat(e.errors).join(' '));
+            });
+            if (!$table.find('td.editing').length) $actions.addClass('hidden');
+        });
+    });
+}
+
+$('table[data-inline-url]').each(function(i, elem){
+    new InlineEditTable(elem);
+});
@@ -0,0 +1,132 @@
+import time
+import threading
+from collections import OrderedDict
+
+from google.appengine.api import memcache
+
+
+class LRUCache(object):
+    """
+    A small, thread-safe, bounded least-recently-used cache.
+
+    :param max_size: The maximum number of entries to hold.
+    """
+
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                return default
+            self._data[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def items(self):
+        """
+        A list of ``(key, value)`` pairs, least recently used first.
+        """
+        with self._lock:
+            return self._data.items()
+
+
+class TieredCache(object):
+    """
+    An in-process :class:`LRUCache` backed by memcache.
+
+    :param namespace: The memcache namespace to store values under.
+    :param max_size: The maximum number of entries to hold in-process.
+    :param time: Memcache expiry time in seconds. (0 for no expiry)
+    """
+
+    def __init__(self, namespace, max_size=1000, time=0):
+        self.namespace = namespace
+        self.time = time
+        self._local = LRUCache(max_size)
+
+    def get(self, key, default=None):
+        value = self._local.get(key)
+        if value is not None:
+            return value
+
+        value = memcache.get(key, namespace=self.namespace)
+        if value is None:
+            return default
+
+        self._local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self._local.set(key, value)
+        memcache.set(key, value, time=self.time, namespace=self.namespace)
+
+    def delete(self, key):
+        self._local.delete(key)
+        memcache.delete(key, namespace=self.namespace)
+
+
+class GenerationCounter(object):
+    """
+    Generation numbers kept in memcache. Include a name's generation in
+    cache keys, and bump it to invalidate everything cached under the old
+    generation at once.
+
+    Counters start from the current time, so one evicted from memcache
+    doesn't return to an old generation.
+
+    :param namespace: The memcache namespace to store counters under.
+    """
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+
+    def get(self, *names):
+        """
+        :returns: Dictionary of name to generation. Generations are ``None``
+            if memcache is unavailable.
+        """
+        generations = memcache.get_multi(names, namespace=self.namespace)
+        for name in names:
+            if name not in generations:
+                generations[name] = self.bump(name)
+        return generations
+
+    def bump(self, name):
+        """
+        Move ``name`` to a new generation.
+        """
+        return memcache.incr(name, initial_value=int(time.time()),
+                             namespace=self.namespace)
+
+    def bump_multi(self, names):
+        """
+        Move each of ``names`` to a new generation, in one call.
+        """
+        return memcache.offset_multi(
+            dict.fromkeys(names, 1), initial_value=int(time.time()),
+            namespace=self.namespace)
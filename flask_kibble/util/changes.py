@@ -0,0 +1,60 @@
+"""
+Change tracking for cache invalidation.
+
+Kibble records each entity it writes, bumping a stamp for the entity and a
+generation for its kind. Both are kept in memcache and used to build cache
+keys and ETags, so a write invalidates everything derived from the old
+values without having to find it.
+
+Writes made outside of Kibble aren't tracked.
+"""
+import flask
+
+from .. import signals
+from .cache import GenerationCounter
+
+
+#: Per-kind generations.
+kind_generations = GenerationCounter('kibble-list-generations')
+
+#: Per-entity stamps, keyed by the url-safe key.
+entity_stamps = GenerationCounter('kibble-entity-stamps')
+
+#: Generation bumped by writes that can change any kind.
+ALL_KINDS = '*'
+
+
+def entity_changed(key, all_kinds=False):
+    """
+    Record that the entity with ``key`` was written or deleted.
+
+    Repeated calls for the same key within a request are ignored.
+
+    :param key: The :py:class:`ndb.Key`.
+    :param all_kinds: Also invalidate every kind, e.g. after deleting
+        descendants.
+    """
+    if flask.has_request_context():
+        seen = getattr(flask.g, '_kibble_changed', None)
+        if seen is None:
+            seen = flask.g._kibble_changed = set()
+        if (key, all_kinds) in seen:
+            return
+        seen.add((key, all_kinds))
+
+    entity_stamps.bump(key.urlsafe())
+    kind_generations.bump(key.kind())
+    if all_kinds:
+        kind_generations.bump(ALL_KINDS)
+
+
+@signals.post_action.connect
+def _post_action(action, view_class=None, key=None, instance=None,
+                 changed_properties=None, **kwargs):
+    if key is None and instance is not None:
+        key = instance.key
+    if key is None or changed_properties == 0:
+        return
+
+    # Recursive deletes remove descendants of any kind.
+    entity_changed(key, all_kinds=getattr(view_class, 'recursive', False))
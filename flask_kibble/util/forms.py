@@ -1,5 +1,6 @@
 import flask
 import wtforms
+from werkzeug.datastructures import MultiDict
 
 from wtforms_ndb import ModelConverter
 from wtforms.csrf.session import SessionCSRF
@@ -48,3 +49,69 @@ class KibbleModelConverter(ModelConverter):
         return super(KibbleModelConverter, self).convert_KeyProperty(
             model, prop, field_args)
 
+
+def plain_errors(errors):
+    """
+    Convert form errors, which may hold lazy strings, to JSON-able values.
+    """
+    if isinstance(errors, dict):
+        return dict((k, plain_errors(v)) for k, v in errors.iteritems())
+    if isinstance(errors, (list, tuple)):
+        return [plain_errors(e) for e in errors]
+    return unicode(errors)
+
+
+def text(value):
+    """
+    Convert a row value to form data text.
+    """
+    if isinstance(value, unicode):
+        return value
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    if value is True:
+        return u'y'
+    return unicode(value)
+
+
+def _flatten(data, name, value):
+    if isinstance(value, dict):
+        for k, v in value.iteritems():
+            _flatten(data, '%s-%s' % (name, k), v)
+    elif isinstance(value, list) and value \
+            and all(isinstance(v, dict) for v in value):
+        for i, v in enumerate(value):
+            _flatten(data, '%s-%d' % (name, i), v)
+    elif isinstance(value, list):
+        for v in value:
+            data.add(name, text(v))
+    elif value is not None and value is not False:
+        data.add(name, text(value))
+
+
+def formdata(row):
+    """
+    Convert a row to form data.
+    """
+    data = MultiDict()
+    for name, value in row.iteritems():
+        _flatten(data, name, value)
+    return data
+
+
+def validate_fields(form, names):
+    """
+    Validate only some of the fields of ``form``, and its CSRF token.
+
+    :param names: The names of the fields to validate.
+    :returns: ``True`` if all the fields are valid.
+    """
+    if 'csrf_token' in form._fields and 'csrf_token' not in names:
+        names = list(names) + ['csrf_token']
+
+    results = []
+    for name in names:
+        inline = getattr(form.__class__, 'validate_%s' % name, None)
+        results.append(form[name].validate(
+            form, [inline] if inline is not None else []))
+    return all(results)
@@ -0,0 +1,169 @@
+"""
+Run queries that are missing a composite index in memory.
+
+Only the ancestor and equality filters are sent to the datastore, as those
+are served by the built-in indexes. The remaining filters and the sort
+orders are applied in Python to a bounded number of entities.
+"""
+import operator
+from collections import namedtuple
+
+from google.appengine.api import datastore_types
+from google.appengine.ext import ndb
+
+from .query_stats import query_orders
+
+
+_OPERATORS = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+#: The result of :func:`fetch_in_memory_async`.
+#:
+#: ``entities`` is the requested page, ``total`` the number of matching
+#: entities and ``truncated`` is ``True`` if there were more entities than
+#: could be considered.
+InMemoryResult = namedtuple('InMemoryResult',
+                            ['entities', 'total', 'truncated'])
+
+
+def split_query(query):
+    """
+    Split a query into the part the built-in indexes can serve and the
+    rest.
+
+    :returns: A tuple of the :py:class:`ndb.Query` without orders,
+        inequalities or disjunctions, and the list of filter nodes left
+        over.
+    """
+    if query.filters is None:
+        nodes = []
+    elif isinstance(query.filters, ndb.ConjunctionNode):
+        nodes = list(query.filters)
+    else:
+        nodes = [query.filters]
+
+    equality, residual = [], []
+    for node in nodes:
+        if isinstance(node, ndb.FilterNode) \
+                and node.__getnewargs__()[1] == '=':
+            equality.append(node)
+        else:
+            residual.append(node)
+
+    base = ndb.Query(
+        kind=query.kind,
+        ancestor=query.ancestor,
+        filters=ndb.AND(*equality) if equality else None,
+        app=query.app,
+        namespace=query.namespace,
+        default_options=query.default_options)
+    return base, residual
+
+
+def _normalize(value):
+    if isinstance(value, datastore_types.Key):
+        return ndb.Key.from_old_key(value)
+    return value
+
+
+def property_values(entity, name):
+    """
+    The indexed values of property ``name``, which can be a dotted path into
+    structured properties.
+    """
+    path = name.split('.')
+    entities = [entity]
+    for part in path[:-1]:
+        children = []
+        for e in entities:
+            prop = e._properties.get(part)
+            if prop is not None:
+                value = prop._get_value(e)
+                children.extend(value if isinstance(value, list)
+                                else [value])
+        entities = [c for c in children if c is not None]
+
+    values = []
+    for e in entities:
+        prop = e._properties.get(path[-1])
+        if prop is not None:
+            values.extend(prop._get_base_value_unwrapped_as_list(e))
+    return values
+
+
+def matches(node, entity):
+    """
+    Does ``entity`` match the filter ``node``?
+    """
+    if isinstance(node, ndb.ConjunctionNode):
+        return all(matches(n, entity) for n in node)
+    if isinstance(node, ndb.DisjunctionNode):
+        return any(matches(n, entity) for n in node)
+    if isinstance(node, ndb.FalseNode):
+        return False
+    if isinstance(node, ndb.PostFilterNode):
+        return node.predicate(entity._to_pb())
+
+    name, op, value = node.__getnewargs__()
+    value = _normalize(value)
+    compare = _OPERATORS[op]
+    return any(compare(v, value) for v in property_values(entity, name))
+
+
+def _sort_value(values, descending):
+    # Repeated properties sort by their smallest value ascending, and
+    # largest descending. Missing values sort first.
+    values = [v.pairs() if isinstance(v, ndb.Key) else v for v in values]
+    if not values:
+        return (False, None)
+    return (True, max(values) if descending else min(values))
+
+
+def sort_entities(entities, orders):
+    """
+    Sort ``entities`` in place.
+
+    :param orders: List of ``(property, '+'|'-')`` pairs, as returned by
+        :func:`~flask_kibble.util.query_stats.query_orders`.
+    """
+    # Python's sort is stable, so sorting by each order from the last to the
+    # first gives the combined ordering.
+    for name, direction in reversed(orders):
+        descending = direction == '-'
+        entities.sort(
+            key=lambda e: _sort_value(property_values(e, name), descending),
+            reverse=descending)
+
+
+@ndb.tasklet
+def fetch_in_memory_async(query, limit=None, offset=0, max_entities=1000):
+    """
+    Run ``query`` without needing a composite index.
+
+    :param query: The :py:class:`ndb.Query` to run.
+    :param limit: The page size.
+    :param offset: The number of matching entities to skip.
+    :param max_entities: The maximum number of entities to fetch from the
+        datastore before filtering.
+    :returns: An :data:`InMemoryResult`.
+    """
+    base, residual = split_query(query)
+
+    entities = yield base.fetch_async(max_entities + 1)
+    truncated = len(entities) > max_entities
+    entities = [e for e in entities[:max_entities]
+                if all(matches(n, e) for n in residual)]
+
+    sort_entities(entities, query_orders(query))
+
+    offset = offset or 0
+    end = offset + limit if limit is not None else None
+    raise ndb.Return(InMemoryResult(
+        entities[offset:end], len(entities), truncated))
@@ -1,3 +1,6 @@
+import copy
+import hashlib
+
 from google.appengine.ext import ndb
 
 
@@ -6,15 +9,19 @@ def instance_and_ancestors_async(key):
     """
     Retrieve the instance for ``key`` and all it's ancestors.
 
+    All levels are fetched in a single batch. Repeated lookups within the
+    same entity group are answered by ndb's in-context cache.
+
     :param key: :py:class:`google.appengine.ext.ndb.Key` to retrieve.
     :returns: Array of :py:class:`google.appengine.ext.ndb.Model` instances
         with the topmost ancestor first, and the instance last.
     """
-    futures = []
+    keys = []
     while key:
-        futures.append(key.get_async())
+        keys.append(key)
         key = key.parent()
-    objs = yield futures
+
+    objs = yield ndb.get_multi_async(keys)
     raise ndb.Return(objs[::-1])
 
 
@@ -22,3 +29,49 @@ def instance_and_ancestors(key):
     return instance_and_ancestors_async(key).get_result()
 
 
+def is_descendant(key, ancestor_key):
+    """
+    Is ``key`` below ``ancestor_key``?
+    """
+    parent = key.parent()
+    while parent is not None:
+        if parent == ancestor_key:
+            return True
+        parent = parent.parent()
+    return False
+
+
+def snapshot_properties(instance):
+    """
+    Snapshot the stored property values of ``instance``, for comparing with
+    :func:`changed_properties` later. Computed properties are skipped.
+    """
+    return dict(
+        (name, copy.deepcopy(prop._get_value(instance)))
+        for name, prop in instance._properties.iteritems()
+        if not isinstance(prop, ndb.ComputedProperty))
+
+
+def changed_properties(instance, snapshot):
+    """
+    The properties of ``instance`` that differ from ``snapshot``.
+
+    :param instance: The :py:class:`ndb.Model` instance.
+    :param snapshot: Values from :func:`snapshot_properties`.
+    :returns: List of :py:class:`ndb.Property` instances, sorted by name.
+    """
+    missing = object()
+    return sorted(
+        (prop for name, prop in instance._properties.iteritems()
+         if not isinstance(prop, ndb.ComputedProperty)
+         and prop._get_value(instance) != snapshot.get(name, missing)),
+        key=lambda prop: prop._name)
+
+
+def entity_version(instance):
+    """
+    A hash of the stored form of ``instance``, which changes whenever any of
+    its properties do.
+    """
+    pb = instance._to_pb(allow_partial=True)
+    return hashlib.sha1(pb.Encode()).hexdigest()
@@ -0,0 +1,218 @@
+"""
+Query shape statistics.
+=======================
+
+Each list query is normalised into a :class:`QueryShape`: the kind, whether
+it has an ancestor, the properties filtered on and the sort orders, with the
+filter values dropped and the limit/offset rounded up to a power of ten.
+Latency and result sizes are aggregated per shape, so the shapes worth an
+index or a cached count stand out.
+"""
+import time
+import logging
+import threading
+from collections import namedtuple
+
+from google.appengine.datastore import datastore_query
+from google.appengine.ext import ndb
+
+from .cache import LRUCache
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryShape(namedtuple('QueryShape', [
+        'kind', 'ancestor', 'equality', 'inequality', 'orders',
+        'limit', 'offset'])):
+    """
+    A normalised query.
+
+    :param kind: The kind queried.
+    :param ancestor: ``True`` if the query has an ancestor.
+    :param equality: Sorted tuple of properties with equality filters.
+    :param inequality: Sorted tuple of ``(property, operator)`` pairs.
+    :param orders: Tuple of ``(property, '+'|'-')`` pairs.
+    :param limit: The limit bucket.
+    :param offset: The offset bucket.
+    """
+
+    def __str__(self):
+        parts = [self.kind]
+        if self.ancestor:
+            parts.append('ancestor')
+        parts.extend('%s=' % p for p in self.equality)
+        parts.extend('%s%s' % (p, op) for p, op in self.inequality)
+        parts.extend('%s%s' % (d, p) for p, d in self.orders)
+        if self.limit is not None:
+            parts.append('limit%s' % self.limit)
+        if self.offset is not None:
+            parts.append('offset%s' % self.offset)
+        return ' '.join(parts)
+
+
+def _bucket(value):
+    """
+    Round ``value`` up to the next power of ten.
+    """
+    if value is None:
+        return None
+    bucket = 1
+    while bucket < value:
+        bucket *= 10
+    return '<=%d' % bucket if value else '0'
+
+
+def _filter_nodes(node):
+    if node is None:
+        return
+    if isinstance(node, ndb.FilterNode):
+        yield node.__getnewargs__()
+    elif isinstance(node, (ndb.ConjunctionNode, ndb.DisjunctionNode)):
+        for child in node:
+            for f in _filter_nodes(child):
+                yield f
+
+
+def _orders(order):
+    if order is None:
+        return
+    if isinstance(order, datastore_query.CompositeOrder):
+        for o in order.orders:
+            for x in _orders(o):
+                yield x
+    elif isinstance(order, datastore_query.PropertyOrder):
+        yield (order.prop,
+               '-' if order.direction == datastore_query.PropertyOrder.DESCENDING
+               else '+')
+
+
+def query_orders(query):
+    """
+    The sort orders of a :py:class:`ndb.Query`.
+
+    :returns: List of ``(property, '+'|'-')`` pairs.
+    """
+    return list(_orders(query.orders))
+
+
+def query_shape(query, limit=None, offset=None):
+    """
+    Build the :class:`QueryShape` of a :py:class:`ndb.Query`.
+
+    :param query: The query.
+    :param limit: The limit the query is run with.
+    :param offset: The offset the query is run with.
+    """
+    equality = set()
+    inequality = set()
+    for name, op, _ in _filter_nodes(query.filters):
+        if op == '=':
+            equality.add(name)
+        else:
+            inequality.add((name, op))
+
+    return QueryShape(
+        kind=query.kind,
+        ancestor=query.ancestor is not None,
+        equality=tuple(sorted(equality)),
+        inequality=tuple(sorted(inequality)),
+        orders=tuple(query_orders(query)),
+        limit=_bucket(limit),
+        offset=_bucket(offset))
+
+
+class ShapeStats(object):
+    """
+    Aggregated timings for a single :class:`QueryShape`.
+    """
+    def __init__(self, shape):
+        self.shape = shape
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.total_results = 0
+        self.max_results = 0
+
+    def record(self, duration, results):
+        self.count += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+        self.total_results += results
+        self.max_results = max(self.max_results, results)
+
+    @property
+    def mean_time(self):
+        return self.total_time / self.count if self.count else 0.0
+
+    @property
+    def mean_results(self):
+        return self.total_results / float(self.count) if self.count else 0.0
+
+
+class QueryStats(object):
+    """
+    Bounded, in-memory aggregator of :class:`ShapeStats`.
+
+    :param max_shapes: The maximum number of shapes to track. The least
+        recently seen shapes are dropped first.
+    :param flush_interval: Log a summary at most every this many seconds.
+        (``None`` to disable)
+    """
+
+    #: Number of shapes included in the logged summary.
+    FLUSH_TOP = 10
+
+    def __init__(self, max_shapes=500, flush_interval=300):
+        self.flush_interval = flush_interval
+        self._shapes = LRUCache(max_shapes)
+        self._last_flush = time.time()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._shapes)
+
+    def record(self, shape, duration, results):
+        """
+        Record an executed query.
+
+        :param shape: The :class:`QueryShape`.
+        :param duration: Time taken in seconds.
+        :param results: Number of results returned.
+        """
+        with self._lock:
+            stats = self._shapes.get(shape)
+            if stats is None:
+                stats = ShapeStats(shape)
+                self._shapes.set(shape, stats)
+            stats.record(duration, results)
+
+            flush = self.flush_interval is not None \
+                and time.time() - self._last_flush >= self.flush_interval
+            if flush:
+                self._last_flush = time.time()
+
+        if flush:
+            self.flush()
+
+    def report(self):
+        """
+        All :class:`ShapeStats`, slowest in total first.
+        """
+        return sorted((s for _, s in self._shapes.items()),
+                      key=lambda s: s.total_time, reverse=True)
+
+    def flush(self):
+        """
+        Log a summary of the slowest shapes.
+        """
+        self._last_flush = time.time()
+        for stats in self.report()[:self.FLUSH_TOP]:
+            logger.info(
+                "Query shape %s: %d runs, mean %.1fms, max %.1fms, "
+                "mean %.1f results", stats.shape, stats.count,
+                stats.mean_time * 1000, stats.max_time * 1000,
+                stats.mean_results)
+
+    def clear(self):
+        self._shapes.clear()
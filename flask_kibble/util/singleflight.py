@@ -0,0 +1,113 @@
+"""
+Coalesce identical concurrent calls.
+
+Threads in the same instance asking for the same key wait for the first
+one's result rather than repeating the work. A short memcache lease
+extends this across instances: the instance holding the lease publishes
+its result, which the others poll for briefly before giving up and doing
+the work themselves.
+
+Results are shared by value, never as ``ndb`` futures, as those belong to
+the event loop of the thread that created them.
+"""
+import time
+import logging
+import threading
+
+from google.appengine.api import memcache
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Call(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    :param namespace: Memcache namespace for leases and results, or ``None``
+        to only coalesce within the instance.
+    :param lease_time: Seconds a lease is held for at most.
+    :param result_time: Seconds a published result is kept for.
+    :param wait: Seconds to wait for another caller's result before doing
+        the work anyway.
+    :param poll: Seconds between checks for another instance's result.
+    """
+
+    def __init__(self, namespace=None, lease_time=5, result_time=2, wait=1.0,
+                 poll=0.05):
+        self.namespace = namespace
+        self.lease_time = lease_time
+        self.result_time = result_time
+        self.wait = wait
+        self.poll = poll
+
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """
+        Call ``fn``, unless a call for ``key`` is already in flight, in
+        which case wait for and return its result.
+
+        :param key: A string identifying the work.
+        :param fn: Called with no arguments. Must return a picklable value
+            other than ``None`` to be shared across instances.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait(self.wait)
+            if call.event.is_set() and call.error is None:
+                return call.result
+            return fn()
+
+        try:
+            call.result = self._do_shared(key, fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def _do_shared(self, key, fn):
+        if self.namespace is None:
+            return fn()
+
+        result = memcache.get(key, namespace=self.namespace)
+        if result is not None:
+            return result
+
+        lease = 'lease:' + key
+        if memcache.add(lease, 1, time=self.lease_time,
+                        namespace=self.namespace):
+            try:
+                result = fn()
+                if result is not None:
+                    memcache.set(key, result, time=self.result_time,
+                                 namespace=self.namespace)
+                return result
+            finally:
+                memcache.delete(lease, namespace=self.namespace)
+
+        # Another instance holds the lease.
+        deadline = time.time() + self.wait
+        while time.time() < deadline:
+            time.sleep(self.poll)
+            result = memcache.get(key, namespace=self.namespace)
+            if result is not None:
+                return result
+
+        logger.debug("Timed out waiting for %s, running it here.", key)
+        return fn()
@@ -0,0 +1,133 @@
+import flask
+from werkzeug.datastructures import MultiDict
+from werkzeug.routing import (parse_rule, parse_converter_args,
+                              ValidationError)
+from werkzeug.urls import url_quote, url_encode
+
+
+class UrlBuilder(object):
+    """
+    Pre-compiled URL builder for a single endpoint.
+
+    Werkzeug's ``MapAdapter.build`` walks every rule for the endpoint and
+    re-parses them on each call. Kibble builds links for every row of a list
+    page, so the rules of each view are compiled once into a list of static
+    strings and converter instances which are then joined together directly.
+
+    The output matches :py:func:`flask.url_for`. Anything the builder can't
+    handle (external urls, anchors, url defaults, subdomains) returns
+    ``None`` and the caller should fall back to :py:func:`flask.url_for`.
+
+    :param endpoint: The full endpoint name, e.g. ``kibble.testmodel_list``.
+    """
+
+    #: Arguments to :py:func:`flask.url_for` the builder can't handle.
+    UNSUPPORTED_ARGS = frozenset(['_external', '_anchor', '_method',
+                                  '_scheme'])
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self._rules = None
+        self._url_map = None
+
+    def compile(self, url_map):
+        """
+        Compile the rules for the endpoint from ``url_map``.
+
+        :returns: A list of ``(parts, arguments, defaults)`` tuples or ``None``
+            if the endpoint's rules can't be pre-compiled.
+        """
+        compiled = []
+        for rule in url_map.iter_rules(self.endpoint):
+            if rule.subdomain or getattr(rule, 'host', None) \
+                    or rule.build_only or rule.redirect_to:
+                return None
+
+            parts = []
+            for converter, args, variable in parse_rule(rule.rule):
+                if converter is None:
+                    parts.append((False, url_quote(
+                        variable, url_map.charset, safe='/:|+')))
+                    continue
+
+                if args:
+                    c_args, c_kwargs = parse_converter_args(args)
+                else:
+                    c_args, c_kwargs = (), {}
+                parts.append((variable, url_map.converters[converter](
+                    url_map, *c_args, **c_kwargs)))
+
+            compiled.append((parts, rule.arguments, rule.defaults or {}))
+
+        return compiled or None
+
+    def _rules_for(self, url_map):
+        if self._url_map is not url_map:
+            self._rules = self.compile(url_map)
+            self._url_map = url_map
+        return self._rules
+
+    def build(self, **values):
+        """
+        Build the URL for the endpoint.
+
+        :param \*\*values: The same keyword arguments as accepted by
+            :py:func:`flask.url_for`.
+        :returns: The URL or ``None`` if it can't be built by the builder.
+        """
+        if self.UNSUPPORTED_ARGS.intersection(values):
+            return None
+
+        app = flask.current_app
+        blueprint = self.endpoint.rpartition('.')[0]
+        if app.url_default_functions.get(None) \
+                or app.url_default_functions.get(blueprint):
+            return None
+
+        url_map = app.url_map
+        rules = self._rules_for(url_map)
+        if not rules:
+            return None
+
+        values = dict((k, v) for k, v in values.iteritems() if v is not None)
+
+        for parts, arguments, defaults in rules:
+            path = self._build_rule(parts, arguments, defaults, values)
+            if path is not None:
+                break
+        else:
+            return None
+
+        url = flask.request.script_root.rstrip('/') + '/' + path.lstrip('/')
+
+        query = MultiDict(values)
+        for arg in arguments:
+            query.pop(arg, None)
+
+        if query:
+            url += '?' + url_encode(query, charset=url_map.charset,
+                                    sort=url_map.sort_parameters,
+                                    key=url_map.sort_key)
+        return str(url)
+
+    def _build_rule(self, parts, arguments, defaults, values):
+        for arg in arguments:
+            if arg not in defaults and arg not in values:
+                return None
+
+        for arg, default in defaults.iteritems():
+            if arg in values and values[arg] != default:
+                return None
+
+        out = []
+        for variable, part in parts:
+            if variable is False:
+                out.append(part)
+                continue
+
+            try:
+                out.append(part.to_url(values[variable]))
+            except ValidationError:
+                return None
+
+        return u''.join(out)
@@ -5,9 +5,94 @@ from google.appengine.ext import ndb
 from google.net.proto.ProtocolBuffer import ProtocolBufferDecodeError
 from werkzeug.routing import BaseConverter, ValidationError
 
+from .cache import LRUCache
+
 logger = logging.getLogger(__name__)
 
 
+class KeyCodec(object):
+    """
+    Pre-compiled encoder/decoder between :py:class:`ndb.Key` objects and
+    their ``<kind>-<id>/<kind>-<id>`` url representation.
+
+    Codecs are shared between all converters for the same kinds, and keep a
+    bounded cache of recent conversions in each direction.
+
+    :param kinds: The NDB model kinds of the key path.
+    :param separator: The separator between each ``<kind>-<id>`` pair.
+    """
+
+    #: Maximum number of conversions to remember in each direction.
+    CACHE_SIZE = 1000
+
+    _codecs = {}
+
+    def __init__(self, kinds, separator='/'):
+        self.kinds = kinds
+        self.separator = separator
+
+        kinds_lower = [x.lower() for x in kinds]
+        self.regex = separator.join([
+            r"{0}-[^{1}]+".format(kind, separator)
+            for kind in kinds_lower])
+        self._regex = re.compile(
+            separator.join([r"{0}-([^/]+)".format(kind)
+                            for kind in kinds_lower]))
+
+        self._kinds_lower = {}
+        self._encoded = LRUCache(self.CACHE_SIZE)
+        self._decoded = LRUCache(self.CACHE_SIZE)
+
+    @classmethod
+    def for_kinds(cls, kinds, separator='/'):
+        """
+        Return the shared codec for ``kinds``.
+        """
+        try:
+            return cls._codecs[(kinds, separator)]
+        except KeyError:
+            codec = cls._codecs[(kinds, separator)] = cls(kinds, separator)
+            return codec
+
+    def _lower(self, kind):
+        try:
+            return self._kinds_lower[kind]
+        except KeyError:
+            lower = self._kinds_lower[kind] = kind.lower()
+            return lower
+
+    @staticmethod
+    def _coerce_int(value):
+        try:
+            return int(value)
+        except ValueError:
+            return value
+
+    def encode(self, key):
+        url = self._encoded.get(key)
+        if url is None:
+            url = self.separator.join([
+                u'{0}-{1}'.format(self._lower(kind), unicode(i))
+                for kind, i in key.pairs()])
+            self._encoded.set(key, url)
+        return url
+
+    def decode(self, value):
+        # Cache the pairs rather than keys, as keys pick up the current app
+        # and namespace when they're made.
+        pairs = self._decoded.get(value)
+        if pairs is None:
+            match = self._regex.match(value)
+            if match is None:
+                raise ValidationError("Invalid URL")
+
+            pairs = tuple(zip(
+                self.kinds,
+                map(self._coerce_int, match.groups())))
+            self._decoded.set(value, pairs)
+        return ndb.Key(pairs=pairs)
+
+
 class NDBKeyConverter(BaseConverter):
     """
     URLConverter for NDB Key objects.
@@ -24,32 +109,31 @@ class NDBKeyConverter(BaseConverter):
         self.separator = '/'
 
         if self.urlsafe:
-            kinds_lower = [x.lower() for x in kinds]
-            self.regex = self.separator.join([r"{0}-[^{1}]+".format(
-                kind, self.separator)
-                for kind in kinds_lower])
-
-            self._regex = re.compile(
-                self.separator.join(
-                    [r"{0}-([^/]+)".format(kind) for kind in kinds_lower]))
+            self._codec = KeyCodec.for_kinds(kinds, self.separator)
+            self.regex = self._codec.regex
+            self._regex = self._codec._regex
 
     def to_url(self, key):
         if self.urlsafe:
             if isinstance(key, ndb.Model):
                 key = key.key
 
-            return self.separator.join(
-                '{0}-{1}'.format(
-                    kind.lower(),
-                    unicode(i)) for kind, i in key.pairs())
+            return self._codec.encode(key)
         else:
             return key.urlsafe()
 
+    def to_urls(self, keys):
+        """
+        Convert many keys to their url representation in one go.
+
+        :param keys: An iterable of :py:class:`ndb.Key` or
+            :py:class:`ndb.Model` instances.
+        :returns: List of url components.
+        """
+        return [self.to_url(key) for key in keys]
+
     def _coerce_int(self, value):
-        try:
-            return int(value)
-        except ValueError:
-            return value
+        return KeyCodec._coerce_int(value)
 
     def to_python(self, value):
         if self.urlsafe:
@@ -64,13 +148,4 @@ class NDBKeyConverter(BaseConverter):
                 raise ValidationError("Invalid URL")
 
     def to_python_pairs(self, value):
-        ids = self._regex.findall(value)
-        if len(self.kinds) > 1:
-            ids = ids[0]
-        pairs = zip(self.kinds,
-                    map(self._coerce_int, ids))
-
-        key = ndb.Key(pairs=pairs)
-
-        return key
-
+        return self._codec.decode(value)
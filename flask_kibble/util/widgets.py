@@ -1,12 +1,16 @@
+import time
 from base64 import b64encode
 from functools import partial
 import flask
 
 import wtforms
 from wtforms.widgets import html_params
+from wtforms.csrf.core import CSRFTokenField
 from markupsafe import Markup
 from google.appengine.ext import blobstore
 
+from flask_kibble.util.cache import LRUCache
+
 
 class JSUploadWidget(object):
     template = 'kibble/widgets/jsupload.html'
@@ -32,16 +36,27 @@ class JSUploadWidget(object):
 class TabluarFormListWidget(object):
     template = 'kibble/widgets/tabularformlist.html'
 
+    #: Seconds to reuse the rendered template for new rows, or 0 to render
+    #: it every time. The template is shared by every user and request with
+    #: the same inner fields, so only turn this on if they render the same
+    #: for everyone. Inner forms with uploads, key selects or a CSRF token
+    #: are never cached.
+    cache_time = 0
+
+    _empty_templates = LRUCache(200)
+
     def __init__(self, template=None, **context):
         self.template = template or self.template
         self.context = context
 
     def __call__(self, field, **kwargs):
+        empty = self.empty_row(field)
         html = flask.render_template(
             self.template,
             field=field,
             kwargs=kwargs,
-            empty_row=partial(self.empty_row, field),
+            empty_row=partial(self._empty_row, field, empty),
+            empty_template=partial(self.empty_template, field, empty),
             base64=b64encode,
             **self.context
         )
@@ -54,6 +69,54 @@ class TabluarFormListWidget(object):
         f = inner_form(prefix=prefix)
         return f
 
+    def _empty_row(self, field, empty, token=None):
+        if token is None:
+            return empty
+        return self.empty_row(field, token)
+
+    def _empty_template_key(self, field, empty):
+        return (
+            type(empty).__name__,
+            field.name,
+            self.template,
+            repr(sorted(self.context.items())),
+            tuple(
+                (f.name, type(f), unicode(f.label.text), repr(f.default),
+                 repr(getattr(f, 'choices', None)))
+                for f in empty),
+        )
+
+    def _cacheable(self, form):
+        """
+        Does ``form`` render the same for every user and request?
+        """
+        for f in form:
+            if isinstance(f, (wtforms.FieldList, CSRFTokenField)):
+                return False
+            if isinstance(f.widget, (JSUploadWidget, KeyWidget)):
+                return False
+            if isinstance(f, wtforms.FormField) and not self._cacheable(f.form):
+                return False
+        return True
+
+    def empty_template(self, field, empty, render_row):
+        """
+        The base64 encoded HTML of a new row, rendered with ``render_row``.
+        Cached for :attr:`cache_time` seconds.
+        """
+        cache = self.cache_time and self._cacheable(empty)
+        if cache:
+            key = self._empty_template_key(field, empty)
+            cached = self._empty_templates.get(key)
+            if cached is not None \
+                    and time.time() - cached[1] < self.cache_time:
+                return cached[0]
+
+        value = b64encode(unicode(render_row(empty)).encode('utf-8'))
+        if cache:
+            self._empty_templates.set(key, (value, time.time()))
+        return value
+
 
 class TabularFormWidget(object):
     template = 'kibble/widgets/tabularform.html'
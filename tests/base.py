@@ -1,11 +1,14 @@
 import mock
 import flask
+import functools
+from contextlib import contextmanager
 
 from flask_gae.testing import TestCase as GAETestCase
 
 from google.appengine.ext import ndb
 
 import flask_kibble as kibble
+from flask_kibble import profiler
 
 
 ndb.utils.DEBUG = False
@@ -68,3 +71,49 @@ class TestCase(GAETestCase):
                 msg="Message category mismatch. Expected %r got %r" % (
                     expected_category, category))
 
+    @contextmanager
+    def assertRpcBudget(self, rpcs=None, reads=None, writes=None,
+                        service='datastore_v3'):
+        """
+        Assert the code in the block stays within a datastore budget.
+
+        The in-context cache is cleared first so cached entities don't hide
+        reads.
+
+        :param rpcs: Maximum number of calls to ``service``.
+        :param reads: Maximum number of entities read by gets and queries.
+        :param writes: Maximum number of entities put or deleted.
+        """
+        ndb.get_context().clear_cache()
+
+        profile = profiler.start('budget')
+        try:
+            yield profile
+        finally:
+            profiler.stop(profile)
+
+        def _check(name, limit, actual):
+            if limit is not None and actual > limit:
+                raise AssertionError(
+                    "%s budget exceeded: %d > %d\n%s" % (
+                        name, actual, limit,
+                        '\n'.join('  %s.%s %s x%s (%s)' % (
+                            r.service, r.call, r.kind, r.batch_size,
+                            r.origin) for r in profile)))
+
+        _check('RPC', rpcs, profile.count(service))
+        _check('Read', reads, profile.reads(service))
+        _check('Write', writes, profile.writes(service))
+
+
+def rpc_budget(rpcs=None, reads=None, writes=None, service='datastore_v3'):
+    """
+    Decorator form of :meth:`TestCase.assertRpcBudget`.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            with self.assertRpcBudget(rpcs, reads, writes, service):
+                return fn(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,4 +1,5 @@
 import mock
+import flask
 from cStringIO import StringIO
 from google.appengine.ext import ndb
 
@@ -6,6 +7,7 @@ from .base import TestCase, TestAuthenticator
 from .models import TestModel
 
 import flask_kibble as kibble
+from flask_kibble import blueprint
 from flask_kibble.base import KibbleView
 
 
@@ -162,3 +164,108 @@ class BlueprintUploadTestCase(TestCase):
             })
 
             cuf.assert_called_once_with(blobstore.BlobInfo.get('BLOBKEY'))
+
+
+class OtherDummyView(DummyView):
+    action = 'other'
+    hidden = True
+
+
+class BlueprintSnapshotTestCase(TestCase):
+    def create_app(self):
+        return self._create_app(DummyView, OtherDummyView)
+
+    def test_groups(self):
+        snapshot = self.kibble.snapshot
+
+        self.assertEqual(len(snapshot.groups), 1)
+        header, entries = snapshot.groups[0]
+        self.assertIsNone(header)
+        self.assertEqual(len(entries), 1)
+
+        entry = entries[0]
+        self.assertEqual(entry.path, 'TestModel')
+        self.assertEqual(entry.label, 'Test Model')
+        self.assertEqual(entry.ancestor_labels, ())
+        self.assertIs(entry.primary, DummyView)
+        # Hidden views don't show up
+        self.assertEqual(entry.actions, (('dummy', DummyView),))
+
+    def test_cached(self):
+        snapshot = self.kibble.snapshot
+        self.assertIs(self.kibble.snapshot, snapshot)
+
+        class AnotherView(DummyView):
+            action = 'another'
+
+        self.kibble.register_view(AnotherView)
+        self.assertIsNot(self.kibble.snapshot, snapshot)
+
+    def test_all_permissions(self):
+        self.assertEqual(list(self.kibble.all_permissions()), [
+            (None, 'kibble.index'),
+            (None, 'kibble.static'),
+            (TestModel, 'dummy'),
+            (TestModel, 'other'),
+        ])
+
+    def test_label_for_kind(self):
+        self.assertEqual(self.kibble.label_for_kind('TestModel'),
+                         'Test Model')
+        self.app.config['KIBBLE_KIND_LABELS'] = {'OtherModel': 'Other'}
+        self.assertEqual(self.kibble.label_for_kind('OtherModel'), 'Other')
+
+    def test_labels_rebuilt(self):
+        self.assertEqual(self.kibble.label_for_kind(TestModel), 'Test Model')
+        self.app.config['KIBBLE_KIND_LABELS'] = {'TestModel': 'Tests'}
+
+        class AnotherView(DummyView):
+            action = 'another'
+
+        # Labels are kept with the snapshot.
+        self.kibble.register_view(AnotherView)
+        self.assertEqual(self.kibble.label_for_kind(TestModel), 'Tests')
+        entry, = self.kibble.snapshot.groups[0][1]
+        self.assertEqual(entry.label, 'Tests')
+
+
+class BlueprintFragmentCacheTestCase(TestCase):
+    def create_app(self):
+        return self._create_app(DummyView)
+
+    def test_not_cached(self):
+        caller = mock.Mock(return_value=u'<ul></ul>')
+
+        self.kibble.cached_fragment('menu', caller=caller)
+        self.kibble.cached_fragment('menu', caller=caller)
+        self.assertEqual(caller.call_count, 2)
+
+    def test_disabled_logged_once(self):
+        caller = mock.Mock(return_value=u'<ul></ul>')
+        with mock.patch.object(blueprint.logger, 'info') as info:
+            self.kibble.cached_fragment('menu', caller=caller)
+            self.kibble.cached_fragment('menu', caller=caller)
+        self.assertEqual(info.call_count, 1)
+
+    def test_cached(self):
+        self.authenticator.permission_fingerprint.return_value = 'perms'
+        caller = mock.Mock(return_value=u'<ul></ul>')
+
+        self.assertEqual(
+            self.kibble.cached_fragment('menu', 'TestModel', caller=caller),
+            u'<ul></ul>')
+        self.assertEqual(
+            self.kibble.cached_fragment('menu', 'TestModel', caller=caller),
+            u'<ul></ul>')
+        caller.assert_called_once_with()
+
+    def test_key(self):
+        self.authenticator.permission_fingerprint.return_value = 'perms'
+        key = self.kibble.fragment_key('menu')
+        self.assertNotEqual(key, self.kibble.fragment_key('menu', 'Kind'))
+        self.assertNotEqual(key, self.kibble.fragment_key('index'))
+
+        # Changing permissions changes the key.
+        del flask.g._kibble_permission_fingerprint
+        self.authenticator.permission_fingerprint.return_value = 'other'
+        self.assertNotEqual(key, self.kibble.fragment_key('menu'))
@@ -0,0 +1,76 @@
+"""
+Datastore budgets for the built-in views.
+
+These catch regressions such as per-row gets in lists, or lookups being
+repeated between the permission check and the view.
+"""
+from werkzeug.datastructures import MultiDict
+
+from .base import TestCase, rpc_budget
+from .models import TestModel
+
+import flask_kibble as kibble
+
+
+class BudgetList(kibble.List):
+    model = TestModel
+    list_display = (unicode, 'name', 'model_member_async')
+
+
+class BudgetEdit(kibble.Edit):
+    model = TestModel
+
+
+class BudgetDelete(kibble.Delete):
+    model = TestModel
+    recursive = True
+
+
+class BudgetTestCase(TestCase):
+    render_templates = True
+
+    def create_app(self):
+        return self._create_app(BudgetList, BudgetEdit, BudgetDelete)
+
+    def setUp(self):
+        self.parent = TestModel(name='parent', id='parent')
+        self.parent.put()
+
+        for i in range(60):
+            TestModel(name='child-%d' % i, parent=self.parent.key).put()
+
+    def test_list_page_sizes(self):
+        for page_size in (5, 20, 50):
+            # Count, fetch, and possibly a continuation for the page.
+            with self.assertRpcBudget(rpcs=4, reads=page_size, writes=0):
+                resp = self.client.get(
+                    '/testmodel/?page-size=%d' % page_size)
+            self.assert200(resp)
+
+    def test_list_ancestor(self):
+        for page_size in (5, 50):
+            # As above, plus the ancestors in a single batch.
+            with self.assertRpcBudget(rpcs=5, reads=page_size + 1,
+                                      writes=0):
+                resp = self.client.get(
+                    '/testmodel-parent/testmodel/?page-size=%d' % page_size)
+            self.assert200(resp)
+
+    @rpc_budget(rpcs=1, reads=1, writes=0)
+    def test_edit_get(self):
+        resp = self.client.get('/testmodel-parent/')
+        self.assert200(resp)
+
+    @rpc_budget(rpcs=5, reads=2, writes=1)
+    def test_edit_post(self):
+        resp = self.client.post('/testmodel-parent/',
+                                data=MultiDict({'name': 'renamed'}))
+        self.assertStatus(resp, 302)
+
+    def test_recursive_delete(self):
+        # The descendants are found with one query and deleted in one batch,
+        # however many there are.
+        with self.assertRpcBudget(rpcs=4, writes=61):
+            resp = self.client.post('/testmodel-parent/delete/')
+        self.assertStatus(resp, 302)
+        self.assertEqual(TestModel.query().count(), 0)
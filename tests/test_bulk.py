@@ -0,0 +1,131 @@
+import mock
+from werkzeug.datastructures import MultiDict
+
+from google.appengine.ext import ndb
+
+from .base import TestCase
+from .models import TestModel, InnerModel
+
+import flask_kibble as kibble
+from flask_kibble import bulk, signals
+from flask_kibble.blueprint import MenuEntry
+
+
+class TestBulkEdit(kibble.BulkEdit):
+    model = TestModel
+
+
+class TestList(kibble.List):
+    model = TestModel
+    linked_actions = ['bulk_edit']
+
+
+class BulkEditTestCase(TestCase):
+    render_templates = True
+
+    def create_app(self):
+        return self._create_app(TestBulkEdit, TestList)
+
+    def setUp(self):
+        self.k1 = TestModel(id=1, name='one').put()
+        self.k2 = TestModel(id=2, name='two', parent=self.k1).put()
+        self.k3 = TestModel(id=3, name='three', other_field_1='x').put()
+        self.keys = [self.k1, self.k2, self.k3]
+
+    def post(self, keys, **data):
+        form = MultiDict([('key', k.urlsafe()) for k in keys])
+        for name, value in data.items():
+            form.setlist(name, value if isinstance(value, list) else [value])
+        return self.client.post('/testmodel/bulk-edit/', data=form)
+
+    def test_list_selection(self):
+        resp = self.client.get('/testmodel/')
+        self.assert200(resp)
+        self.assertIn("name='key' value='%s'" % self.k1.urlsafe(), resp.data)
+        self.assertIn("formaction='/testmodel/bulk-edit/'", resp.data)
+
+    def test_selection(self):
+        resp = self.post(self.keys)
+        self.assert200(resp)
+        self.assertTemplateUsed('kibble/bulk_edit.html')
+        self.assertEqual(self.get_context_variable('keys'), self.keys)
+        self.assertFalse(self.get_context_variable('no_fields'))
+
+    def test_no_selection(self):
+        resp = self.post([])
+        self.assertStatus(resp, 302)
+
+    def test_wrong_kind(self):
+        resp = self.post([ndb.Key(InnerModel, 1)])
+        self.assert400(resp)
+
+    def test_no_fields(self):
+        resp = self.post(self.keys, __bulk_edit='1', other_field_1='x')
+        self.assert200(resp)
+        self.assertTrue(self.get_context_variable('no_fields'))
+        self.assertEqual(self.k1.get().other_field_1, 'other1')
+
+    def test_apply(self):
+        # The name isn't applied, so it's not validated either.
+        with self.assertRpcBudget(writes=2):
+            resp = self.post(self.keys, __bulk_edit='1',
+                             __apply='other_field_1',
+                             other_field_1='x', name='')
+        self.assertStatus(resp, 302)
+        self.assertFlashes('Updated 2 of 3', 'success')
+
+        for key, name in zip(self.keys, ['one', 'two', 'three']):
+            inst = key.get()
+            self.assertEqual(inst.name, name)
+            self.assertEqual(inst.other_field_1, 'x')
+
+    def test_apply_invalid(self):
+        resp = self.post(self.keys, __bulk_edit='1', __apply='name', name='')
+        self.assert200(resp)
+        self.assertEqual(self.k1.get().name, 'one')
+
+    @mock.patch.object(TestBulkEdit, 'transactional', True)
+    def test_transaction_per_group(self):
+        with mock.patch.object(bulk.ndb, 'transaction_async',
+                               wraps=ndb.transaction_async) as tx:
+            resp = self.post(self.keys, __bulk_edit='1',
+                             __apply='other_field_2', other_field_2='y')
+        self.assertStatus(resp, 302)
+        self.assertEqual(tx.call_count, 2)
+        self.assertEqual([k.get().other_field_2 for k in self.keys],
+                         ['y', 'y', 'y'])
+
+    @mock.patch.object(TestBulkEdit, 'batch_signals', True)
+    def test_batch_signals(self):
+        sent = []
+
+        def _receiver(action, **kwargs):
+            sent.append(kwargs)
+        signals.post_action.connect(_receiver)
+        self.addCleanup(signals.post_action.disconnect, _receiver)
+
+        self.post(self.keys, __bulk_edit='1',
+                  __apply='other_field_1', other_field_1='x')
+
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(sent[0]['keys'], [self.k1, self.k2])
+
+    def test_permission_per_key(self):
+        self.authenticator.has_permission_for.side_effect = \
+            lambda model, action, key=None, **kwargs: \
+            action != 'edit' or key != self.k3
+
+        resp = self.post(self.keys, __bulk_edit='1',
+                         __apply='other_field_1', other_field_1='x')
+        self.assert403(resp)
+        self.assertEqual(self.k1.get().other_field_1, 'other1')
+
+    def test_is_descendant(self):
+        self.assertTrue(bulk._is_descendant(self.k2, self.k1))
+        self.assertFalse(bulk._is_descendant(self.k2, self.k3))
+        self.assertFalse(bulk._is_descendant(self.k1, self.k1))
+
+    def test_not_a_menu_action(self):
+        path = TestList.path()
+        entry = MenuEntry(self.kibble, path, self.kibble.registry[path])
+        self.assertEqual([name for name, _ in entry.model_actions], ['list'])
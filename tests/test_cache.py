@@ -0,0 +1,33 @@
+from unittest import TestCase
+
+from flask_kibble.util.cache import LRUCache
+
+
+class LRUCacheTestCase(TestCase):
+    def test_get_set(self):
+        c = LRUCache(2)
+        self.assertIsNone(c.get('a'))
+        c.set('a', 1)
+        self.assertEqual(c.get('a'), 1)
+        self.assertIn('a', c)
+
+    def test_evicts_least_recent(self):
+        c = LRUCache(2)
+        c.set('a', 1)
+        c.set('b', 2)
+        c.get('a')
+        c.set('c', 3)
+
+        self.assertEqual(len(c), 2)
+        self.assertNotIn('b', c)
+        self.assertEqual(c.get('a'), 1)
+        self.assertEqual(c.get('c'), 3)
+
+    def test_delete_clear(self):
+        c = LRUCache(2)
+        c.set('a', 1)
+        c.delete('a')
+        self.assertNotIn('a', c)
+        c.set('b', 2)
+        c.clear()
+        self.assertEqual(len(c), 0)
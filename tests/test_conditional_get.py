@@ -0,0 +1,94 @@
+import mock
+from werkzeug.datastructures import MultiDict
+
+from .base import TestCase
+from .models import TestModel
+
+import flask_kibble as kibble
+from flask_kibble import list as kibble_list
+
+
+class ConditionalList(kibble.List):
+    model = TestModel
+    conditional_get = True
+
+
+class ConditionalEdit(kibble.Edit):
+    model = TestModel
+    conditional_get = True
+
+
+class ConditionalGetTestCase(TestCase):
+    def create_app(self):
+        app = self._create_app(ConditionalList, ConditionalEdit)
+        self.authenticator.permission_fingerprint = lambda: 'all'
+        return app
+
+    def setUp(self):
+        TestModel(name='a', id='a').put()
+
+    def assertNotModified(self, url, etag):
+        resp = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertStatus(resp, 304)
+        self.assertEqual(resp.data, '')
+        return resp
+
+    def test_list(self):
+        resp = self.client.get('/testmodel/')
+        self.assert200(resp)
+        etag = resp.headers['ETag']
+        self.assertEqual(resp.headers['Cache-Control'], 'private, no-cache')
+
+        self.assertNotModified('/testmodel/', etag)
+
+        # Other arguments, other page.
+        resp = self.client.get('/testmodel/?page-size=1',
+                               headers={'If-None-Match': etag})
+        self.assert200(resp)
+
+    @mock.patch.object(ConditionalList, 'inline_edit', ['name'])
+    def test_list_inline_edit_expires(self):
+        with mock.patch.object(kibble_list.time, 'time', return_value=0):
+            etag = self.client.get('/testmodel/').headers['ETag']
+            self.assertNotModified('/testmodel/', etag)
+
+        # The page's CSRF token may have expired.
+        with mock.patch.object(kibble_list.time, 'time',
+                               return_value=ConditionalList.etag_lifetime):
+            resp = self.client.get('/testmodel/',
+                                   headers={'If-None-Match': etag})
+        self.assert200(resp)
+
+    def test_edit(self):
+        resp = self.client.get('/testmodel-a/')
+        self.assert200(resp)
+        etag = resp.headers['ETag']
+
+        with self.assertRpcBudget(rpcs=0):
+            self.assertNotModified('/testmodel-a/', etag)
+
+    def test_invalidated_by_save(self):
+        list_etag = self.client.get('/testmodel/').headers['ETag']
+        edit_etag = self.client.get('/testmodel-a/').headers['ETag']
+
+        resp = self.client.post('/testmodel-a/',
+                                data=MultiDict({'name': 'b'}))
+        self.assertStatus(resp, 302)
+
+        # Consume the flashed message.
+        self.client.get('/testmodel/')
+
+        resp = self.client.get('/testmodel/',
+                               headers={'If-None-Match': list_etag})
+        self.assert200(resp)
+        resp = self.client.get('/testmodel-a/',
+                               headers={'If-None-Match': edit_etag})
+        self.assert200(resp)
+
+    def test_permission_checked(self):
+        etag = self.client.get('/testmodel-a/').headers['ETag']
+
+        self.authenticator.has_permission_for.return_value = False
+        resp = self.client.get('/testmodel-a/',
+                               headers={'If-None-Match': etag})
+        self.assert403(resp)
@@ -1,12 +1,17 @@
 import mock
 import flask
+import wtforms
 from werkzeug.datastructures import MultiDict
 
+from google.appengine.ext import ndb
+from google.appengine.api import datastore_errors
+
 from .base import TestCase, ModelEqualityTester
 from .models import TestModel
 
 import flask_kibble as kibble
-from flask_kibble import edit
+from flask_kibble import edit, signals
+from flask_kibble.util.ndb import entity_version
 
 
 class TestCreate(kibble.Create):
@@ -263,6 +268,17 @@ class EditTestCase(TestCase):
         self.assertNoPreSignalSent()
         self.assertNoPostSignalSent()
 
+    def test_prefetch(self):
+        futures = TestEdit.prefetch(key=self.inst.key)
+        self.assertEqual(futures['instance'].get_result(), self.inst)
+        self.assertEqual(futures['ancestors'].get_result(), [])
+
+    @mock.patch.object(TestEdit, 'prefetch', wraps=TestEdit.prefetch)
+    def test_get_prefetches(self, prefetch):
+        resp = self.client.get('/testmodel-test/')
+        self.assert200(resp)
+        prefetch.assert_called_once_with(key=self.inst.key)
+
     @mock.patch.object(TestEdit, 'get_success_response')
     @mock.patch.object(TestEdit, 'save_model')
     def test_post_valid_data(self, save_model, get_success_response):
@@ -376,3 +392,194 @@ class FieldsetIteratorTestCase(TestCase):
             ['other_field_3']
         )
 
+    def test_layout_cached(self):
+        fsi = self.get_iterator()
+        self.assertIs(fsi._layout, self.get_iterator()._layout)
+
+    def test_hidden_and_missing(self):
+        class Form(wtforms.Form):
+            name = wtforms.StringField()
+            token = wtforms.HiddenField()
+            other = wtforms.StringField()
+
+        fsi = edit.FieldsetIterator(Form(), [
+            {'name': 'Missing', 'fields': ['missing']},
+            {'name': 'Name', 'fields': ['missing', 'name']},
+        ])
+
+        fieldsets = list(fsi)
+        self.assertEqual([fs.name for fs in fieldsets], ['Name', None])
+        self.assertEqual([x.name for x in fieldsets[0]], ['name'])
+        self.assertEqual([x.name for x in fieldsets[1]], ['other'])
+        self.assertEqual([x.name for x in fsi.hidden_fields], ['token'])
+
+
+class SaveModelTestCase(TestCase):
+    def create_app(self):
+        return self._create_app(TestEdit)
+
+    def setUp(self):
+        self.inst = TestModel(id='test', name='test')
+        self.inst.put()
+
+        self.payloads = []
+
+        def _receiver(action, **kwargs):
+            self.payloads.append(kwargs)
+        self.receiver = _receiver
+        signals.post_action.connect(self.receiver)
+        self.addCleanup(signals.post_action.disconnect, self.receiver)
+
+    def post(self, **changes):
+        data = {
+            'name': 'test',
+            'other_field_1': 'other1',
+            'other_field_2': 'other2',
+            'other_field_3': 'other3',
+        }
+        data.update(changes)
+        return self.client.post('/testmodel-test/', data=MultiDict(data))
+
+    def test_unchanged(self):
+        with self.assertRpcBudget(writes=0):
+            resp = self.post()
+        self.assertStatus(resp, 302)
+
+        self.assertFlashes("No changes to", "success")
+        self.assertEqual(self.payloads[0]['changed_properties'], 0)
+
+    def test_changed(self):
+        with self.assertRpcBudget(writes=1):
+            resp = self.post(name='test2', other_field_3='x')
+        self.assertStatus(resp, 302)
+
+        self.assertEqual(self.inst.key.get().name, 'test2')
+        self.assertFlashes("'test2' saved.", "success")
+        self.assertEqual(self.payloads[0]['changed_properties'], 2)
+        self.assertTrue(self.payloads[0]['indexed_changes'])
+
+
+class OptimisticEdit(kibble.Edit):
+    model = TestModel
+    optimistic = True
+
+
+class Counted(ndb.Model):
+    name = ndb.StringProperty()
+    count = ndb.IntegerProperty()
+
+
+class OptimisticCountedEdit(kibble.Edit):
+    model = Counted
+    optimistic = True
+
+
+class OptimisticEditTestCase(TestCase):
+    def create_app(self):
+        return self._create_app(OptimisticEdit, OptimisticCountedEdit)
+
+    def setUp(self):
+        self.inst = TestModel(id='test', name='test')
+        self.inst.put()
+        self.version = entity_version(self.inst)
+
+    def post(self, name, version):
+        return self.client.post('/testmodel-test/', data=MultiDict({
+            'name': name,
+            'other_field_1': 'other1',
+            'other_field_2': 'other2',
+            'other_field_3': 'other3',
+            '__version': version,
+        }))
+
+    def test_get(self):
+        resp = self.client.get('/testmodel-test/')
+        self.assert200(resp)
+        self.assertEqual(self.get_context_variable('version'), self.version)
+
+    def test_save_reads_once(self):
+        with self.assertRpcBudget(reads=1, writes=1):
+            resp = self.post('test2', self.version)
+        self.assertStatus(resp, 302)
+        self.assertEqual(self.inst.key.get().name, 'test2')
+
+    def test_conflict(self):
+        self.inst.other_field_1 = 'changed'
+        self.inst.put()
+
+        resp = self.post('test2', self.version)
+        self.assert200(resp)
+        self.assertEqual(self.inst.key.get().name, 'test')
+
+        conflict = self.get_context_variable('conflict')
+        self.assertEqual(
+            [(p._code_name, a, b) for p, a, b in conflict.differences],
+            [('name', 'test', 'test2'),
+             ('other_field_1', 'changed', 'other1')])
+
+        # Saving again with the new version overwrites.
+        version = self.get_context_variable('version')
+        self.assertEqual(version, entity_version(self.inst))
+        self.assertStatus(self.post('test2', version), 302)
+        self.assertEqual(self.inst.key.get().name, 'test2')
+
+    def test_missing(self):
+        self.inst.key.delete()
+        self.assert404(self.post('test2', self.version))
+
+    @mock.patch.object(edit.ndb, 'sleep')
+    def test_contention_retried(self, sleep):
+        contention = []
+
+        def _receiver(action, **kwargs):
+            contention.append(kwargs)
+        signals.contention.connect(_receiver)
+        self.addCleanup(signals.contention.disconnect, _receiver)
+
+        transaction = ndb.transaction
+        calls = []
+
+        def _transaction(callback, **kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                raise datastore_errors.TransactionFailedError()
+            return transaction(callback, **kwargs)
+
+        with mock.patch.object(edit.ndb, 'transaction',
+                               side_effect=_transaction):
+            resp = self.post('test2', self.version)
+
+        self.assertStatus(resp, 302)
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(contention[0]['retries'], 1)
+        self.assertFalse(contention[0]['failed'])
+
+    def test_missing_fields_kept(self):
+        key = Counted(id='test', name='test', count=3).put()
+        resp = self.client.post('/counted-test/', data=MultiDict({
+            'name': 'test2',
+            '__version': entity_version(key.get()),
+        }))
+        self.assertStatus(resp, 302)
+
+        inst = key.get()
+        self.assertEqual((inst.name, inst.count), ('test2', 3))
+
+    def test_pre_action_instance(self):
+        received = []
+
+        def _receiver(action, **kwargs):
+            received.append(kwargs)
+        signals.pre_action.connect(_receiver)
+        self.addCleanup(signals.pre_action.disconnect, _receiver)
+
+        self.assertStatus(self.post('test2', self.version), 302)
+        self.assertEqual(len(received), 1)
+        self.assertEqual(received[0]['instance'].key, self.inst.key)
+        self.assertEqual(received[0]['key'], self.inst.key)
+
+    def test_default_retries(self):
+        view = TestEdit()
+        with mock.patch.object(edit.ndb, 'transaction') as transaction:
+            view._run_transaction(mock.sentinel.CALLBACK)
+        transaction.assert_called_once_with(mock.sentinel.CALLBACK)
@@ -0,0 +1,205 @@
+import mock
+from StringIO import StringIO
+
+from google.appengine.ext import ndb
+
+from .base import TestCase
+from .models import TestModel
+
+import flask_kibble as kibble
+from flask_kibble import importer
+
+
+class TestImport(kibble.Import):
+    model = TestModel
+    batch_size = 2
+
+
+CSV = (
+    "name,other_field_1\n"
+    "one,a\n"
+    ",b\n"
+    "three,\"c\nc\"\n"
+    "four,d,extra\n"
+    "five,e\n"
+)
+
+JSONL = (
+    '{"id": "a", "name": "one", "other_field_1": 1}\n'
+    '\n'
+    '{"id": 2, "name": "two"}\n'
+    'not json\n'
+)
+
+
+class ImportTestCase(TestCase):
+    def create_app(self):
+        return self._create_app(TestImport)
+
+    def setUp(self):
+        self.data = CSV
+        open_file = mock.patch.object(
+            TestImport, 'open_file',
+            side_effect=lambda job: StringIO(self.data))
+        open_file.start()
+        self.addCleanup(open_file.stop)
+
+        queue_job = mock.patch.object(TestImport, 'queue_job')
+        self.queue_job = queue_job.start()
+        self.addCleanup(queue_job.stop)
+
+    def create_job(self, format='csv', **kwargs):
+        job = importer.ImportJob(path='TestModel', action='import',
+                                 format=format, size=len(self.data),
+                                 **kwargs)
+        job.put()
+        return job
+
+    def run_job(self, job):
+        resp = self.client.post(
+            '/_import/run/', data={'job': job.key.id()},
+            headers={'X-AppEngine-QueueName': 'default'})
+        self.assert200(resp)
+        return job.key.get()
+
+    def names(self):
+        return sorted(m.name for m in TestModel.query())
+
+    def test_csv(self):
+        job = self.run_job(self.create_job())
+
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.progress, 100)
+        self.assertEqual(job.fieldnames, ['name', 'other_field_1'])
+        self.assertEqual(job.row, 5)
+        self.assertEqual(job.imported, 3)
+        self.assertEqual(job.error_count, 2)
+        self.assertEqual([row for row, _ in job.errors], [2, 4])
+        self.assertIn('name', job.errors[0][1])
+
+        self.assertEqual(self.names(), ['five', 'one', 'three'])
+        three = TestModel.query(TestModel.name == 'three').get()
+        self.assertEqual(three.other_field_1, 'c\nc')
+
+    def test_jsonl(self):
+        self.data = JSONL
+        job = self.run_job(self.create_job('jsonl'))
+
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.imported, 2)
+        self.assertEqual(job.errors[0][0], 3)
+
+        self.assertEqual(ndb.Key(TestModel, 'a').get().other_field_1, '1')
+        self.assertEqual(ndb.Key(TestModel, 2).get().name, 'two')
+
+    def test_start_row(self):
+        job = self.run_job(self.create_job(start_row=3))
+        self.assertEqual(job.imported, 2)
+        self.assertEqual(job.error_count, 1)
+        self.assertEqual(self.names(), ['five', 'three'])
+
+    @mock.patch.object(TestImport, 'task_time', -1)
+    def test_continued(self):
+        job = self.run_job(self.create_job())
+
+        # Stopped after the first batch and queued the rest.
+        self.assertEqual(job.status, 'running')
+        self.assertEqual(job.row, 2)
+        self.assertEqual(job.imported, 1)
+        self.assertTrue(0 < job.progress < 100)
+        self.queue_job.assert_called_once_with(mock.ANY)
+
+        while job.status == 'running':
+            job = self.run_job(job)
+
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.imported, 3)
+        self.assertEqual(self.names(), ['five', 'one', 'three'])
+
+    def test_failed(self):
+        with mock.patch.object(TestImport, 'build_instance',
+                               side_effect=ValueError):
+            job = self.run_job(self.create_job())
+        self.assertEqual(job.status, 'failed')
+
+    def test_failed_checkpoint(self):
+        build_instance = TestImport.build_instance.im_func
+
+        def _build(view, form, row, job):
+            if row['name'] == 'three':
+                raise ValueError()
+            return build_instance(view, form, row, job)
+
+        with mock.patch.object(TestImport, 'build_instance', _build):
+            job = self.run_job(self.create_job())
+
+        # Saved as of the last batch written, not the failed row.
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.row, 2)
+        self.assertEqual(job.error_count, 1)
+        self.assertEqual(self.names(), ['one'])
+
+    @mock.patch.object(importer.taskqueue, 'add')
+    def test_task_names(self, add):
+        job = self.create_job()
+        with self.app.test_request_context('/testmodel/import/'):
+            kibble.Import.queue_job(TestImport(), job)
+            job.attempt += 1
+            kibble.Import.queue_job(TestImport(), job)
+
+        names = [c[1]['name'] for c in add.call_args_list]
+        self.assertEqual(names, [
+            'kibble-import-%d-0-0' % job.key.id(),
+            'kibble-import-%d-1-0' % job.key.id(),
+        ])
+
+    def test_run_requires_task_queue(self):
+        job = self.create_job()
+        resp = self.client.post('/_import/run/', data={'job': job.key.id()})
+        self.assert403(resp)
+        self.assertEqual(job.key.get().status, 'pending')
+
+    @mock.patch.object(importer.blobstore.BlobInfo, 'get',
+                       return_value=None)
+    def test_upload(self, blob_info):
+        resp = self.client.post('/testmodel/import/', data={
+            'file': (StringIO(''), 'rows.csv',
+                     'message/external-body; blob-key="abc"'),
+            'start_row': '1',
+        })
+        self.assertStatus(resp, 302)
+
+        job = importer.ImportJob.query().get()
+        self.assertEqual(job.format, 'csv')
+        self.assertEqual(str(job.blob_key), 'abc')
+        self.assertIn('job=%d' % job.key.id(), resp.location)
+        self.queue_job.assert_called_once_with(job)
+
+    def resume(self, job):
+        return self.client.post('/testmodel/import/', data={
+            'resume': job.key.id(),
+            'start_row': '1',
+        })
+
+    def test_resume(self):
+        job = self.create_job(status='failed')
+        self.assertStatus(self.resume(job), 302)
+        job = job.key.get()
+        self.assertEqual((job.status, job.attempt), ('pending', 1))
+        self.queue_job.assert_called_once_with(job)
+
+        # Only failed jobs can be resumed.
+        self.assert400(self.resume(job))
+
+    def test_resume_other_ancestor(self):
+        job = self.create_job(status='failed',
+                              ancestor=ndb.Key(TestModel, 1))
+        self.assert404(self.resume(job))
+        self.assertEqual(job.key.get().status, 'failed')
+
+    def test_job_list(self):
+        job = self.create_job()
+        importer.ImportJob(path='Other', action='import').put()
+
+        self.assert200(self.client.get('/testmodel/import/'))
+        self.assertEqual(self.get_context_variable('jobs'), [job])
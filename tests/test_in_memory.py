@@ -0,0 +1,75 @@
+import mock
+import flask
+from google.appengine.api.datastore_errors import NeedIndexError
+
+from .base import TestCase
+from .models import TestModel
+
+import flask_kibble as kibble
+from flask_kibble.util import in_memory
+
+
+class FallbackList(kibble.List):
+    model = TestModel
+    list_display = ('name',)
+
+
+class InMemoryQueryTestCase(TestCase):
+    def create_app(self):
+        return self._create_app(FallbackList)
+
+    def setUp(self):
+        for name, other in [('a', 'z'), ('b', 'y'), ('c', 'x'), ('d', 'x')]:
+            TestModel(name=name, other_field_1=other,
+                      other_field_2='keep' if name != 'b' else 'drop').put()
+
+    def test_split_query(self):
+        query = TestModel.query(TestModel.other_field_2 == 'keep',
+                                TestModel.name > 'a')\
+            .order(-TestModel.name)
+
+        base, residual = in_memory.split_query(query)
+        self.assertEqual(base.filters, TestModel.other_field_2 == 'keep')
+        self.assertIsNone(base.orders)
+        self.assertEqual(residual, [TestModel.name > 'a'])
+
+    def test_fetch(self):
+        query = TestModel.query(TestModel.other_field_2 == 'keep',
+                                TestModel.name > 'a')\
+            .order(TestModel.other_field_1, -TestModel.name)
+
+        result = in_memory.fetch_in_memory_async(query).get_result()
+        self.assertEqual([e.name for e in result.entities], ['d', 'c'])
+        self.assertEqual(result.total, 2)
+        self.assertFalse(result.truncated)
+
+    def test_paginate_and_truncate(self):
+        query = TestModel.query().order(-TestModel.name)
+
+        result = in_memory.fetch_in_memory_async(
+            query, limit=1, offset=1, max_entities=3).get_result()
+        self.assertEqual([e.name for e in result.entities], ['b'])
+        self.assertEqual(result.total, 3)
+        self.assertTrue(result.truncated)
+
+    @mock.patch.object(FallbackList, 'in_memory_limit', 1000)
+    @mock.patch('flask.render_template')
+    def test_list_fallback(self, render_template):
+        render_template.side_effect = [NeedIndexError(), 'in-memory']
+
+        resp = self.client.get('/testmodel/')
+        self.assertEqual(resp.data, 'in-memory')
+
+        table = render_template.call_args[1]['table']
+        self.assertTrue(table.in_memory)
+        self.assertEqual(table.row_count, 4)
+
+    @mock.patch('flask.render_template')
+    def test_list_fallback_disabled(self, render_template):
+        # Off by default.
+        render_template.side_effect = [NeedIndexError(), 'need-index']
+
+        resp = self.client.get('/testmodel/')
+        self.assertEqual(resp.data, 'need-index')
+        self.assertEqual(render_template.call_args[0][0],
+                         'kibble/list.need_index.html')
@@ -0,0 +1,90 @@
+from .base import TestCase
+from .models import TestModel
+
+import flask_kibble as kibble
+from flask_kibble import indexes, query_filters
+from flask_kibble.util.query_stats import query_shape
+
+
+class IndexedList(kibble.List):
+    model = TestModel
+    ancestors = [TestModel]
+
+    sort_columns = (
+        kibble.query_composers.SortColumn('other_field_1'),
+    )
+    filter_filters = (
+        query_filters.ChoicesFilter('name', [('a', 'A')]),
+    )
+
+
+class IndexAdvisorTestCase(TestCase):
+    def create_app(self):
+        return self._create_app(IndexedList)
+
+    def test_builtin_indexes(self):
+        for query in [
+                TestModel.query(),
+                TestModel.query(TestModel.name == 'a',
+                                TestModel.other_field_1 == 'b'),
+                TestModel.query().order(-TestModel.name),
+                TestModel.query(TestModel.name > 'a').order(TestModel.name)]:
+            self.assertIsNone(indexes.index_for_shape(query_shape(query)))
+
+    def test_composite_index(self):
+        query = TestModel.query(TestModel.name == 'a',
+                                TestModel.other_field_2 > 'b')\
+            .order(-TestModel.other_field_1)
+
+        self.assertEqual(
+            indexes.index_for_shape(query_shape(query)),
+            indexes.Index('TestModel', False, (
+                ('name', '+'),
+                ('other_field_2', '+'),
+                ('other_field_1', '-'),
+            )))
+
+    def test_view_indexes(self):
+        self.assertEqual(indexes.view_indexes(IndexedList), set([
+            indexes.Index('TestModel', False, (
+                ('name', '+'), ('other_field_1', '+'))),
+            indexes.Index('TestModel', False, (
+                ('name', '+'), ('other_field_1', '-'))),
+            indexes.Index('TestModel', True, (('other_field_1', '+'),)),
+            indexes.Index('TestModel', True, (('other_field_1', '-'),)),
+            indexes.Index('TestModel', True, (
+                ('name', '+'), ('other_field_1', '+'))),
+            indexes.Index('TestModel', True, (
+                ('name', '+'), ('other_field_1', '-'))),
+        ]))
+        self.assertEqual(indexes.kibble_indexes(self.kibble),
+                         sorted(indexes.view_indexes(IndexedList)))
+
+    def test_yaml(self):
+        index = indexes.Index('TestModel', True, (
+            ('name', '+'), ('other_field_1', '-')))
+        self.assertEqual(
+            indexes.index_yaml([index]),
+            "indexes:\n\n"
+            "- kind: TestModel\n"
+            "  ancestor: yes\n"
+            "  properties:\n"
+            "  - name: name\n"
+            "  - name: other_field_1\n"
+            "    direction: desc\n")
+
+    def test_missing_index_log(self):
+        log = indexes.MissingIndexLog()
+        query = TestModel.query(TestModel.name == 'a')\
+            .order(TestModel.other_field_1)
+
+        for offset in (0, 20):
+            index = log.record(query_shape(query, limit=20, offset=offset),
+                               Exception('no index'))
+
+        missing, = log
+        self.assertEqual(missing.count, 2)
+        self.assertEqual(index, missing.index)
+        self.assertEqual(index.properties,
+                         (('name', '+'), ('other_field_1', '+')))
+        self.assertIn('- name: other_field_1', log.yaml())
@@ -0,0 +1,158 @@
+import json
+
+from google.appengine.ext import ndb
+
+from .base import TestCase
+from .models import TestModel, InnerModel
+
+import flask_kibble as kibble
+from flask_kibble import signals, manifest
+
+
+class TestList(kibble.List):
+    model = TestModel
+    list_display = ['name', 'other_field_1']
+    inline_edit = ['name', 'other_field_1']
+
+
+class TestEdit(kibble.Edit):
+    model = TestModel
+
+
+class ReadOnlyList(kibble.List):
+    model = InnerModel
+
+
+class ChildList(kibble.List):
+    model = InnerModel
+    ancestors = [TestModel]
+    list_display = ['value']
+    inline_edit = ['value']
+
+
+class InlineEditTestCase(TestCase):
+    render_templates = True
+
+    def create_app(self):
+        return self._create_app(TestList, TestEdit, ReadOnlyList, ChildList)
+
+    def setUp(self):
+        self.k1 = TestModel(id=1, name='one').put()
+        self.k2 = TestModel(id=2, name='two').put()
+
+    def patch(self, edits, url='/testmodel/'):
+        return self.client.patch(
+            url,
+            data=json.dumps({'edits': [
+                {'key': key.urlsafe(), 'field': field, 'value': value}
+                for key, field, value in edits
+            ]}),
+            content_type='application/json')
+
+    def test_list_cells(self):
+        resp = self.client.get('/testmodel/')
+        self.assert200(resp)
+        self.assertIn("data-inline-url='/testmodel/'", resp.data)
+        self.assertIn("data-key='%s' data-field='name'" % self.k1.urlsafe(),
+                      resp.data)
+
+    def test_edit(self):
+        with self.assertRpcBudget(writes=1):
+            resp = self.patch([(self.k1, 'name', 'new <one>')])
+        self.assert200(resp)
+        self.assertEqual(resp.json['errors'], [])
+        self.assertEqual(resp.json['cells'], [{
+            'key': self.k1.urlsafe(),
+            'field': 'name',
+            'html': 'new &lt;one&gt;',
+        }])
+        self.assertEqual(self.k1.get().name, 'new <one>')
+
+    def test_batch(self):
+        received = []
+
+        def _receiver(sender, **kwargs):
+            received.append(kwargs)
+
+        signals.post_action.connect(_receiver)
+        try:
+            with self.assertRpcBudget(writes=2):
+                resp = self.patch([
+                    (self.k1, 'name', 'uno'),
+                    (self.k1, 'other_field_1', 'x'),
+                    (self.k2, 'name', 'two'),
+                    ])
+        finally:
+            signals.post_action.disconnect(_receiver)
+
+        self.assert200(resp)
+        self.assertEqual(len(resp.json['cells']), 3)
+        inst = self.k1.get()
+        self.assertEqual((inst.name, inst.other_field_1), ('uno', 'x'))
+        self.assertEqual([r['changed_properties'] for r in received], [2, 0])
+
+    def test_unchanged(self):
+        with self.assertRpcBudget(writes=0):
+            resp = self.patch([(self.k1, 'name', 'one')])
+        self.assert200(resp)
+        self.assertEqual(len(resp.json['cells']), 1)
+
+    def test_invalid(self):
+        resp = self.patch([(self.k1, 'name', ''), (self.k2, 'name', 'b')])
+        self.assert200(resp)
+        self.assertEqual(len(resp.json['cells']), 1)
+        errors = resp.json['errors']
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0]['key'], self.k1.urlsafe())
+        self.assertEqual(errors[0]['field'], 'name')
+        self.assertEqual(self.k1.get().name, 'one')
+        self.assertEqual(self.k2.get().name, 'b')
+
+    def test_missing(self):
+        resp = self.patch([(ndb.Key(TestModel, 3), 'name', 'three')])
+        self.assert200(resp)
+        self.assertEqual(resp.json['cells'], [])
+        self.assertEqual(len(resp.json['errors']), 1)
+
+    def test_bad_requests(self):
+        self.assert400(self.patch([(self.k1, 'other_field_2', 'x')]))
+        self.assert400(self.patch([(ndb.Key(InnerModel, 1), 'name', 'x')]))
+        self.assert400(self.client.patch('/testmodel/', data='nope',
+                                         content_type='application/json'))
+        self.assert400(self.client.patch(
+            '/testmodel/', data=json.dumps({'edits': [
+                {'key': 'nope', 'field': 'name'}, {'field': 'name'}, 'x']}),
+            content_type='application/json'))
+        self.assertStatus(
+            self.patch([(ndb.Key(InnerModel, 1), 'value', 'x')],
+                       url='/innermodel/'),
+            405)
+
+    def test_permission(self):
+        self.authenticator.has_permission_for.side_effect = \
+            lambda model, action, **kwargs: action != 'edit'
+        self.assert403(self.patch([(self.k1, 'name', 'x')]))
+        self.assertEqual(self.k1.get().name, 'one')
+
+    def test_lazy_edit_view(self):
+        # Edit views registered from a manifest are LazyViews.
+        self.kibble.registry[TestList.path()]['edit'] = \
+            manifest.LazyView(manifest.view_entry(TestEdit))
+
+        resp = self.patch([(self.k1, 'name', 'uno')])
+        self.assert200(resp)
+        self.assertEqual(self.k1.get().name, 'uno')
+
+    def test_methods(self):
+        self.assertEqual(TestList.http_methods(), ['GET', 'PATCH'])
+        self.assertEqual(ReadOnlyList.http_methods(), ['GET'])
+
+    def test_ancestor(self):
+        inner = InnerModel(parent=self.k1, value='a').put()
+        self.assert400(self.patch([(inner, 'value', 'b')],
+                                  url='/testmodel-2/innermodel/'))
+        self.assertEqual(inner.get().value, 'a')
+
+        self.assert200(self.patch([(inner, 'value', 'b')],
+                                  url='/testmodel-1/innermodel/'))
+        self.assertEqual(inner.get().value, 'b')
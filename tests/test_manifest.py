@@ -0,0 +1,89 @@
+import os
+import json
+import tempfile
+
+import flask
+
+from .base import TestCase, TestAuthenticator
+from .models import TestModel
+
+import flask_kibble as kibble
+from flask_kibble import manifest
+from flask_kibble.base import KibbleView
+
+
+class ManifestView(KibbleView):
+    action = 'manifest'
+    model = TestModel
+
+    _url_patterns = [
+        ('/{kind_lower}/{action}/', {}),
+    ]
+
+    def dispatch_request(self):
+        return 'manifest-ok'
+
+
+class ManifestTestCase(TestCase):
+    def create_app(self):
+        fd, self.manifest_file = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump([manifest.view_entry(ManifestView)], f)
+
+        app = flask.Flask(__name__)
+        app.config['SECRET_KEY'] = 'test_secret'
+        app.config['DEBUG'] = True
+
+        self.kibble = kibble.Kibble('kibble', __name__, TestAuthenticator())
+        self.kibble.autodiscover([], manifest=self.manifest_file)
+        app.register_blueprint(self.kibble)
+        return app
+
+    def tearDown(self):
+        os.unlink(self.manifest_file)
+
+    def test_view_entry(self):
+        entry = manifest.view_entry(ManifestView)
+        self.assertEqual(entry['module'], 'tests.test_manifest')
+        self.assertEqual(entry['name'], 'ManifestView')
+        self.assertEqual(entry['kind'], 'TestModel')
+        self.assertEqual(entry['view_name'], 'testmodel_manifest')
+        self.assertEqual(entry['url_patterns'],
+                         [['/{kind_lower}/{action}/', {}]])
+
+    def test_lazy_registration(self):
+        view = self.kibble.registry['TestModel']['manifest']
+        self.assertIsInstance(view, manifest.LazyView)
+
+        # Manifest attributes don't import the view.
+        self.assertEqual(view.action, 'manifest')
+        self.assertEqual(view.view_name(), 'testmodel_manifest')
+        self.assertNotIn('view_class', view.__dict__)
+
+        resp = self.client.get('/testmodel/manifest/')
+        self.assert200(resp)
+        self.assertEqual(resp.data, 'manifest-ok')
+        self.assertIs(view.view_class, ManifestView)
+
+    def test_lazy_links(self):
+        view = self.kibble.registry['TestModel']['manifest']
+
+        # The menu and index don't import the view.
+        with self.app.test_request_context('/'):
+            flask.g.kibble = self.kibble
+            self.assertIs(view.model, TestModel)
+            self.assertEqual(view.ancestors, [])
+            self.assertEqual(view.button_class, 'btn-default')
+            self.assertTrue(view.has_permission_for())
+            self.assertEqual(view.url_for(blueprint='kibble'),
+                             '/testmodel/manifest/')
+        self.assertNotIn('view_class', view.__dict__)
+
+    def test_custom_links(self):
+        class CustomView(ManifestView):
+            @classmethod
+            def url_for(cls, *args, **kwargs):
+                return '/custom/'
+
+        self.assertTrue(manifest.view_entry(CustomView)['custom_links'])
+        self.assertFalse(manifest.view_entry(ManifestView)['custom_links'])
@@ -0,0 +1,72 @@
+import mock
+
+from google.appengine.ext import ndb
+
+from .base import TestCase
+from .models import TestModel
+
+from flask_kibble.util import ndb as kibble_ndb
+
+
+class InstanceAndAncestorsTestCase(TestCase):
+    def create_app(self):
+        return self._create_app()
+
+    def setUp(self):
+        self.k1 = TestModel(name='1', id=1).put()
+        self.k2 = TestModel(name='2', id=2, parent=self.k1).put()
+        self.k3 = TestModel(name='3', id=3, parent=self.k2).put()
+
+    def test_order(self):
+        objs = kibble_ndb.instance_and_ancestors(self.k3)
+        self.assertEqual([o.key for o in objs], [self.k1, self.k2, self.k3])
+
+    def test_missing(self):
+        key = ndb.Key(TestModel, 4, parent=self.k1)
+        objs = kibble_ndb.instance_and_ancestors(key)
+        self.assertEqual(objs[0].key, self.k1)
+        self.assertIsNone(objs[1])
+
+    def test_batched(self):
+        sibling = TestModel(name='4', id=4, parent=self.k2).put()
+
+        with mock.patch.object(kibble_ndb.ndb, 'get_multi_async',
+                               wraps=ndb.get_multi_async) as get_multi:
+            # Siblings only read what the context cache hasn't seen.
+            with self.assertRpcBudget(rpcs=2, reads=4):
+                kibble_ndb.instance_and_ancestors(self.k3)
+                objs = kibble_ndb.instance_and_ancestors(sibling)
+
+        self.assertEqual(get_multi.call_args_list[0],
+                         mock.call([self.k3, self.k2, self.k1]))
+        self.assertEqual([o.key for o in objs],
+                         [self.k1, self.k2, sibling])
+
+
+class UnindexedModel(ndb.Model):
+    name = ndb.StringProperty()
+    notes = ndb.TextProperty()
+    tags = ndb.StringProperty(repeated=True)
+
+
+class ChangedPropertiesTestCase(TestCase):
+    def create_app(self):
+        return self._create_app()
+
+    def test_unchanged(self):
+        inst = UnindexedModel(name='a', notes='b', tags=['c'])
+        before = kibble_ndb.snapshot_properties(inst)
+        inst.name = 'a'
+        self.assertEqual(kibble_ndb.changed_properties(inst, before), [])
+
+    def test_changed(self):
+        inst = UnindexedModel(name='a', notes='b', tags=['c'])
+        before = kibble_ndb.snapshot_properties(inst)
+
+        # Changes made in place are seen too.
+        inst.tags.append('d')
+        inst.notes = 'e'
+
+        changed = kibble_ndb.changed_properties(inst, before)
+        self.assertEqual([p._code_name for p in changed], ['notes', 'tags'])
+        self.assertEqual([p._indexed for p in changed], [False, True])
@@ -6,6 +6,7 @@ from .models import TestModel
 from .base import TestCase
 
 import flask_kibble as kibble
+from flask_kibble.util import changes
 
 
 class DummyOperation(kibble.Operation):
@@ -89,6 +90,11 @@ class OperationTestCase(TestCase):
 
         self.assertFlashes("dummy-message", "success")
 
+    def test_post_records_change(self):
+        with mock.patch.object(changes.entity_stamps, 'bump') as bump:
+            self.client.post('/testmodel-test/dummy/')
+        bump.assert_called_once_with(self.instance.key.urlsafe())
+
     def test_post_response_class(self):
         """
         run() returns a response class. This should be displayed
@@ -0,0 +1,144 @@
+import mock
+import flask
+
+from google.appengine.ext import ndb
+from google.appengine.ext.ndb import polymodel
+
+from .base import TestCase
+
+import flask_kibble as kibble
+from flask_kibble import list as kibble_list
+from flask_kibble import query_filters as qf
+from flask_kibble.polymodel import PolyClassPicker, PolyDispatcher
+
+
+class Animal(polymodel.PolyModel):
+    name = ndb.StringProperty()
+
+
+class Dog(Animal):
+    breed = ndb.StringProperty()
+
+
+class Cat(Animal):
+    pass
+
+
+class AnimalList(kibble.List):
+    model = Animal
+
+    list_display = ['name']
+    subclass_list_display = {
+        Dog: ['name', 'breed'],
+        'Cat': ['name', 'lives'],
+    }
+
+    def lives(self, instance):
+        return 9
+
+
+class AnimalEdit(PolyDispatcher, kibble.Edit):
+    model = Animal
+
+
+class DogEdit(AnimalEdit):
+    model = Dog
+
+
+class CatEdit(AnimalEdit):
+    model = Cat
+
+
+class AnimalCreate(PolyClassPicker, kibble.Create):
+    model = Animal
+
+
+class DogCreate(AnimalCreate):
+    model = Dog
+
+
+class PolyDispatcherTestCase(TestCase):
+    def create_app(self):
+        return self._create_app(AnimalEdit, AnimalCreate)
+
+    def test_sub_view_lookup(self):
+        self.assertEqual(AnimalEdit._sub_views_by_name, {
+            'Dog': DogEdit,
+            'Cat': CatEdit,
+        })
+        self.assertEqual(AnimalCreate._sub_views_by_name, {'Dog': DogCreate})
+
+    @mock.patch.object(DogEdit, '_form_logic', return_value='dog')
+    def test_dispatch_passes_instance(self, form_logic):
+        key = Dog(name='rex', id=1).put()
+
+        with mock.patch.object(ndb.Key, 'get_async', autospec=True,
+                               side_effect=ndb.Key.get_async) as get:
+            resp = self.client.get('/animal-1/')
+            self.assertEqual(get.call_count, 1)
+
+        self.assert200(resp)
+        self.assertEqual(resp.data, 'dog')
+        form_logic.assert_called_once_with(mock.ANY)
+        self.assertEqual(form_logic.call_args[0][0].key, key)
+
+    @mock.patch.object(CatEdit, 'accepts_instance', False)
+    def test_dispatch_without_instance(self):
+        Cat(name='tom', id=1).put()
+        views = []
+
+        def dispatch_request(self, key):
+            views.append(self)
+            return 'cat'
+
+        with mock.patch.object(CatEdit, 'dispatch_request', dispatch_request):
+            self.assertEqual(self.client.get('/animal-1/').data, 'cat')
+            self.assertEqual(self.client.get('/animal-1/').data, 'cat')
+
+        # Sub-views aren't shared between requests.
+        self.assertIsNot(views[0], views[1])
+
+    def test_dispatch_missing(self):
+        resp = self.client.get('/animal-1/')
+        self.assert404(resp)
+
+    @mock.patch.object(DogCreate, '_form_logic', return_value='dog')
+    def test_picker(self, form_logic):
+        resp = self.client.get('/animal/new/?class=Dog')
+        self.assert200(resp)
+        self.assertEqual(resp.data, 'dog')
+
+        resp = self.client.get('/animal/new/')
+        self.assert200(resp)
+        self.assertTemplateUsed('kibble/polymodel/picker.html')
+
+
+class PolyTableTestCase(TestCase):
+    def create_app(self):
+        return self._create_app(AnimalList)
+
+    def test_columns(self):
+        Dog(name='rex', breed='lab', id=1).put()
+        Cat(name='tom', id=2).put()
+
+        table = kibble_list.PolyTable(
+            AnimalList(), Animal.query().order(Animal.name), {})
+
+        self.assertEqual(table.headers, [
+            ('name', 'Name'),
+            ('breed', 'Breed'),
+            ('lives', 'Lives'),
+        ])
+        self.assertEqual([columns for instance, columns in table], [
+            ['rex', 'lab', None],
+            ['tom', None, 9],
+        ])
+
+    def test_polymodel_filter(self):
+        f = qf.PolymodelFilter(Animal)
+
+        with self.app.test_request_context('/'):
+            flask.g.kibble = self.kibble
+            choices = f.choices
+            self.assertEqual(choices, [('Cat', 'Cat'), ('Dog', 'Dog')])
+            self.assertIs(f.choices, choices)
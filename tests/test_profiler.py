@@ -0,0 +1,58 @@
+from .base import TestCase
+from .models import TestModel
+
+import flask_kibble as kibble
+from flask_kibble import profiler
+
+
+class TestList(kibble.List):
+    model = TestModel
+
+
+class RpcProfileTestCase(TestCase):
+    def create_app(self):
+        return self._create_app()
+
+    def test_by_service(self):
+        profile = profiler.start()
+        TestModel(name='a').put()
+        TestModel(name='b').put()
+        profile = profiler.stop()
+
+        self.assertIsNone(profiler.current_profile())
+
+        count, duration = profile.by_service()['datastore_v3']
+        self.assertEqual(count, 2)
+        self.assertEqual(
+            [r.kind for r in profile if r.call == 'Put'],
+            ['TestModel', 'TestModel'])
+        self.assertEqual(
+            [r.batch_size for r in profile if r.call == 'Put'], [1, 1])
+
+    def test_server_timing(self):
+        profile = profiler.RpcProfile()
+        record = profiler.RpcRecord('memcache', 'Get')
+        record.duration = 0.0125
+        profile.records.append(record)
+
+        self.assertEqual(profile.server_timing(),
+                         'memcache;dur=12.5;desc="1 calls"')
+
+
+class ProfiledRequestTestCase(TestCase):
+    def create_app(self):
+        app = self._create_app(TestList)
+        app.config['KIBBLE_PROFILE_RPCS'] = True
+        return app
+
+    def test_server_timing_header(self):
+        resp = self.client.get('/testmodel/')
+        self.assert200(resp)
+        self.assertIn('datastore_v3;dur=', resp.headers['Server-Timing'])
+        self.assertIsNone(profiler.current_profile())
+
+    def test_disabled(self):
+        self.app.config['KIBBLE_PROFILE_RPCS'] = False
+        resp = self.client.get('/testmodel/')
+        self.assert200(resp)
+        self.assertNotIn('Server-Timing', resp.headers)
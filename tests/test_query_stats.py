@@ -0,0 +1,87 @@
+import flask
+from google.appengine.ext import ndb
+
+from .base import TestCase
+from .models import TestModel
+
+import flask_kibble as kibble
+from flask_kibble import list as kibble_list
+from flask_kibble.util.query_stats import query_shape, QueryStats
+
+
+class StatsList(kibble.List):
+    model = TestModel
+    list_display = ('name',)
+
+
+class QueryShapeTestCase(TestCase):
+    def create_app(self):
+        return self._create_app(StatsList)
+
+    def test_shape(self):
+        query = TestModel.query(
+            TestModel.name == 'a',
+            TestModel.other_field_1 > 'b',
+            ancestor=ndb.Key('TestModel', 1)).order(-TestModel.other_field_1)
+
+        shape = query_shape(query, limit=20, offset=40)
+        self.assertEqual(shape.kind, 'TestModel')
+        self.assertTrue(shape.ancestor)
+        self.assertEqual(shape.equality, ('name',))
+        self.assertEqual(shape.inequality, (('other_field_1', '>'),))
+        self.assertEqual(shape.orders, (('other_field_1', '-'),))
+        self.assertEqual(shape.limit, '<=100')
+        self.assertEqual(shape.offset, '<=100')
+
+    def test_values_ignored(self):
+        self.assertEqual(
+            query_shape(TestModel.query(TestModel.name == 'a')),
+            query_shape(TestModel.query(TestModel.name == 'b')))
+
+    def test_table_records(self):
+        TestModel(name='a').put()
+        flask.g.kibble = self.kibble
+
+        table = kibble_list.Table(
+            StatsList(), TestModel.query(), {'limit': 5, 'offset': 0})
+        self.assertEqual(table.row_count, 1)
+
+        stats, = self.kibble.query_stats.report()
+        self.assertEqual(stats.shape.kind, 'TestModel')
+        self.assertEqual(stats.shape.limit, '<=10')
+        self.assertEqual(stats.count, 1)
+        self.assertEqual(stats.max_results, 1)
+
+    def test_report_page(self):
+        resp = self.client.get('/_stats/queries/')
+        self.assert200(resp)
+        self.assertTemplateUsed('kibble/query_stats.html')
+        self.authenticator.has_permission_for.assert_called_once_with(
+            None, 'kibble.query_stats')
+
+
+class QueryStatsTestCase(TestCase):
+    def create_app(self):
+        return self._create_app()
+
+    def test_aggregate(self):
+        stats = QueryStats(flush_interval=None)
+        shape = query_shape(TestModel.query())
+        stats.record(shape, 0.1, 10)
+        stats.record(shape, 0.3, 20)
+
+        s, = stats.report()
+        self.assertEqual(s.count, 2)
+        self.assertAlmostEqual(s.mean_time, 0.2)
+        self.assertAlmostEqual(s.max_time, 0.3)
+        self.assertEqual(s.mean_results, 15)
+
+    def test_bounded(self):
+        stats = QueryStats(max_shapes=2, flush_interval=None)
+        for limit in (1, 10, 100):
+            stats.record(query_shape(TestModel.query(), limit=limit), 0.1, 1)
+
+        self.assertEqual(len(stats), 2)
+        self.assertEqual(
+            sorted(s.shape.limit for s in stats.report()),
+            ['<=10', '<=100'])
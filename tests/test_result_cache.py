@@ -0,0 +1,65 @@
+from werkzeug.datastructures import MultiDict
+
+from .base import TestCase
+from .models import TestModel
+
+import flask_kibble as kibble
+from flask_kibble.util import changes
+
+
+class CachedList(kibble.List):
+    model = TestModel
+    list_display = ('name',)
+    cache_results = True
+
+
+class CachedEdit(kibble.Edit):
+    model = TestModel
+
+
+class ResultCacheTestCase(TestCase):
+    render_templates = True
+
+    def create_app(self):
+        app = self._create_app(CachedList, CachedEdit)
+        self.authenticator.permission_fingerprint = lambda: 'all'
+        return app
+
+    def setUp(self):
+        self.instance = TestModel(name='a', id='a')
+        self.instance.put()
+        TestModel(name='b').put()
+
+    def test_cached_page(self):
+        self.assert200(self.client.get('/testmodel/'))
+        table = self.get_context_variable('table')
+        self.assertFalse(table.cached)
+
+        # Only the cached entities are fetched.
+        with self.assertRpcBudget(rpcs=1, reads=2):
+            self.assert200(self.client.get('/testmodel/'))
+        table = self.get_context_variable('table')
+        self.assertTrue(table.cached)
+        self.assertEqual(table.row_count, 2)
+        self.assertEqual(self.get_context_variable('paginator').total_objects,
+                         2)
+
+        # Different arguments are a different page.
+        self.assert200(self.client.get('/testmodel/?page-size=1'))
+        self.assertFalse(self.get_context_variable('table').cached)
+
+    def test_invalidated_by_action(self):
+        self.assert200(self.client.get('/testmodel/'))
+
+        resp = self.client.post('/testmodel-a/',
+                                data=MultiDict({'name': 'renamed'}))
+        self.assertStatus(resp, 302)
+
+        self.assert200(self.client.get('/testmodel/'))
+        self.assertFalse(self.get_context_variable('table').cached)
+
+    def test_generations(self):
+        before = changes.kind_generations.get('TestModel')
+        changes.kind_generations.bump('TestModel')
+        after = changes.kind_generations.get('TestModel')
+        self.assertEqual(after['TestModel'], before['TestModel'] + 1)
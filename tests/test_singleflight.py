@@ -0,0 +1,110 @@
+import time
+import threading
+
+import mock
+from google.appengine.api import memcache
+
+from .base import TestCase
+from .models import TestModel
+
+import flask_kibble as kibble
+from flask_kibble.util.singleflight import SingleFlight
+from flask_kibble.util.changes import entity_changed
+
+
+class CoalescedList(kibble.List):
+    model = TestModel
+    list_display = ('name',)
+    coalesce_queries = True
+
+
+class SingleFlightTestCase(TestCase):
+    def create_app(self):
+        return self._create_app(CoalescedList)
+
+    def test_coalesce_threads(self):
+        flight = SingleFlight(wait=5)
+        started = threading.Event()
+        release = threading.Event()
+
+        def _leader():
+            started.set()
+            release.wait(5)
+            return 'result'
+
+        results = []
+        leader = threading.Thread(
+            target=lambda: results.append(flight.do('k', _leader)))
+        leader.start()
+        started.wait(5)
+
+        follower_fn = mock.Mock(return_value='other')
+        follower = threading.Thread(
+            target=lambda: results.append(flight.do('k', follower_fn)))
+        follower.start()
+
+        # Give the follower time to find the call in flight.
+        time.sleep(0.1)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+
+        self.assertEqual(results, ['result', 'result'])
+        self.assertFalse(follower_fn.called)
+
+    def test_leader_error(self):
+        flight = SingleFlight()
+        fn = mock.Mock(side_effect=ValueError)
+        self.assertRaises(ValueError, flight.do, 'k', fn)
+
+        # Nothing is left in flight.
+        self.assertEqual(flight.do('k', lambda: 'ok'), 'ok')
+
+    def test_memcache_lease(self):
+        flight = SingleFlight('test-flights', wait=1.0, poll=0.01)
+        memcache.add('lease:k', 1, namespace='test-flights')
+        threading.Timer(
+            0.05, memcache.set, ('k', 'published'),
+            {'namespace': 'test-flights'}).start()
+
+        fn = mock.Mock(return_value='local')
+        self.assertEqual(flight.do('k', fn), 'published')
+        self.assertFalse(fn.called)
+
+    def test_memcache_lease_timeout(self):
+        flight = SingleFlight('test-flights', wait=0.05, poll=0.01)
+        memcache.add('lease:k', 1, namespace='test-flights')
+
+        self.assertEqual(flight.do('k', lambda: 'local'), 'local')
+
+    def test_memcache_publish(self):
+        flight = SingleFlight('test-flights')
+        self.assertEqual(flight.do('k', lambda: 'first'), 'first')
+        self.assertEqual(flight.do('k', lambda: 'second'), 'first')
+        self.assertIsNone(memcache.get('lease:k', namespace='test-flights'))
+
+    def test_list(self):
+        TestModel(name='a').put()
+        TestModel(name='b').put()
+
+        resp = self.client.get('/testmodel/')
+        self.assert200(resp)
+
+        table = self.get_context_variable('table')
+        self.assertTrue(table.cached)
+        self.assertEqual(sorted(i.name for i, _ in table), ['a', 'b'])
+        self.assertEqual(
+            self.get_context_variable('paginator').total_objects, 2)
+
+    def test_list_after_write(self):
+        TestModel(name='a').put()
+        self.client.get('/testmodel/')
+
+        # Saving through Kibble moves the shared result on.
+        key = TestModel(name='b').put()
+        with self.app.test_request_context('/'):
+            entity_changed(key)
+
+        self.client.get('/testmodel/')
+        table = self.get_context_variable('table')
+        self.assertEqual(sorted(i.name for i, _ in table), ['a', 'b'])
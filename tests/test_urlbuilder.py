@@ -0,0 +1,59 @@
+import flask
+
+from .base import TestCase
+from .models import TestModel
+
+import flask_kibble as kibble
+
+
+class TestList(kibble.List):
+    model = TestModel
+
+
+class TestAncestorList(kibble.List):
+    model = TestModel
+    ancestors = [TestModel]
+    action = 'child_list'
+
+
+class TestEdit(kibble.Edit):
+    model = TestModel
+
+
+class UrlBuilderTestCase(TestCase):
+    def create_app(self):
+        return self._create_app(TestList, TestAncestorList, TestEdit)
+
+    def assertParity(self, view_cls, **values):
+        builder = self.kibble.url_builders[view_cls.view_name()]
+        self.assertEqual(
+            builder.build(**values),
+            flask.url_for('kibble.' + view_cls.view_name(), **values))
+
+    def test_list(self):
+        self.assertParity(TestList, key=None, ancestor_key=None)
+        self.assertParity(TestList, page=1)
+        self.assertParity(TestList, page=3)
+        self.assertParity(TestList, page=3, _popup=1, sort='-name')
+
+    def test_ancestor_list(self):
+        parent = TestModel(name='parent', id=10).put()
+        self.assertParity(TestAncestorList, ancestor_key=parent)
+        self.assertParity(TestAncestorList, ancestor_key=parent, page=2)
+
+    def test_edit(self):
+        key = TestModel(name='test', id=1).put()
+        self.assertParity(TestEdit, key=key)
+        self.assertParity(TestEdit, key=key, _popup=1)
+        self.assertParity(TestEdit, key=TestModel(name='str', id='a b').put())
+
+    def test_unsupported(self):
+        builder = self.kibble.url_builders[TestList.view_name()]
+        self.assertIsNone(builder.build(_external=True))
+        self.assertIsNone(builder.build(_anchor='top'))
+
+    def test_view_url_for(self):
+        key = TestModel(name='test', id=1).put()
+        self.assertEqual(
+            TestEdit.url_for(key, blueprint='kibble'),
+            flask.url_for('kibble.testmodel_edit', key=key))
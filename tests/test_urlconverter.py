@@ -3,6 +3,7 @@ import flask
 
 from .base import TestCase
 
+from google.appengine.api import namespace_manager
 from google.appengine.ext import ndb
 
 from flask_kibble.util.url_converter import NDBKeyConverter
@@ -148,3 +149,48 @@ class NDBConverterTestCase(TestCase):
             resp = self.client.get('/nu/%s/' % url)
             self.assert404(resp)
 
+    def test_round_trip(self):
+        """
+        Test keys survive a url round trip, preserving int vs string ids.
+        """
+        converter = NDBKeyConverter(
+            self.app.url_map, 'UrlTestModel', 'UrlTestModel2')
+
+        keys = [
+            ndb.Key('UrlTestModel', 1, 'UrlTestModel2', 2),
+            ndb.Key('UrlTestModel', 'a', 'UrlTestModel2', 'b'),
+            ndb.Key('UrlTestModel', 'a', 'UrlTestModel2', 3),
+        ]
+
+        for key in keys:
+            url = converter.to_url(key)
+            self.assertEqual(converter.to_python(url), key)
+            # Again, from the cache.
+            self.assertEqual(converter.to_url(key), url)
+            self.assertEqual(converter.to_python(url), key)
+
+        self.assertEqual(
+            converter.to_url(keys[1]),
+            'urltestmodel-a/urltestmodel2-b')
+
+    def test_to_urls(self):
+        converter = NDBKeyConverter(self.app.url_map, 'UrlTestModel')
+        keys = [ndb.Key('UrlTestModel', i) for i in (1, 'two', 3)]
+
+        self.assertEqual(
+            converter.to_urls(keys),
+            ['urltestmodel-1', 'urltestmodel-two', 'urltestmodel-3'])
+
+    def test_shared_codec(self):
+        c1 = NDBKeyConverter(self.app.url_map, 'UrlTestModel')
+        c2 = NDBKeyConverter(self.app.url_map, 'UrlTestModel')
+        self.assertIs(c1._codec, c2._codec)
+
+    def test_decode_namespace(self):
+        converter = NDBKeyConverter(self.app.url_map, 'UrlTestModel')
+        self.assertEqual(converter.to_python('urltestmodel-1').namespace(), '')
+
+        namespace_manager.set_namespace('other')
+        self.addCleanup(namespace_manager.set_namespace, '')
+        self.assertEqual(converter.to_python('urltestmodel-1'),
+                         ndb.Key('UrlTestModel', 1, namespace='other'))
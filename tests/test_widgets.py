@@ -0,0 +1,76 @@
+from base64 import b64encode, b64decode
+
+import mock
+import wtforms
+from google.appengine.ext import ndb
+
+from .base import TestCase
+
+from flask_kibble.util import widgets
+from flask_kibble.util.cache import LRUCache
+from flask_kibble.util.fields import BlobKeyField
+from flask_kibble.util.forms import KibbleModelConverter
+
+
+class Item(ndb.Model):
+    value = ndb.StringProperty()
+
+
+class Order(ndb.Model):
+    items = ndb.StructuredProperty(Item, repeated=True)
+
+
+class TabularFormListWidgetTestCase(TestCase):
+    render_templates = True
+
+    def create_app(self):
+        return self._create_app()
+
+    def setUp(self):
+        patcher = mock.patch.object(
+            widgets.TabluarFormListWidget, '_empty_templates', LRUCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def render(self):
+        # A new form class each time, as for generated forms.
+        formcls = KibbleModelConverter().model_form(Order)
+        form = formcls(obj=Order(items=[Item(value='a')]))
+        with self.app.test_request_context('/'):
+            return form['items']()
+
+    @mock.patch.object(widgets.TabluarFormListWidget, 'cache_time', 300)
+    def test_empty_template_cached(self):
+        with mock.patch.object(widgets, 'b64encode',
+                               wraps=b64encode) as encode:
+            first = self.render()
+            second = self.render()
+
+        self.assertEqual(first, second)
+        self.assertEqual(encode.call_count, 1)
+        self.assertIn('items-0-value', first)
+
+        template = first.split('data-template="')[1].split('"')[0]
+        self.assertIn('items-{{ row_count }}-value', b64decode(template))
+
+    def test_cache_disabled(self):
+        # Caching is off by default.
+        with mock.patch.object(widgets, 'b64encode',
+                               wraps=b64encode) as encode:
+            self.render()
+            self.render()
+
+        self.assertEqual(encode.call_count, 2)
+
+    @mock.patch.object(widgets.TabluarFormListWidget, 'cache_time', 300)
+    def test_uncacheable(self):
+        widget = widgets.TabluarFormListWidget()
+
+        class Inner(wtforms.Form):
+            value = wtforms.StringField()
+
+        class Upload(Inner):
+            blob = BlobKeyField()
+
+        self.assertTrue(widget._cacheable(Inner()))
+        self.assertFalse(widget._cacheable(Upload()))